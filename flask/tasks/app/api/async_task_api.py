@@ -0,0 +1,105 @@
+"""
+async_task_api.py
+
+The task API routes from task_api.py for the ASGI app (asgi_app.py).
+The urls, query strings and JSON are the same, only the database work is awaited.
+Streaming (?stream=) and the query cache are only available in the WSGI app.
+The AsyncTaskDB for each request is created by asgi_app.py:before.
+"""
+from datetime import datetime, timezone
+
+from quart import g, request, jsonify, Blueprint, Response
+
+from models.task import Task
+from api.task_api import TaskListQuery, is_not_modified, add_version_headers
+
+async_task_api_blueprint = Blueprint("async_task_api_blueprint", __name__)
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/', defaults={'task_id': None}, methods=["GET"])
+@async_task_api_blueprint.route('/api/v1/tasks/<int:task_id>/', methods=["GET"])
+async def get_tasks(task_id):
+    args = request.args
+    taskdb = g.task_db
+
+    version = await taskdb.select_tasks_version()
+    etag = f"tasks-{version['version']}"
+    last_modified = datetime.fromtimestamp(int(version['updated_at']), timezone.utc)
+
+    if is_not_modified(request, etag, last_modified):
+        return add_version_headers(Response("", status=304), etag, last_modified)
+
+    if task_id is None:
+        # Same query string and JSON as the WSGI app, see task_api.py:TaskListQuery
+        if 'stream' in args:
+            return jsonify({"status": "error: stream is only available in the WSGI app"}), 400
+        try:
+            task_list = TaskListQuery(args)
+        except ValueError as error:
+            return jsonify({"status": f"error: {error}"}), 400
+
+        body = task_list.body(await task_list.run(taskdb))
+
+    else:
+        body = {"status": "success", "tasks": await taskdb.select_task_by_id(task_id)}
+
+    return add_version_headers(jsonify(body), etag, last_modified), 200
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/', methods=["POST"])
+async def add_task():
+    taskdb = g.task_db
+
+    data = await request.get_json()
+    result = await taskdb.insert_task(Task(data['description']))
+
+    return jsonify({"status": "success", "id": result['task_id']}), 200
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/<int:task_id>/', methods=["PUT"])
+async def update_task(task_id):
+    taskdb = g.task_db
+
+    data = await request.get_json()
+    await taskdb.update_task(task_id, Task(data['description']))
+
+    return jsonify({"status": "success", "id": task_id}), 200
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/<int:task_id>/', methods=["DELETE"])
+async def delete_task(task_id):
+    taskdb = g.task_db
+
+    await taskdb.delete_task_by_id(task_id)
+
+    return jsonify({"status": "success", "id": task_id}), 200
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/bulk/', methods=["POST"])
+async def add_tasks():
+    taskdb = g.task_db
+
+    data = await request.get_json()
+    task_ids = await taskdb.insert_tasks([Task(item['description']) for item in data['tasks']])
+
+    return jsonify({"status": "success", "ids": task_ids}), 200
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/bulk/', methods=["PUT"])
+async def update_tasks():
+    taskdb = g.task_db
+
+    data = await request.get_json()
+    updated = await taskdb.update_tasks([(item['id'], Task(item['description'])) for item in data['tasks']])
+
+    return jsonify({"status": "success", "updated": updated}), 200
+
+
+@async_task_api_blueprint.route('/api/v1/tasks/bulk/', methods=["DELETE"])
+async def delete_tasks():
+    taskdb = g.task_db
+
+    data = await request.get_json()
+    deleted = await taskdb.delete_tasks(data['ids'])
+
+    return jsonify({"status": "success", "deleted": deleted}), 200
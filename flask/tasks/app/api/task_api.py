@@ -4,14 +4,268 @@ task_api.py
 Routes for the API and logic for managing Tasks.
 """
 
-from flask import g, request, jsonify, Blueprint
+import base64
+import json
+import time
+from datetime import datetime, timezone
 
-from models.task import Task, TaskDB
+from flask import g, request, jsonify, Blueprint, Response, current_app, stream_with_context
+
+from models.task import Task, TASK_COLUMNS, SORT_COLUMNS, SEARCH_MODES
+from utils.write_behind import QueueClosedError, QueueFullError, WriteFailedError, WriteTimeoutError
 
 # Establish the blueprint to link it to the flask app file (main_app.py)
 #   Need to do this before you create your routes
 task_api_blueprint = Blueprint("task_api_blueprint", __name__)
 
+# Page size used when ?limit= is not supplied and the largest page a client may request
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+# The next-page token is the id of the last task on the page, base64 encoded so
+#   clients treat it as an opaque value and simply hand it back to us.
+#   With any other sort (?sort=, including -id) the token also holds the sort it
+#   belongs to and, for other columns, that column's value for the last task.
+#   The pages of a search also keep the kind of search the first page used
+#   (search_mode, see TaskDB.search_tasks_page).
+def encode_page_token(task, sort="id", search_mode=None):
+    token = {"after_id": task["id"]}
+    if search_mode is not None:
+        token["search"] = search_mode
+    if sort != "id":
+        token["sort"] = sort
+    column = sort.lstrip("-")
+    if column != "id":
+        value = task[column]
+        token["after"] = value.isoformat() if isinstance(value, datetime) else value
+    return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+# Returns the position after which the next page starts as keyword arguments for
+#   TaskDB.select_tasks() (after_id and after_value) and, for a search,
+#   search_mode. Returns None when the token is invalid or was made for a different sort.
+def decode_page_token(token, sort="id"):
+    try:
+        token = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if token.get("sort", "id") != sort or token.get("search", "fulltext") not in SEARCH_MODES:
+            return None
+        position = {"after_id": int(token["after_id"])}
+        if "search" in token:
+            position["search_mode"] = token["search"]
+        if sort.lstrip("-") == "creation_datetime":
+            position["after_value"] = datetime.fromisoformat(token["after"])
+        return position
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+# Where the requested page starts, from ?page_token= or (for the id order) ?after_id=.
+#   Returns {} for the first page and None when the request is invalid.
+def page_start(args, sort="id"):
+    if 'page_token' in args:
+        return decode_page_token(args['page_token'], sort)
+    if 'after_id' in args:
+        after_id = args.get('after_id', type=int)
+        if after_id is None or sort != "id":
+            return None
+        return {"after_id": after_id}
+    return {}
+
+
+# Turns an ISO 8601 date from the query string into a datetime to compare with
+#   creation_datetime. Datetimes are stored and returned as UTC, so a date with
+#   a time zone is converted to UTC first.
+def parse_datetime(text):
+    value = datetime.fromisoformat(text)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# Query string options that filter, sort and choose the columns of the task list.
+#   Returns the keyword arguments for TaskDB.select_tasks() and search_tasks(), and
+#   raises ValueError with a message for the client when an option is invalid.
+#   * ?completed=1 (or 0) - only completed (or not completed) tasks
+#   * ?created_after=2022-04-21&created_before=2022-04-22T12:00:00 - creation date range
+#   * ?sort=creation_datetime (or -creation_datetime for newest first), also id / -id
+#   * ?fields=id,description - only return these columns
+def parse_list_options(args):
+    options = {}
+
+    if 'completed' in args:
+        completed = args['completed'].lower()
+        if completed not in ("0", "1", "true", "false"):
+            raise ValueError("completed must be 1 or 0")
+        options["completed"] = completed in ("1", "true")
+
+    for name in ("created_after", "created_before"):
+        if name in args:
+            try:
+                options[name] = parse_datetime(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO 8601 date like 2022-04-21 or 2022-04-21T11:10:53") from None
+
+    if 'sort' in args:
+        column = args['sort'].lstrip("-")
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_COLUMNS)} (with a - in front for descending order)")
+        options["sort"] = column
+        options["descending"] = args['sort'].startswith("-")
+
+    if 'fields' in args:
+        fields = tuple(dict.fromkeys(field.strip() for field in args['fields'].split(",") if field.strip()))
+        if not fields or any(field not in TASK_COLUMNS for field in fields):
+            raise ValueError(f"fields must be a comma separated list of {', '.join(TASK_COLUMNS)}")
+        options["fields"] = fields
+
+    return options
+
+
+# Paging needs the id and the sort column of every task to build the next page
+#   token, so they are added to the requested fields. Returns the fields that
+#   were added, to be removed again with remove_fields().
+def add_paging_fields(options, sort_column):
+    fields = options.get("fields")
+    if fields is None:
+        return ()
+    added = tuple(field for field in dict.fromkeys(("id", sort_column)) if field not in fields)
+    options["fields"] = fields + added
+    return added
+
+
+def remove_fields(tasks, fields):
+    if not fields:
+        return tasks
+    return [{key: value for key, value in task.items() if key not in fields} for task in tasks]
+
+
+# The task list part of get_tasks: which tasks the query string asks for, how
+#   to read them and the JSON body to answer with. The ASGI app (async_task_api.py)
+#   uses it too, so both apps read the query string and answer the same way.
+#   Raises ValueError with a message for the client when the request is invalid.
+#   run() calls the TaskDB method that reads the tasks and returns its result.
+#   AsyncTaskDB has the same methods, so the ASGI app awaits what run() returns
+#   and hands the tasks to body() in the same way.
+class TaskListQuery:
+    def __init__(self, args):
+        # Filters, sort order and fields are handed to the database so only
+        #   the rows and columns the client asked for are read and sent
+        self.options = parse_list_options(args)
+        self.search = args.get('search')
+        self.paged = 'limit' in args or 'after_id' in args or 'page_token' in args
+        self.added_fields = ()
+
+        if self.paged:
+            self.limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+            self.sort = args.get('sort', 'id')
+            self.start = page_start(args, self.sort)
+
+            if self.start is None or not 1 <= self.limit <= MAX_PAGE_SIZE:
+                raise ValueError("invalid page_token or limit")
+
+            # The pages of a search keep the kind of search of the first page
+            self.search_mode = self.start.pop("search_mode", None)
+            if self.search is not None or self.options:
+                self.added_fields = add_paging_fields(self.options, self.sort.lstrip("-"))
+
+    def run(self, taskdb):
+        if self.paged:
+            # Ask for one extra row to find out if there is another page.
+            #   Searches are paged too, in the id (or ?sort=) order.
+            if self.search is not None:
+                return taskdb.search_tasks_page(
+                    self.search, self.search_mode, limit=self.limit + 1, **self.start, **self.options
+                )
+            if self.options:
+                return taskdb.select_tasks(limit=self.limit + 1, **self.start, **self.options)
+            return taskdb.select_tasks_page(self.start.get("after_id", 0), self.limit + 1)
+
+        # All tasks matching the query string "search"
+        if self.search is not None:
+            return taskdb.search_tasks(self.search, **self.options)
+        if self.options:
+            return taskdb.select_tasks(**self.options)
+        return taskdb.select_all_tasks()
+
+    def body(self, result):
+        body = {"status": "success"}
+
+        if self.paged:
+            search_mode = None
+            if self.search is not None:
+                search_mode, result = result
+
+            next_page_token = None
+            if len(result) > self.limit:
+                result = result[:self.limit]
+                next_page_token = encode_page_token(result[-1], self.sort, search_mode)
+
+            result = remove_fields(result, self.added_fields)
+            body["next_page_token"] = next_page_token
+
+        body["tasks"] = result
+        return body
+
+
+# Conditional GET support: a client that sends back the ETag (If-None-Match) or
+#   Last-Modified date (If-Modified-Since) from an earlier response only needs the
+#   tasks again if they changed since then. If-None-Match wins when both are sent.
+#   Last-Modified only has one second precision, so clients should prefer the ETag.
+#   The request is passed in so the ASGI app (asgi_app.py) can share this code.
+def is_not_modified(req, etag, last_modified):
+    if req.if_none_match:
+        return req.if_none_match.contains_weak(etag)
+    if req.if_modified_since:
+        return last_modified <= req.if_modified_since
+    return False
+
+
+def add_version_headers(response, etag, last_modified):
+    # Weak ETag: the same tasks always mean the same data, not byte-for-byte the same JSON
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    # Ask clients to check with us (cheaply) before reusing what they have
+    response.cache_control.no_cache = True
+    return response
+
+
+# Generators that turn tasks into chunks of a streamed response.
+#   Each chunk is sent to the client as soon as it is ready.
+def stream_ndjson(tasks):
+    for task in tasks:
+        yield current_app.json.dumps(task) + "\n"
+
+
+def stream_json(tasks):
+    yield '{"status": "success", "tasks": ['
+    separator = ""
+    for task in tasks:
+        yield separator + current_app.json.dumps(task)
+        separator = ", "
+    yield "]}"
+
+
+STREAM_MIMETYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+# ?stream=ndjson or ?stream=json: every task (that matches the filters in
+#   options) sent as it is read. The tasks are read in the same transaction as
+#   the tasks version, so the ETag describes exactly the tasks that are sent.
+#   Searches and pages are not streamed, ask for those without ?stream=.
+def stream_tasks_response(args, taskdb, options, etag, last_modified):
+    if args['stream'] not in STREAM_MIMETYPES:
+        return jsonify({"status": "error: stream must be ndjson or json"}), 400
+    if any(name in args for name in ('search', 'limit', 'after_id', 'page_token')):
+        return jsonify({"status": "error: stream cannot be combined with search, limit, after_id or page_token"}), 400
+
+    # stream_with_context keeps the request (and its pooled database
+    #   connection) alive until the last chunk has been sent
+    tasks = taskdb.iter_all_tasks(**options)
+    chunks = stream_ndjson(tasks) if args['stream'] == 'ndjson' else stream_json(tasks)
+    response = Response(stream_with_context(chunks), mimetype=STREAM_MIMETYPES[args['stream']])
+    return add_version_headers(response, etag, last_modified)
+
 
 # Define routes for the API
 #   Note that we can stack the decorators to associate similar routes to the same function.
@@ -24,59 +278,110 @@ def get_tasks(task_id):
     get_tasks can take urls in a variety of forms:
         * /api/v1/task/ - get all tasks
         * /api/v1/task/1 - get the task with id 1 (or any other valid id)
-        * /api/v1/task/?search="eggs" - find all tasks with the string "eggs" anywhere in the description
+        * /api/v1/task/?search="eggs" - find all tasks with a word starting with "eggs" in the
+            description, best matches first
             * The ? means we have a query string which is essentially a list of key, value pairs
                 where the ? indicates the start of the query string parameters and the pairs are separated
                 by ampersands like so:
                 ?id=10&name=Sarah&job=developer
             * The query string is optional 
+        * /api/v1/task/?limit=50 - get the first 50 tasks ordered by id, the response
+            includes a next_page_token when more tasks are available
+        * /api/v1/task/?limit=50&page_token=... (or &after_id=10) - get the next page
+        * /api/v1/task/?completed=0&sort=-creation_datetime&fields=id,description - filter,
+            sort and choose the columns of the tasks (see parse_list_options), these can be
+            combined with search and paging
+        * /api/v1/task/?stream=ndjson - stream every task as one JSON object per line
+        * /api/v1/task/?stream=json - stream every task as a single JSON document,
+            both can be combined with the options of parse_list_options (not with
+            search or paging)
     """
 
     # To access a query string, we need to get the arguments from our web request object
     args = request.args
     
-    # setup the TaskDB object with the mysql connection and cursor objects
-    taskdb = TaskDB(g.mysql_db, g.mysql_cursor)
+    # the TaskDB object for this request (created by main_app.py:connect_db)
+    taskdb = g.task_db
+
+    # The tasks version changes every time a task is added, updated or deleted.
+    #   If the client already has the current version there is no need to
+    #   query or send the tasks again, a 304 Not Modified response is enough.
+    version = taskdb.select_tasks_version()
+    etag = f"tasks-{version['version']}"
+    last_modified = datetime.fromtimestamp(int(version['updated_at']), timezone.utc)
+
+    if is_not_modified(request, etag, last_modified):
+        return add_version_headers(Response(status=304), etag, last_modified)
 
-    result = None
-    
     # If an ID for the task is not supplied then we are either returning all
     #   tasks or any tasks that match the search query string.
     if task_id is None:
-        # Logic to find all or multiple tasks
+        # Logic to find all or multiple tasks, the query string is read by TaskListQuery
+        try:
+            task_list = TaskListQuery(args)
+        except ValueError as error:
+            return jsonify({"status": f"error: {error}"}), 400
 
-        # Since the args for the query string are in the form of a dictionary, we can
-        #   simply check if the key is in the dictionary. If not, the web request simply
-        #   did not supply this information.
-        if not 'search' in args:
-            result = taskdb.select_all_tasks()
-        # All tasks matching the query string "search"
-        else:
-            result = taskdb.select_all_tasks_by_description(args['search'])
+        if 'stream' in args:
+            return stream_tasks_response(args, taskdb, task_list.options, etag, last_modified)
+
+        body = task_list.body(task_list.run(taskdb))
     
     else:
         # Logic to request a specific task
         # We get a specific tasks based on the provided task ID
-        result = taskdb.select_task_by_id(task_id)
+        body = {"status": "success", "tasks": taskdb.select_task_by_id(task_id)}
 
     # Sending a response of JSON including a human readable status message,
     #   list of the tasks found, and a HTTP status code (200 OK).
-    return jsonify({"status": "success", "tasks": result}), 200
+    return add_version_headers(jsonify(body), etag, last_modified), 200
 
 
 @task_api_blueprint.route('/api/v1/tasks/', methods=["POST"])
 def add_task():
-    taskdb = TaskDB(g.mysql_db, g.mysql_cursor)
-        
     task = Task(request.json['description'])
+
+    # In write-behind mode the request has no connection of its own (see
+    #   main_app.py:uses_database), the queue's thread saves the task
+    if g.write_behind is not None:
+        return add_task_write_behind(task)
+
+    taskdb = g.task_db
     result = taskdb.insert_task(task)
     
     return jsonify({"status": "success", "id": result['task_id']}), 200
 
 
+# Write-behind mode (WRITE_BEHIND=1): queue the task to be saved with others
+#   and answer 202 Accepted right away. With ?durable=1 (or WRITE_BEHIND_DURABLE=1)
+#   we wait until the task is committed and answer 200 like the normal route.
+#   When the task cannot be queued or saved (or saving it takes longer than
+#   WRITE_BEHIND_DURABLE_TIMEOUT) the client is asked to try again with a 503.
+def add_task_write_behind(task):
+    durable = current_app.config["WRITE_BEHIND_DURABLE"] or request.args.get("durable") == "1"
+    try:
+        task_id = g.write_behind.submit(task, wait=durable, timeout=current_app.config["WRITE_BEHIND_DURABLE_TIMEOUT"])
+    except QueueClosedError:
+        return service_unavailable("The server is shutting down, try again shortly")
+    except QueueFullError:
+        return service_unavailable("Too many new tasks are waiting to be saved, try again shortly")
+    except WriteTimeoutError:
+        return service_unavailable("The task was queued but is not saved yet, check for it before sending it again")
+    except WriteFailedError:
+        return service_unavailable("The task could not be saved, try again shortly")
+
+    return jsonify({"status": "success", "id": task_id}), 200 if durable else 202
+
+
+def service_unavailable(message):
+    response = jsonify({"status": "error", "message": message})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
 @task_api_blueprint.route('/api/v1/tasks/<int:task_id>/', methods=["PUT"])
 def update_task(task_id):
-    taskdb = TaskDB(g.mysql_db, g.mysql_cursor)
+    taskdb = g.task_db
 
     task = Task(request.json['description'])
     taskdb.update_task(task_id, task)
@@ -86,8 +391,110 @@ def update_task(task_id):
 
 @task_api_blueprint.route('/api/v1/tasks/<int:task_id>/', methods=["DELETE"])
 def delete_task(task_id):
-    taskdb = TaskDB(g.mysql_db, g.mysql_cursor)
+    taskdb = g.task_db
 
     taskdb.delete_task_by_id(task_id)
         
     return jsonify({"status": "success", "id": task_id}), 200
+
+
+# Server-Sent Events: one long response that sends every change to the tasks as
+#   soon as it is committed (see utils/events.py), so clients no longer need to
+#   poll GET /api/v1/tasks/. Each event looks like
+#
+#       id: 3f2a9c1d-42
+#       event: created
+#       data: {"id": 7, "description": "Buy milk", "creation_datetime": ..., "completed": 0}
+#
+#   "updated" events carry the id and new description, "deleted" events just the id.
+#
+#   Browsers reconnect by themselves when a stream ends and send the id of the
+#   last event they received in the Last-Event-ID header, then we send the events
+#   they missed. When those are no longer in the log (or the server restarted) we
+#   send a "reset" event instead, and the client should fetch the full list again.
+#   Clients that cannot set headers may pass ?last_event_id= instead.
+@task_api_blueprint.route('/api/v1/tasks/stream', methods=["GET"])
+def stream_tasks():
+    events = g.task_events
+    # Each stream holds on to a server thread until it ends, so leave enough
+    #   threads for the other requests
+    if not events.open_stream():
+        return service_unavailable("Too many clients are listening for changes, try again shortly")
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    position = events.position(last_event_id)
+    reset = last_event_id is not None and position is None
+    if position is None:
+        position = events.last_position()
+
+    stream = stream_events(events, position, reset, current_app.json,
+                           current_app.config["TASK_STREAM_HEARTBEAT"], current_app.config["TASK_STREAM_TIMEOUT"])
+    response = Response(stream, mimetype="text/event-stream")
+    # The server closes the response once the stream ends, also when the
+    #   client went away before the first event was sent
+    response.call_on_close(events.close_stream)
+    response.cache_control.no_cache = True
+    # Ask proxies like nginx to pass each event on right away
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def format_event(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+# Generator for the stream. It does not need the request (or a database
+#   connection), so unlike the streamed task lists it is not wrapped in
+#   stream_with_context and the request is finished as soon as the stream starts.
+def stream_events(events, position, reset, json_provider, heartbeat, timeout):
+    # Browsers wait this many milliseconds before reconnecting
+    yield "retry: 1000\n\n"
+    if reset:
+        yield format_event(events.event_id(position), "reset", "{}")
+
+    deadline = time.monotonic() + timeout
+    while not events.closed and time.monotonic() < deadline:
+        new_events, complete = events.wait(position, min(heartbeat, deadline - time.monotonic()))
+        if not complete:
+            # This client fell too far behind for the log to catch it up
+            position = new_events[-1].id
+            yield format_event(events.event_id(position), "reset", "{}")
+        elif new_events:
+            for event in new_events:
+                yield format_event(events.event_id(event.id), event.kind, json_provider.dumps(event.data))
+            position = new_events[-1].id
+        else:
+            # A comment line keeps proxies from closing an idle stream, and
+            #   tells us when the client has gone away (the write fails)
+            yield ": keep-alive\n\n"
+
+
+# Bulk routes work on many tasks at once inside a single database transaction,
+#   so either every task in the request is saved or none of them are
+@task_api_blueprint.route('/api/v1/tasks/bulk/', methods=["POST"])
+def add_tasks():
+    taskdb = g.task_db
+
+    tasks = [Task(item['description']) for item in request.json['tasks']]
+    task_ids = taskdb.insert_tasks(tasks)
+
+    return jsonify({"status": "success", "ids": task_ids}), 200
+
+
+@task_api_blueprint.route('/api/v1/tasks/bulk/', methods=["PUT"])
+def update_tasks():
+    taskdb = g.task_db
+
+    updates = [(item['id'], Task(item['description'])) for item in request.json['tasks']]
+    updated = taskdb.update_tasks(updates)
+
+    return jsonify({"status": "success", "updated": updated}), 200
+
+
+@task_api_blueprint.route('/api/v1/tasks/bulk/', methods=["DELETE"])
+def delete_tasks():
+    taskdb = g.task_db
+
+    deleted = taskdb.delete_tasks(request.json['ids'])
+
+    return jsonify({"status": "success", "deleted": deleted}), 200
@@ -0,0 +1,91 @@
+"""
+asgi_app.py
+
+Async (ASGI) version of the tasks service. It serves the same routes as
+main_app.py, but with Quart (an async reimplementation of the Flask API) and
+aiomysql, so while one request waits on MySQL the worker can serve others.
+
+Run it from the app folder with an ASGI server such as hypercorn:
+
+    $ cd app
+    $ hypercorn asgi_app:app --bind localhost:8000
+
+The database is still created with `flask initdb` (see main_app.py).
+"""
+
+# Imports for all built-in python libraries
+import os
+import uuid
+
+# Imports all 3rd-party libraries
+import aiomysql
+from quart import Quart, g
+from dotenv import load_dotenv
+
+# Imports for blueprints and other modules written for the application
+from views.async_task_view import async_task_list_blueprint
+from api.async_task_api import async_task_api_blueprint
+from models.async_task import AsyncTaskDB
+import utils.fragments as FragmentUtils
+
+load_dotenv()
+
+app = Quart(__name__)
+
+# Same settings as main_app.py
+app.config["DATABASE"] = os.getenv("DATABASE")
+app.config["DBHOST"] = os.getenv("DBHOST")
+app.config["DBUSERNAME"] = os.getenv("DBUSERNAME")
+app.config["DBPASSWORD"] = os.getenv("DBPASSWORD")
+app.config["DBPOOL_SIZE"] = int(os.getenv("DBPOOL_SIZE", 5))
+app.config["DBPOOL_MAX_OVERFLOW"] = int(os.getenv("DBPOOL_MAX_OVERFLOW", 10))
+app.config["DBPOOL_IDLE_TIMEOUT"] = float(os.getenv("DBPOOL_IDLE_TIMEOUT", 300))
+app.config["TASKS_PER_PAGE"] = int(os.getenv("TASKS_PER_PAGE", 50))
+app.config["FRAGMENT_CACHE_MAX_ENTRIES"] = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", 10_000))
+app.config["FRAGMENT_CACHE_TTL"] = float(os.getenv("FRAGMENT_CACHE_TTL", 3600))
+app.config["SOFT_DELETE"] = os.getenv("SOFT_DELETE", "0") == "1"
+app.config["SECRET_KEY"] = uuid.uuid4().hex
+
+# Rendered task list rows, shared by every request (see utils/fragments.py)
+app.extensions["fragment_cache"] = FragmentUtils.create_fragment_cache(app.config)
+
+app.register_blueprint(async_task_list_blueprint)
+app.register_blueprint(async_task_api_blueprint)
+
+
+# The aiomysql pool is created once the server starts its event loop
+#   (connections belong to the loop they were opened on)
+@app.before_serving
+async def create_db_pool():
+    app.extensions["db_pool"] = await aiomysql.create_pool(
+        host=app.config["DBHOST"],
+        user=app.config["DBUSERNAME"],
+        password=app.config["DBPASSWORD"],
+        db=app.config["DATABASE"],
+        minsize=app.config["DBPOOL_SIZE"],
+        maxsize=app.config["DBPOOL_SIZE"] + app.config["DBPOOL_MAX_OVERFLOW"],
+        pool_recycle=app.config["DBPOOL_IDLE_TIMEOUT"]
+    )
+
+
+@app.after_serving
+async def close_db_pool():
+    pool = app.extensions.pop("db_pool")
+    pool.close()
+    await pool.wait_closed()
+
+
+# Borrow a connection for the request, same as main_app.py:before()
+@app.before_request
+async def before():
+    g.mysql_db = await app.extensions["db_pool"].acquire()
+    g.task_db = AsyncTaskDB(g.mysql_db, soft_delete=app.config["SOFT_DELETE"])
+
+
+@app.teardown_request
+async def after(exception):
+    conn = g.pop('mysql_db', None)
+    if conn is not None:
+        # Never hand the next request a half finished transaction
+        await conn.rollback()
+        app.extensions["db_pool"].release(conn)
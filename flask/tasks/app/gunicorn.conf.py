@@ -0,0 +1,102 @@
+"""
+gunicorn.conf.py
+
+Production settings for serving main_app.py with gunicorn. `flask run` is a
+single process development server; gunicorn starts a master process that forks
+several worker processes, each answering requests with a pool of threads.
+
+    $ gunicorn --config app/gunicorn.conf.py
+
+Run it from the project folder with your virtual environment activated. Any
+setting can be changed on the command line (like --workers 4) or with these
+optional .env / environment settings:
+
+    BIND = Address to listen on (default 127.0.0.1:8000)
+    WEB_CONCURRENCY = Number of worker processes (default: one per CPU)
+    WEB_THREADS = Requests each worker answers at the same time (default 8)
+    GRACEFUL_TIMEOUT = Seconds a stopping worker may take to finish its requests (default 30)
+
+The change stream (/api/v1/tasks/stream) is kept in each worker's memory: a
+client only hears about changes made through the worker it is connected to.
+When clients rely on the stream run a single worker (WEB_CONCURRENCY=1) with as
+many threads as needed. Each open stream holds one of its worker's threads, so
+only TASK_STREAM_MAX streams (half of WEB_THREADS by default) are kept open at
+once and the rest of the threads stay free for other requests.
+
+Stop the server with Ctrl+C or `kill -TERM <master pid>`: workers stop accepting
+requests, finish the ones in progress and save any queued tasks before exiting.
+"""
+import multiprocessing
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where main_app.py is, so gunicorn can be started from any folder
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "main_app:create_app()"
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+
+# Each worker keeps its own connection pool (DBPOOL_SIZE connections when idle),
+#   so workers * DBPOOL_SIZE must stay below MySQL's max_connections
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 8))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+# Runs in the master process once the workers are being started
+def when_ready(server):
+    if server.cfg.workers > 1:
+        server.log.warning("Running %d workers: change stream clients only see changes made through "
+                           "the worker they are connected to (set WEB_CONCURRENCY=1 if they need every change)",
+                           server.cfg.workers)
+
+
+# Import main_app (and everything it imports) and build the app once in the
+#   master process instead of once in every worker. Workers start faster and share
+#   the memory holding the loaded code. create_app() does not open connections or
+#   start threads, so nothing is shared between workers that should not be.
+preload_app = True
+
+
+# Runs in each worker after it has loaded the app and right before it starts
+#   accepting requests
+#   worker.wsgi is the app returned by create_app()
+def post_worker_init(worker):
+    import main_app
+
+    app = worker.wsgi
+    start = time.perf_counter()
+    try:
+        with app.app_context():
+            opened = main_app.warm_up()
+        worker.log.info("Worker %s opened %d database connections in %.0f ms",
+                        worker.pid, opened, (time.perf_counter() - start) * 1000)
+    except Exception:
+        # The pool opens connections on demand, so the worker can still serve
+        #   requests once the database is reachable
+        worker.log.exception("Worker %s could not warm up its connection pool", worker.pid)
+
+    # Change streams (/api/v1/tasks/stream) would keep a stopping worker busy until
+    #   GRACEFUL_TIMEOUT, so end them as soon as the worker is told to stop.
+    #   Their clients reconnect to another worker and pick up where they left off.
+    handle_exit = worker.handle_exit
+
+    def end_streams_and_exit(sig, frame):
+        with app.app_context():
+            main_app.close_task_events()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, end_streams_and_exit)
+
+
+# Runs in each worker once it has finished its last request
+def worker_exit(server, worker):
+    import main_app
+
+    with worker.wsgi.app_context():
+        main_app.shut_down()
@@ -2,53 +2,470 @@
 main_app.py
 
 All core flask application functionality ties here including:
-    * App configuration settings ()
+    * App configuration settings (load_config)
     * Commandline functionality to initialize a database
     * Database access for each request
     * Registration for all routes (via blueprints)
 
+The app is built by create_app(), an "application factory": `flask run`, gunicorn
+(see gunicorn.conf.py) and the tests each call it to get an app of their own.
+Most of the time it takes to import this file is spent importing Flask; the
+app's own modules below add only a few milliseconds. The MySQL driver is not
+imported until the first connection is opened. `flask profile-startup` shows
+where the time goes.
 
 To keep this code brief there is no handling of errors or bad requests
 """
 
 # Imports for all built-in python libraries
+import atexit
+import functools
+import logging
 import os
+import threading
+import time
 import uuid
+import weakref
+from contextlib import contextmanager
 
 # Imports all 3rd-party libraries
-from flask import Flask, g
-from dotenv import load_dotenv
+import click
+from flask import Flask, current_app, g, jsonify, request, Response
+from flask.cli import with_appcontext
 
-# Imports for blueprints and other modules written for the application
+# Imports for modules written for the application
+from models.task import TaskDB
 from views.task_view import task_list_blueprint
 from api.task_api import task_api_blueprint
 import utils.db as DBUtils
+import utils.cache as CacheUtils
+import utils.metrics as MetricsUtils
+import utils.json_provider as JSONUtils
+import utils.write_behind as WriteBehindUtils
+import utils.events as EventUtils
+import utils.fragments as FragmentUtils
+import utils.transfer as TransferUtils
+import utils.compaction as CompactionUtils
+import utils.rate_limit as RateLimitUtils
 
-# Load all the private data from the 
-#   .env and .flaskenv files into our
-#   environment variables
-load_dotenv()
 
-# Create an instance of the flask application
-#   this is our webservice
-app = Flask(__name__)
+# Build and configure a new instance of the flask application, this is our webservice.
+#   config holds settings that replace the ones from the .env file (like the
+#   tests' database).
+def create_app(config=None):
+    app = Flask(__name__)
+    load_config(app)
+    if config:
+        app.config.update(config)
+
+    # Setup Views
+    app.register_blueprint(task_list_blueprint)
+    app.register_blueprint(task_api_blueprint)
+
+    # Request and SQL metrics served by the /metrics route (see utils/metrics.py)
+    app.extensions["metrics"] = create_metrics(app.config)
+
+    # Time JSON serialization for every response
+    app.json = MetricsUtils.TimedJSONProvider(app, JSONUtils.create_json_provider(app))
+
+    app.before_request(before)
+    app.after_request(add_server_timing)
+    app.teardown_request(after)
+
+    app.add_url_rule('/stats/db-pool', view_func=db_pool_stats, methods=["GET"])
+    app.add_url_rule('/stats/cache', view_func=cache_stats, methods=["GET"])
+    app.add_url_rule('/stats/write-behind', view_func=write_behind_stats, methods=["GET"])
+    app.add_url_rule('/stats/events', view_func=task_events_stats, methods=["GET"])
+    app.add_url_rule('/stats/compaction', view_func=compaction_stats, methods=["GET"])
+    app.add_url_rule('/stats/admission', view_func=admission_stats, methods=["GET"])
+    app.add_url_rule('/metrics', view_func=metrics_endpoint, methods=["GET"])
+
+    app.cli.add_command(initdb_cli_command)
+    app.cli.add_command(migrate_cli_command)
+    app.cli.add_command(resetdb_cli_command)
+    app.cli.add_command(import_tasks_cli_command)
+    app.cli.add_command(export_tasks_cli_command)
+    app.cli.add_command(profile_startup_cli_command)
+
+    # Save every queued task and close the connections when the process exits
+    #   (see shut_down_apps)
+    _apps.add(app)
+    return app
+
 
 # Add some configuration data to your application
 #   to easily access important start up data
 # In our case here, we are using this app.config
 #   dictionary to setup database connection information
-app.config["DATABASE"] = os.getenv("DATABASE")
-app.config["DBHOST"] = os.getenv("DBHOST")
-app.config["DBUSERNAME"] = os.getenv("DBUSERNAME")
-app.config["DBPASSWORD"] = os.getenv("DBPASSWORD")
+def load_config(app):
+    from dotenv import load_dotenv
+
+    # Load all the private data from the
+    #   .env and .flaskenv files into our
+    #   environment variables
+    load_dotenv()
+
+    app.config["DATABASE"] = os.getenv("DATABASE")
+    app.config["DBHOST"] = os.getenv("DBHOST")
+    app.config["DBUSERNAME"] = os.getenv("DBUSERNAME")
+    app.config["DBPASSWORD"] = os.getenv("DBPASSWORD")
+
+    # Connection pool settings (see utils/db.py:ConnectionPool)
+    app.config["DBPOOL_SIZE"] = int(os.getenv("DBPOOL_SIZE", 5))
+    app.config["DBPOOL_MAX_OVERFLOW"] = int(os.getenv("DBPOOL_MAX_OVERFLOW", 10))
+    app.config["DBPOOL_IDLE_TIMEOUT"] = float(os.getenv("DBPOOL_IDLE_TIMEOUT", 300))
+    app.config["DBPOOL_CHECKOUT_TIMEOUT"] = float(os.getenv("DBPOOL_CHECKOUT_TIMEOUT", 30))
+
+    # Admission control (see utils/rate_limit.py)
+    #   DB_MAX_CONCURRENCY - requests using the database at the same time in each
+    #       process (default: every connection the pool may open), 0 turns it off
+    #   DB_ADMISSION_TIMEOUT - seconds a request waits for its turn before a 503
+    #   RATE_LIMIT_PER_SECOND / RATE_LIMIT_BURST - token bucket for each client and
+    #       endpoint, a rate of 0 (the default) turns it off
+    #   RATE_LIMIT_ENDPOINTS - limits of their own for some endpoints, like
+    #       "task_api_blueprint.add_task=5/10" (5 per second, bursts of 10)
+    #   RATE_LIMIT_BACKEND - memory (each process on its own), sqlite (shared by
+    #       the processes on this computer through RATE_LIMIT_SQLITE_PATH) or none
+    app.config["DB_MAX_CONCURRENCY"] = int(os.getenv(
+        "DB_MAX_CONCURRENCY", app.config["DBPOOL_SIZE"] + app.config["DBPOOL_MAX_OVERFLOW"]
+    ))
+    app.config["DB_ADMISSION_TIMEOUT"] = float(os.getenv("DB_ADMISSION_TIMEOUT", 1.0))
+    app.config["RATE_LIMIT_PER_SECOND"] = float(os.getenv("RATE_LIMIT_PER_SECOND", 0))
+    app.config["RATE_LIMIT_BURST"] = float(os.getenv("RATE_LIMIT_BURST", 20))
+    app.config["RATE_LIMIT_ENDPOINTS"] = RateLimitUtils.parse_endpoint_limits(os.getenv("RATE_LIMIT_ENDPOINTS", ""))
+    app.config["RATE_LIMIT_BACKEND"] = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    app.config["RATE_LIMIT_SQLITE_PATH"] = os.getenv("RATE_LIMIT_SQLITE_PATH")
+
+    # Run the common task statements as server-side prepared statements
+    #   (see models/task.py:prepared_cursor), set to 0 to send plain SQL text
+    app.config["DB_PREPARED_STATEMENTS"] = os.getenv("DB_PREPARED_STATEMENTS", "1") == "1"
+
+    # Query cache settings (see utils/cache.py)
+    app.config["CACHE_BACKEND"] = os.getenv("CACHE_BACKEND", "memory")
+    app.config["CACHE_TTL"] = float(os.getenv("CACHE_TTL", 30))
+    app.config["CACHE_MAX_ENTRIES"] = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+    app.config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+    # HTML task list (see views/task_view.py and utils/fragments.py)
+    #   TASKS_PER_PAGE - tasks shown on each page
+    #   FRAGMENT_CACHE_MAX_ENTRIES - rendered rows kept in memory, 0 turns the cache off
+    #   FRAGMENT_CACHE_TTL - seconds a rendered row is kept
+    app.config["TASKS_PER_PAGE"] = int(os.getenv("TASKS_PER_PAGE", 50))
+    app.config["FRAGMENT_CACHE_MAX_ENTRIES"] = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", 10_000))
+    app.config["FRAGMENT_CACHE_TTL"] = float(os.getenv("FRAGMENT_CACHE_TTL", 3600))
+
+    # Write-behind mode for POST /api/v1/tasks/ (see utils/write_behind.py)
+    app.config["WRITE_BEHIND"] = os.getenv("WRITE_BEHIND", "0") == "1"
+    app.config["WRITE_BEHIND_QUEUE_SIZE"] = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", 10_000))
+    app.config["WRITE_BEHIND_BATCH_SIZE"] = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))
+    app.config["WRITE_BEHIND_FLUSH_MS"] = float(os.getenv("WRITE_BEHIND_FLUSH_MS", 50))
+    app.config["WRITE_BEHIND_ID_BLOCK"] = int(os.getenv("WRITE_BEHIND_ID_BLOCK", 1000))
+    app.config["WRITE_BEHIND_DURABLE"] = os.getenv("WRITE_BEHIND_DURABLE", "0") == "1"
+    app.config["WRITE_BEHIND_DURABLE_TIMEOUT"] = float(os.getenv("WRITE_BEHIND_DURABLE_TIMEOUT", 5))
+
+    # Soft deletes (see models/task.py:TaskDB and utils/compaction.py)
+    #   SOFT_DELETE=1 - deleting a task only flags it, a background thread removes it later
+    #   COMPACTION_BATCH_SIZE - most flagged tasks removed per transaction
+    #   COMPACTION_INTERVAL - seconds between batches while tasks are waiting
+    #   COMPACTION_IDLE_INTERVAL - seconds between checks once none are waiting
+    #   COMPACTION_DELAY - seconds a task stays flagged before it may be removed
+    app.config["SOFT_DELETE"] = os.getenv("SOFT_DELETE", "0") == "1"
+    app.config["COMPACTION_BATCH_SIZE"] = int(os.getenv("COMPACTION_BATCH_SIZE", 500))
+    app.config["COMPACTION_INTERVAL"] = float(os.getenv("COMPACTION_INTERVAL", 1.0))
+    app.config["COMPACTION_IDLE_INTERVAL"] = float(os.getenv("COMPACTION_IDLE_INTERVAL", 30))
+    app.config["COMPACTION_DELAY"] = float(os.getenv("COMPACTION_DELAY", 60))
+
+    # Change feed served by /api/v1/tasks/stream (see utils/events.py)
+    #   TASK_EVENTS_MAX - events kept for clients that reconnect
+    #   TASK_STREAM_HEARTBEAT - seconds between keep-alive comments on an idle stream
+    #   TASK_STREAM_TIMEOUT - seconds before a stream is closed (the browser reconnects
+    #       by itself and picks up where it left off), so streams never tie up a server
+    #       thread for good
+    #   TASK_STREAM_MAX - streams open at once in each process, more are answered
+    #       503 (default: half of gunicorn's WEB_THREADS), 0 for no limit
+    app.config["TASK_EVENTS_MAX"] = int(os.getenv("TASK_EVENTS_MAX", 1000))
+    app.config["TASK_STREAM_MAX"] = int(os.getenv("TASK_STREAM_MAX", max(1, int(os.getenv("WEB_THREADS", 8)) // 2)))
+    app.config["TASK_STREAM_HEARTBEAT"] = float(os.getenv("TASK_STREAM_HEARTBEAT", 15))
+    app.config["TASK_STREAM_TIMEOUT"] = float(os.getenv("TASK_STREAM_TIMEOUT", 300))
+
+    # SQL statements slower than this are logged with their SQL text
+    app.config["SLOW_QUERY_MS"] = float(os.getenv("SLOW_QUERY_MS", 200))
+
+    # JSON encoder for responses (see utils/json_provider.py)
+    #   JSON_PROVIDER=orjson is much faster for large task lists
+    #   JSON_ISO_DATETIMES=1 writes datetimes as ISO 8601 instead of HTTP dates
+    app.config["JSON_PROVIDER"] = os.getenv("JSON_PROVIDER", "default")
+    app.config["JSON_ISO_DATETIMES"] = os.getenv("JSON_ISO_DATETIMES", "0") == "1"
+
+    # Useful if you decide to create session cookies
+    #   (the CS50 video discusses sessions)
+    app.config["SECRET_KEY"] = uuid.uuid4().hex
+
+
+def create_metrics(config):
+    metrics = MetricsUtils.Metrics(slow_query_seconds=config["SLOW_QUERY_MS"] / 1000)
+    metrics.describe("tasks_requests_total", "counter", "Requests served by endpoint, method and status code")
+    metrics.describe("tasks_request_duration_seconds", "histogram", "Total time to serve a request")
+    metrics.describe("tasks_request_phase_seconds", "histogram", "Time spent per request connecting, querying and serializing")
+    metrics.describe("tasks_request_sql_statements", "histogram", "SQL statements executed per request")
+    metrics.describe("tasks_sql_statements_total", "counter", "SQL statements executed")
+    metrics.describe("tasks_sql_statement_seconds", "histogram", "Time to execute a SQL statement and fetch its rows")
+    metrics.describe("tasks_sql_slow_statements_total", "counter", "SQL statements slower than SLOW_QUERY_MS")
+    return metrics
+
+
+# Routes that never touch the database, so there is no need to borrow a connection
+NO_DB_ENDPOINTS = {"static", "metrics_endpoint", "db_pool_stats", "cache_stats", "write_behind_stats",
+                   "task_events_stats", "compaction_stats", "admission_stats", "task_api_blueprint.stream_tasks"}
+
+
+# The pool and cache are created the first time they are needed (instead of in
+#   create_app) so a process that never touches the database never connects.
+#   Each one is kept in the current app's extensions dictionary, so the helpers
+#   below need an app context (every request has one).
+_extensions_lock = threading.Lock()
+
+
+# Helper function to get (or create) the application's connection pool.
+#   Every connection's SQL statements are timed (see utils/metrics.py).
+def get_db_pool():
+    app = current_app
+    with _extensions_lock:
+        if "db_pool" not in app.extensions:
+            metrics = app.extensions["metrics"]
+            app.extensions["db_pool"] = DBUtils.ConnectionPool(
+                app.config,
+                connect=lambda config: MetricsUtils.InstrumentedConnection(DBUtils.connect_db(config), metrics),
+                size=app.config["DBPOOL_SIZE"],
+                max_overflow=app.config["DBPOOL_MAX_OVERFLOW"],
+                idle_timeout=app.config["DBPOOL_IDLE_TIMEOUT"],
+                checkout_timeout=app.config["DBPOOL_CHECKOUT_TIMEOUT"]
+            )
+        return app.extensions["db_pool"]
+
+
+# Helper function to close the pool, the next request will create a new one
+def close_db_pool():
+    with _extensions_lock:
+        pool = current_app.extensions.pop("db_pool", None)
+    if pool is not None:
+        pool.close()
+
+
+# Helper function to get (or create) the cache shared by every request.
+#   Returns None when caching is turned off (CACHE_BACKEND=none).
+def get_task_cache():
+    app = current_app
+    with _extensions_lock:
+        if "task_cache" not in app.extensions:
+            app.extensions["task_cache"] = CacheUtils.create_cache(app.config)
+        return app.extensions["task_cache"]
+
+
+# Helper function to throw away the cache, the next request will create a new one
+def reset_task_cache():
+    with _extensions_lock:
+        cache = current_app.extensions.pop("task_cache", None)
+    if cache is not None:
+        cache.clear()
+
+
+# Helper function to get (or create) the cache of rendered task list rows.
+#   Returns None when it is turned off (FRAGMENT_CACHE_MAX_ENTRIES=0).
+def get_fragment_cache():
+    app = current_app
+    with _extensions_lock:
+        if "fragment_cache" not in app.extensions:
+            app.extensions["fragment_cache"] = FragmentUtils.create_fragment_cache(app.config)
+        return app.extensions["fragment_cache"]
+
+
+# Helper function to get (or create) the log of task changes that the
+#   /api/v1/tasks/stream route sends to clients
+def get_task_events():
+    app = current_app
+    with _extensions_lock:
+        if "task_events" not in app.extensions:
+            app.extensions["task_events"] = EventUtils.EventLog(max_events=app.config["TASK_EVENTS_MAX"],
+                                                                max_streams=app.config["TASK_STREAM_MAX"])
+        return app.extensions["task_events"]
+
+
+# Helper function to end every open stream, the next request will create a new log
+def close_task_events():
+    with _extensions_lock:
+        events = current_app.extensions.pop("task_events", None)
+    if events is not None:
+        events.close()
+
+
+# Helper function to get (or create) the rate limiter.
+#   Returns None when no endpoint is rate limited.
+def get_rate_limiter():
+    app = current_app
+    with _extensions_lock:
+        if "rate_limiter" not in app.extensions:
+            app.extensions["rate_limiter"] = RateLimitUtils.create_rate_limiter(app.config)
+        return app.extensions["rate_limiter"]
+
+
+# Helper function to get (or create) the cap on requests using the database
+#   at the same time. Returns None when it is turned off (DB_MAX_CONCURRENCY=0).
+def get_concurrency_limiter():
+    app = current_app
+    with _extensions_lock:
+        if "concurrency_limiter" not in app.extensions:
+            app.extensions["concurrency_limiter"] = RateLimitUtils.create_concurrency_limiter(app.config)
+        return app.extensions["concurrency_limiter"]
+
+
+# Borrow a pooled connection for work done outside of a request
+#   (like the write-behind queue) and give it back afterwards
+@contextmanager
+def pooled_task_db():
+    pool = get_db_pool()
+    conn = pool.acquire()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        yield TaskDB(conn, cursor, get_task_cache(), prepared=current_app.config["DB_PREPARED_STATEMENTS"],
+                     events=get_task_events(), soft_delete=current_app.config["SOFT_DELETE"])
+    finally:
+        cursor.close()
+        pool.release(conn)
+
+
+# The write-behind queue calls these from its own thread, which has no app
+#   context of its own, so they are given the app to use
+def write_task_batch(app, tasks, task_ids):
+    with app.app_context(), pooled_task_db() as taskdb:
+        taskdb.insert_tasks_with_ids(tasks, task_ids)
+
+
+def reserve_task_ids(app, count):
+    with app.app_context(), pooled_task_db() as taskdb:
+        return taskdb.reserve_task_ids(count)
+
+
+# Helper function to get (or create) the write-behind queue.
+#   Returns None unless WRITE_BEHIND is turned on. The queue's thread is only
+#   started once it is needed, so each gunicorn worker starts its own after forking.
+def get_write_behind():
+    app = current_app
+    if not app.config["WRITE_BEHIND"]:
+        return None
+    with _extensions_lock:
+        if "write_behind" not in app.extensions:
+            app_object = app._get_current_object()
+            app.extensions["write_behind"] = WriteBehindUtils.WriteBehindQueue(
+                functools.partial(write_task_batch, app_object),
+                functools.partial(reserve_task_ids, app_object),
+                max_size=app.config["WRITE_BEHIND_QUEUE_SIZE"],
+                batch_size=app.config["WRITE_BEHIND_BATCH_SIZE"],
+                flush_interval=app.config["WRITE_BEHIND_FLUSH_MS"] / 1000,
+                id_block_size=app.config["WRITE_BEHIND_ID_BLOCK"]
+            )
+        return app.extensions["write_behind"]
+
+
+# Helper function to save every queued task and stop the write-behind queue
+#   so tasks that were accepted are not lost
+def close_write_behind():
+    with _extensions_lock:
+        write_behind = current_app.extensions.pop("write_behind", None)
+    if write_behind is not None:
+        write_behind.close()
+
+
+# The compactor calls this from its own thread, like write_task_batch above.
+#   Returns (tasks purged, tasks still waiting, seconds the oldest has waited).
+def compact_deleted_tasks(app, older_than, batch_size):
+    with app.app_context(), pooled_task_db() as taskdb:
+        purged = taskdb.purge_deleted_tasks(batch_size, older_than)
+        backlog = taskdb.deleted_backlog()
+        return purged, backlog["pending"], backlog["lag_seconds"]
+
+
+# Helper function to get (or create) the compactor that removes soft deleted
+#   tasks. Returns None unless SOFT_DELETE is turned on. Like the write-behind
+#   queue, each gunicorn worker starts its own after forking (the MySQL lock in
+#   TaskDB.purge_deleted_tasks keeps them from purging at the same time).
+def get_compactor():
+    app = current_app
+    if not app.config["SOFT_DELETE"]:
+        return None
+    with _extensions_lock:
+        if "compactor" not in app.extensions:
+            app.extensions["compactor"] = CompactionUtils.Compactor(
+                functools.partial(compact_deleted_tasks, app._get_current_object(), app.config["COMPACTION_DELAY"]),
+                batch_size=app.config["COMPACTION_BATCH_SIZE"],
+                interval=app.config["COMPACTION_INTERVAL"],
+                idle_interval=app.config["COMPACTION_IDLE_INTERVAL"]
+            )
+        return app.extensions["compactor"]
+
+
+# Helper function to stop the compactor, tasks it has not removed yet are
+#   removed by the next one
+def close_compactor():
+    with _extensions_lock:
+        compactor = current_app.extensions.pop("compactor", None)
+    if compactor is not None:
+        compactor.close()
 
-# Useful if you decide to create session cookies
-#   (the CS50 video discusses sessions)
-app.config["SECRET_KEY"] = uuid.uuid4().hex
 
-# Setup Views
-app.register_blueprint(task_list_blueprint)
-app.register_blueprint(task_api_blueprint)
+# Get a server process ready before it takes its first request (see
+#   gunicorn.conf.py): open the pool's connections, prepare the common read
+#   statements on each of them and create the cache, change feed, write-behind
+#   queue and compactor. Returns the number of connections opened.
+def warm_up():
+    get_task_cache()
+    get_fragment_cache()
+    get_task_events()
+    get_write_behind()
+    get_compactor()
+    get_rate_limiter()
+    get_concurrency_limiter()
+    setup = prepare_statements if current_app.config["DB_PREPARED_STATEMENTS"] else None
+    return get_db_pool().warm(setup=setup)
+
+
+# MySQL prepares a statement the first time it runs on a connection, so run the
+#   lookups that most requests make once (they find nothing)
+def prepare_statements(conn):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        taskdb = TaskDB(conn, cursor, prepared=True)
+        taskdb.select_task_by_id(0)
+        taskdb.select_tasks_page(after_id=0, limit=1)
+    finally:
+        cursor.close()
+
+
+# Finish up before a server process exits: end the open change streams, save the
+#   tasks still in the write-behind queue and stop the compactor (which both need
+#   the pool), then close the pooled connections
+def shut_down():
+    close_task_events()
+    close_write_behind()
+    close_compactor()
+    close_db_pool()
+
+
+# Every app create_app() has built in this process. Apps that are no longer
+#   used (like the ones each test builds) are dropped from the WeakSet when they
+#   are freed, so it never keeps them alive.
+_apps = weakref.WeakSet()
+
+
+# Runs once when the process exits (registered below) and shuts down every app
+#   still around
+def shut_down_apps():
+    for app in list(_apps):
+        with app.app_context():
+            shut_down()
+
+
+atexit.register(shut_down_apps)
 
 
 # Helper function to establish a connection to the database
@@ -57,36 +474,311 @@ def connect_db():
     #   to provided temporary access to data globally.
     #   In this case, we are using g to provide the MySQL
     #   database connection and cursor objects for each
-    #   request made to our site.
+    #   request made to our site. The connection is
+    #   borrowed from the pool rather than opened from scratch.
     if not hasattr(g, 'mysql_db'):
-        g.mysql_db = DBUtils.connect_db(app.config)
+        g.mysql_db = get_db_pool().acquire()
     if not hasattr(g, 'mysql_cursor'):
         g.mysql_cursor = g.mysql_db.cursor(dictionary=True)
+    g.task_cache = get_task_cache()
+    g.fragment_cache = get_fragment_cache()
+    # Every route uses the same TaskDB for the whole request
+    g.task_db = TaskDB(g.mysql_db, g.mysql_cursor, g.task_cache, prepared=current_app.config["DB_PREPARED_STATEMENTS"],
+                       events=g.task_events, soft_delete=current_app.config["SOFT_DELETE"])
+    get_compactor()
 
 
-# Helper function to release the connection to the database
+# Helper function to hand the connection back to the pool
 def disconnect_db():
-    g.mysql_cursor.close()
-    g.mysql_db.close()
+    g.pop('task_db', None)
+    cursor = g.pop('mysql_cursor', None)
+    if cursor is not None:
+        cursor.close()
+
+    conn = g.pop('mysql_db', None)
+    if conn is not None:
+        get_db_pool().release(conn)
 
 
 # This is a command that you can add to the flask application
 # You can run:
 #   flask initdb
-# which will run the function and in this case setup the database
-@app.cli.command('initdb')
+# which will run the function and in this case setup the database.
+#   Running it again later only applies new schema migrations, tasks are kept.
+@click.command('initdb')
+@with_appcontext
 def initdb_cli_command():
-    DBUtils.init_db(app.config)
+    run_migrations()
+
+
+# Apply new schema migrations (see utils/migrations.py)
+#   flask migrate --to 2 stops after migration 2
+@click.command('migrate')
+@click.option('--to', 'target', type=int, default=None, help="Last migration version to apply")
+@with_appcontext
+def migrate_cli_command(target):
+    run_migrations(target)
+
+
+def run_migrations(target=None):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    applied = DBUtils.init_db(current_app.config, target)
+    for version, name in applied:
+        click.echo(f"Applied migration {version}: {name}")
+    if not applied:
+        click.echo("The database is up to date")
+
+
+# Erase every task and set the database up from scratch
+@click.command('resetdb')
+@click.confirmation_option(prompt="This erases the whole database. Continue?")
+@with_appcontext
+def resetdb_cli_command():
+    DBUtils.reset_db(current_app.config)
+
+
+# Load tasks from an NDJSON, CSV or Parquet file (see utils/transfer.py)
+#   flask import-tasks tasks.csv --keep-ids keeps the ids from the file
+@click.command('import-tasks')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(TransferUtils.FORMATS), default=None,
+              help="File format (default: from the file extension)")
+@click.option('--batch-size', type=int, default=TransferUtils.IMPORT_BATCH_SIZE, help="Tasks loaded per transaction")
+@click.option('--keep-ids', is_flag=True, help="Keep the ids from the file instead of giving the tasks new ones")
+@with_appcontext
+def import_tasks_cli_command(path, file_format, batch_size, keep_ids):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = DBUtils.connect_db(current_app.config, allow_local_infile=True)
+    start = time.perf_counter()
+    try:
+        result = TransferUtils.import_tasks(conn, path, file_format, batch_size, keep_ids)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+    click.echo(f"Added {result['added']} of {result['read']} tasks from {path} with {result['method']} "
+               f"in {elapsed:.1f} s ({result['read'] / elapsed:.0f} tasks/s)")
+
+
+# Write every task to an NDJSON, CSV or Parquet file (see utils/transfer.py)
+@click.command('export-tasks')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'file_format', type=click.Choice(TransferUtils.FORMATS), default=None,
+              help="File format (default: from the file extension)")
+@click.option('--batch-size', type=int, default=TransferUtils.EXPORT_BATCH_SIZE, help="Tasks fetched from MySQL at a time")
+@with_appcontext
+def export_tasks_cli_command(path, file_format, batch_size):
+    conn = DBUtils.connect_db(current_app.config)
+    cursor = conn.cursor(dictionary=True)
+    start = time.perf_counter()
+    try:
+        count = TransferUtils.export_tasks(TaskDB(conn, cursor), path, file_format, batch_size)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    finally:
+        cursor.close()
+        conn.close()
+    elapsed = time.perf_counter() - start
+    click.echo(f"Exported {count} tasks to {path} in {elapsed:.1f} s ({count / elapsed:.0f} tasks/s)")
+
+
+# Show what a new server process spends its start up time on (see utils/startup.py):
+#   the slowest modules to import, then the time until the first response.
+#   --path chooses the request, a route that uses the database includes
+#   connecting to it.
+@click.command('profile-startup')
+@click.option('--top', type=int, default=15, help="Number of modules to list")
+@click.option('--path', default="/stats/events", help="Route to request")
+def profile_startup_cli_command(top, path):
+    import utils.startup as StartupUtils
+
+    imports = StartupUtils.profile_imports()
+    total = sum(item.cumulative_us for item in imports if item.depth == 1)
+    click.echo(f"Importing main_app and running create_app(): {total / 1000:.1f} ms\n")
+    click.echo(f"{'module':<45} {'self ms':>8} {'total ms':>9}")
+    for item in sorted(imports, key=lambda item: item.cumulative_us, reverse=True)[:top]:
+        click.echo(f"{'  ' * (item.depth - 1) + item.module:<45} {item.self_us / 1000:>8.1f} {item.cumulative_us / 1000:>9.1f}")
+
+    result = StartupUtils.time_to_first_request(path)
+    click.echo(f"\nTime to first request (GET {path}, status {result['status']}):")
+    for milestone, seconds in result["milestones"].items():
+        click.echo(f"  {milestone:<20} {seconds * 1000:>8.1f} ms")
 
 
 # Function called before all requests to the webservice
-@app.before_request
+#   Requests that use the database are first checked against the rate limits
+#   and the cap on concurrent database work; returning a response here answers
+#   the request without running the route (or borrowing a connection).
 def before():
+    g.timings = MetricsUtils.RequestTimings()
+    g.task_events = get_task_events()
+    g.write_behind = get_write_behind()
+    if request.endpoint in NO_DB_ENDPOINTS:
+        return
+
+    refused = admit_request(uses_database())
+    if refused is not None or not uses_database():
+        return refused
+
+    start = time.perf_counter()
     connect_db()
+    g.timings.connect = time.perf_counter() - start
+
+
+# A POST of a new task in write-behind mode only puts the task in the queue.
+#   The queue borrows connections of its own to reserve ids and save batches, so
+#   the request must not hold one (or a database admission slot) while it waits.
+def uses_database():
+    return not (g.write_behind is not None and request.endpoint == "task_api_blueprint.add_task")
+
+
+# Returns a 429 response when the client has used up its requests to this
+#   endpoint, a 503 response when the database is too busy to take the request
+#   in time (only checked when needs_slot), or None when the request may go ahead
+def admit_request(needs_slot=True):
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        retry_after = rate_limiter.check(request.remote_addr, request.endpoint)
+        if retry_after:
+            response = jsonify({"status": "error", "message": "Too many requests, slow down"})
+            response.headers["Retry-After"] = RateLimitUtils.retry_after_header(retry_after)
+            return response, 429
+
+    concurrency_limiter = get_concurrency_limiter()
+    if needs_slot and concurrency_limiter is not None:
+        if not concurrency_limiter.acquire():
+            response = jsonify({"status": "error", "message": "The server is busy, try again shortly"})
+            response.headers["Retry-After"] = "1"
+            return response, 503
+        g.admitted = concurrency_limiter
+    return None
+
+
+# Report the time spent in each phase to the client (visible in the browser's dev tools)
+def add_server_timing(response):
+    timings = g.timings
+    response.headers["Server-Timing"] = (
+        f"connect;dur={timings.connect * 1000:.2f}, "
+        f"query;dur={timings.query * 1000:.2f}, "
+        f"serialize;dur={timings.serialize * 1000:.2f}"
+    )
+    g.response_status = response.status_code
+    return response
 
 
 # Function called after the completion of a webservice request
-@app.after_request
-def after(response):
+#   teardown_request (unlike after_request) also runs when the request
+#   raised an error, so a borrowed connection always makes it back to the pool
+def after(exception):
     disconnect_db()
-    return response
+    admitted = g.pop('admitted', None)
+    if admitted is not None:
+        admitted.release()
+    record_request_metrics()
+
+
+def record_request_metrics():
+    timings = g.get("timings")
+    if timings is None:
+        return
+
+    metrics = current_app.extensions["metrics"]
+    endpoint = request.endpoint or "unknown"
+    status = g.get("response_status", 500)
+    metrics.inc("tasks_requests_total", (("endpoint", endpoint), ("method", request.method), ("status", status)))
+    metrics.observe("tasks_request_duration_seconds", timings.total(), (("endpoint", endpoint),))
+    for phase in ("connect", "query", "serialize"):
+        metrics.observe("tasks_request_phase_seconds", getattr(timings, phase), (("endpoint", endpoint), ("phase", phase)))
+    metrics.observe("tasks_request_sql_statements", timings.statements, (("endpoint", endpoint),),
+                    buckets=MetricsUtils.COUNT_BUCKETS)
+
+
+# Connection pool statistics for monitoring
+def db_pool_stats():
+    return jsonify({"status": "success", "db_pool": get_db_pool().stats()}), 200
+
+
+# Query cache hit/miss statistics for monitoring
+def cache_stats():
+    cache = get_task_cache()
+    fragment_cache = get_fragment_cache()
+    return jsonify({
+        "status": "success",
+        "cache": cache.stats() if cache is not None else None,
+        "fragments": fragment_cache.stats() if fragment_cache is not None else None
+    }), 200
+
+
+# Write-behind queue statistics for monitoring
+def write_behind_stats():
+    write_behind = get_write_behind()
+    return jsonify({"status": "success", "write_behind": write_behind.stats() if write_behind is not None else None}), 200
+
+
+# Change feed statistics for monitoring
+def task_events_stats():
+    return jsonify({"status": "success", "events": get_task_events().stats()}), 200
+
+
+# Soft delete compaction statistics for monitoring, lag_seconds is how long ago
+#   the oldest task waiting to be removed was deleted
+def compaction_stats():
+    compactor = get_compactor()
+    return jsonify({"status": "success", "compaction": compactor.stats() if compactor is not None else None}), 200
+
+
+# Rate limiter and database admission statistics for monitoring
+def admission_stats():
+    rate_limiter = get_rate_limiter()
+    concurrency_limiter = get_concurrency_limiter()
+    return jsonify({
+        "status": "success",
+        "rate_limit": rate_limiter.stats() if rate_limiter is not None else None,
+        "admission": concurrency_limiter.stats() if concurrency_limiter is not None else None
+    }), 200
+
+
+# Metrics in the Prometheus text format
+def metrics_endpoint():
+    gauges = []
+    for name, value in get_db_pool().stats().items():
+        gauges.append((f"tasks_db_pool_{name}", f"Connection pool {name.replace('_', ' ')}", (), value))
+
+    cache = get_task_cache()
+    if cache is not None:
+        for name, value in cache.stats().items():
+            if name != "backend":
+                gauges.append((f"tasks_cache_{name}", f"Query cache {name}", (), value))
+
+    fragment_cache = get_fragment_cache()
+    if fragment_cache is not None:
+        for name, value in fragment_cache.stats().items():
+            if name != "backend":
+                gauges.append((f"tasks_fragment_cache_{name}", f"Rendered row cache {name}", (), value))
+
+    write_behind = get_write_behind()
+    if write_behind is not None:
+        for name, value in write_behind.stats().items():
+            gauges.append((f"tasks_write_behind_{name}", f"Write-behind queue {name.replace('_', ' ')}", (), value))
+
+    compactor = get_compactor()
+    if compactor is not None:
+        for name, value in compactor.stats().items():
+            gauges.append((f"tasks_compaction_{name}", f"Soft delete compaction {name.replace('_', ' ')}", (), value))
+
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        for name, value in rate_limiter.stats().items():
+            if name != "backend":
+                gauges.append((f"tasks_rate_limit_{name}", f"Rate limiter {name}", (), value))
+
+    concurrency_limiter = get_concurrency_limiter()
+    if concurrency_limiter is not None:
+        for name, value in concurrency_limiter.stats().items():
+            gauges.append((f"tasks_admission_{name}", f"Database admission {name.replace('_', ' ')}", (), value))
+
+    for name, value in get_task_events().stats().items():
+        gauges.append((f"tasks_events_{name}", f"Change feed {name.replace('_', ' ')}", (), value))
+
+    return Response(current_app.extensions["metrics"].render(gauges), mimetype="text/plain; version=0.0.4")
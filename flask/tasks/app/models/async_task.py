@@ -0,0 +1,168 @@
+"""
+async_task.py
+
+Async version of TaskDB used by the ASGI app (asgi_app.py). It runs the same SQL
+as TaskDB (see models/task.py), but awaits an aiomysql connection instead of
+blocking on mysql.connector, so a worker can serve other requests while it waits
+for the database.
+"""
+import aiomysql
+
+from models.task import (
+    SELECT_ALL_TASKS, SELECT_TASKS_PAGE, SELECT_TASKS_BY_DESCRIPTION, SEARCH_TASKS,
+    SELECT_TASKS_VERSION, SELECT_TASK_BY_ID, INSERT_TASK, UPDATE_TASK, DELETE_TASK, SOFT_DELETE_TASK,
+    BUMP_TASKS_VERSION, chunked, delete_tasks_query, soft_delete_tasks_query, fulltext_terms, insert_tasks_query, select_tasks_query
+)
+
+
+# Class to support reading/writing Task objects with the database from async code
+#   With soft_delete=True deleting a task only sets its deleted_at column, like
+#   TaskDB. The ASGI app has no background thread to remove those tasks, that is
+#   left to a WSGI server process (see utils/compaction.py).
+class AsyncTaskDB:
+    def __init__(self, db_conn, soft_delete=False):
+        self._db_conn = db_conn
+        self._soft_delete = soft_delete
+
+
+    # Run a query and return every row as a dictionary
+    async def _fetchall(self, query, params=()):
+        async with self._db_conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(query, params)
+            return await cursor.fetchall()
+
+
+    async def select_all_tasks(self):
+        return await self._fetchall(SELECT_ALL_TASKS)
+
+
+    async def select_tasks_page(self, after_id=0, limit=100):
+        return await self._fetchall(SELECT_TASKS_PAGE, (after_id, limit))
+
+
+    async def select_all_tasks_by_description(self, description):
+        return await self._fetchall(SELECT_TASKS_BY_DESCRIPTION, (f"%{description}%",))
+
+
+    async def select_tasks(self, **options):
+        sql, params = select_tasks_query(**options)
+        return await self._fetchall(sql, params)
+
+
+    # Same ranked FULLTEXT search (and LIKE fall back) as TaskDB.search_tasks
+    async def search_tasks(self, text, **options):
+        terms = fulltext_terms(text)
+        result = []
+        if terms is not None:
+            if options:
+                result = await self.select_tasks(match=terms, **options)
+            else:
+                result = await self._fetchall(SEARCH_TASKS, (terms, terms))
+
+        if not result:
+            if options:
+                return await self.select_tasks(like=text, **options)
+            return await self.select_all_tasks_by_description(text)
+        return result
+
+
+    # Same as TaskDB.search_tasks_page, returns (mode, tasks)
+    async def search_tasks_page(self, text, mode=None, **options):
+        terms = fulltext_terms(text)
+        if terms is None:
+            mode = "like"
+        if mode in (None, "fulltext"):
+            result = await self.select_tasks(match=terms, **options)
+            if result or mode == "fulltext":
+                return "fulltext", result
+        return "like", await self.select_tasks(like=text, **options)
+
+
+    async def select_tasks_version(self):
+        result = await self._fetchall(SELECT_TASKS_VERSION)
+        return result[0]
+
+
+    async def select_task_by_id(self, task_id):
+        return await self._fetchall(SELECT_TASK_BY_ID, (task_id,))
+
+
+    # Commit the open transaction, adding one to the tasks version first like
+    #   TaskDB's write methods do
+    async def commit(self):
+        async with self._db_conn.cursor() as cursor:
+            await cursor.execute(BUMP_TASKS_VERSION)
+        await self._db_conn.commit()
+
+
+    # Same as TaskDB.insert_task, with commit=False the caller commits later
+    async def insert_task(self, task, commit=True):
+        async with self._db_conn.cursor() as cursor:
+            await cursor.execute(INSERT_TASK, (task.description, task.creation_datetime, task.completed))
+            task_id = cursor.lastrowid
+        if commit:
+            await self.commit()
+        return {"task_id": task_id}
+
+
+    async def update_task(self, task_id, new_task):
+        async with self._db_conn.cursor() as cursor:
+            await cursor.execute(UPDATE_TASK, (new_task.description, task_id))
+        await self.commit()
+
+
+    async def delete_task_by_id(self, task_id):
+        async with self._db_conn.cursor() as cursor:
+            await cursor.execute(SOFT_DELETE_TASK if self._soft_delete else DELETE_TASK, (task_id,))
+        await self.commit()
+
+
+    # Same single transaction multi-row insert as TaskDB.insert_tasks
+    async def insert_tasks(self, tasks):
+        task_ids = []
+        try:
+            async with self._db_conn.cursor() as cursor:
+                for chunk in chunked(list(tasks)):
+                    params = []
+                    for task in chunk:
+                        params.extend((task.description, task.creation_datetime, task.completed))
+
+                    await cursor.execute(insert_tasks_query(len(chunk)), params)
+                    first_id = cursor.lastrowid
+                    task_ids.extend(range(first_id, first_id + len(chunk)))
+            await self.commit()
+        except Exception:
+            await self._db_conn.rollback()
+            raise
+        return task_ids
+
+
+    # Same single transaction update as TaskDB.update_tasks, updates is a list
+    #   of (task_id, new_task) pairs. Returns the number of tasks changed.
+    async def update_tasks(self, updates):
+        try:
+            async with self._db_conn.cursor() as cursor:
+                await cursor.executemany(UPDATE_TASK, [(task.description, task_id) for task_id, task in updates])
+                updated = cursor.rowcount
+            await self.commit()
+        except Exception:
+            await self._db_conn.rollback()
+            raise
+        return updated
+
+
+    # Same single transaction DELETE ... WHERE id IN (...) (or UPDATE with
+    #   soft_delete) as TaskDB.delete_tasks
+    async def delete_tasks(self, task_ids):
+        query = soft_delete_tasks_query if self._soft_delete else delete_tasks_query
+        deleted = 0
+        try:
+            async with self._db_conn.cursor() as cursor:
+                for chunk in chunked(list(task_ids)):
+                    await cursor.execute(query(len(chunk)), chunk)
+                    deleted += cursor.rowcount
+            await self.commit()
+        except Exception:
+            await self._db_conn.rollback()
+            raise
+        return deleted
@@ -1,11 +1,60 @@
+import functools
+import re
+import threading
+import weakref
 from datetime import datetime
 
+# Largest number of rows sent to MySQL in a single statement by the bulk methods.
+#   Keeps each statement well under MySQL's max_allowed_packet limit.
+BULK_CHUNK_SIZE = 1000
+
+
+# Helper to split a list into lists of at most size items
+def chunked(items, size=BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 # Class to model Task objects
+#   __slots__ stores the four attributes in fixed places inside each object
+#   instead of a per-object __dict__. A Task object is about a third of the size
+#   of the dictionary the MySQL cursor makes for each row (64 bytes against 184
+#   on 64-bit Python 3.11, not counting the values, see benchmarks/bench_memory.py).
+#   The trade-off is that no other attributes can be added to a Task.
+#
+#   Tasks read from the database also know their id. New tasks have an id of None
+#   until they are inserted.
 class Task:
-    def __init__(self, description):
+    __slots__ = ("_id", "_description", "_creation_datetime", "_completed")
+
+    def __init__(self, description, task_id=None, creation_datetime=None, completed=0):
+        self._id = task_id
         self._description = description
-        self._creation_datetime = datetime.now()
-        self._completed = 0
+        self._creation_datetime = creation_datetime if creation_datetime is not None else datetime.now()
+        self._completed = completed
+    
+
+    # Build Tasks from rows of (id, description, creation_datetime, completed)
+    #   tuples, the order of TASK_COLUMNS below. rows can be any iterable (like a
+    #   cursor), so the rows never need to be in memory all at once.
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls(description, task_id, creation_datetime, completed)
+                for task_id, description, creation_datetime, completed in rows]
+
+
+    # The task as a dictionary shaped like a row of the tasks table, ready for jsonify
+    def to_dict(self):
+        return {
+            "id": self._id,
+            "description": self._description,
+            "creation_datetime": self._creation_datetime,
+            "completed": int(self._completed),
+        }
+
+
+    @property
+    def id(self):
+        return self._id
     
 
     @property
@@ -35,64 +84,676 @@ class Task:
         return self._creation_datetime
 
 
+# Columns a client may choose with ?fields= and sort by with ?sort=.
+#   Only these names are ever placed in the SQL text, every value is a parameter.
+#   The selects below list these columns rather than using *, so the
+#   deleted_at column (see soft deletes in TaskDB) never shows up in results.
+TASK_COLUMNS = ("id", "description", "creation_datetime", "completed")
+SORT_COLUMNS = ("id", "creation_datetime")
+TASK_FIELDS = ", ".join(TASK_COLUMNS)
+
+
+# SQL run by TaskDB. These are shared with models/async_task.py:AsyncTaskDB so
+#   both the WSGI and ASGI versions of the app run exactly the same queries.
+#   Every select skips soft deleted tasks (deleted_at IS NOT NULL).
+SELECT_ALL_TASKS = f"""
+    SELECT {TASK_FIELDS} from tasks WHERE deleted_at IS NULL;
+"""
+
+SELECT_ALL_TASKS_BY_ID = f"""
+    SELECT {TASK_FIELDS} from tasks WHERE deleted_at IS NULL ORDER BY id;
+"""
+
+SELECT_TASKS_PAGE = f"""
+    SELECT {TASK_FIELDS} from tasks WHERE id > %s AND deleted_at IS NULL ORDER BY id LIMIT %s;
+"""
+
+SELECT_TASKS_BY_DESCRIPTION = f"""
+    SELECT {TASK_FIELDS} from tasks WHERE description LIKE %s AND deleted_at IS NULL;
+"""
+
+SEARCH_TASKS = f"""
+    SELECT {TASK_FIELDS} from tasks
+    WHERE MATCH(description) AGAINST (%s IN BOOLEAN MODE) AND deleted_at IS NULL
+    ORDER BY MATCH(description) AGAINST (%s IN BOOLEAN MODE) DESC, id;
+"""
+
+SELECT_TASKS_VERSION = """
+    SELECT version, UNIX_TIMESTAMP(updated_at) AS updated_at
+    FROM tasks_version WHERE id = 1;
+"""
+
+# Every write adds one to the tasks version in the same transaction, just before
+#   it commits, so the row is only locked for the commit itself. The API builds
+#   its ETags from the version (see api/task_api.py:get_tasks).
+BUMP_TASKS_VERSION = """
+    UPDATE tasks_version SET version = version + 1, updated_at = NOW(6) WHERE id = 1;
+"""
+
+SELECT_TASK_BY_ID = f"""
+    SELECT {TASK_FIELDS} from tasks WHERE id = %s AND deleted_at IS NULL;
+"""
+
+INSERT_TASK = """
+    INSERT INTO tasks (description, creation_datetime, completed)
+    VALUES (%s, %s, %s);
+"""
+
+UPDATE_TASK = """
+    UPDATE tasks
+    SET description=%s
+    WHERE id=%s AND deleted_at IS NULL;
+"""
+
+DELETE_TASK = """
+    DELETE from tasks
+    WHERE id=%s;
+"""
+
+# A soft delete only flags the task, one primary key lookup and no rows move
+SOFT_DELETE_TASK = """
+    UPDATE tasks
+    SET deleted_at = NOW(6)
+    WHERE id=%s AND deleted_at IS NULL;
+"""
+
+# Name of the MySQL lock held while purging soft deleted tasks
+COMPACTION_LOCK = "tasks_compaction"
+
+# Remove the soft deleted tasks that were deleted at least %s seconds ago,
+#   oldest first and at most %s of them. The (deleted_at, id) index finds them
+#   without a table scan. The tasks already look deleted, so the tasks version
+#   stays the same and clients holding an ETag are not sent the list again.
+PURGE_DELETED_TASKS = """
+    DELETE from tasks
+    WHERE deleted_at <= NOW(6) - INTERVAL %s SECOND
+    ORDER BY deleted_at LIMIT %s;
+"""
+
+# How far behind compaction is: the soft deleted tasks waiting (counting at
+#   most %s of them, so this stays cheap during a mass delete) and the age in
+#   seconds of the oldest one. Both are read from the (deleted_at, id) index.
+SELECT_DELETED_BACKLOG = """
+    SELECT
+        (SELECT COUNT(*) FROM (SELECT 1 FROM tasks WHERE deleted_at IS NOT NULL LIMIT %s) AS waiting) AS pending,
+        TIMESTAMPDIFF(MICROSECOND, MIN(deleted_at), NOW(6)) / 1000000 AS lag_seconds
+    FROM tasks WHERE deleted_at IS NOT NULL;
+"""
+
+
+def insert_tasks_query(row_count):
+    return f"""
+        INSERT INTO tasks (description, creation_datetime, completed)
+        VALUES {", ".join(["(%s, %s, %s)"] * row_count)};
+    """
+
+
+# Same as insert_tasks_query, but with ids chosen by us (see TaskDB.reserve_task_ids)
+def insert_tasks_with_ids_query(row_count):
+    return f"""
+        INSERT INTO tasks (id, description, creation_datetime, completed)
+        VALUES {", ".join(["(%s, %s, %s, %s)"] * row_count)};
+    """
+
+
+# Empty rows inserted (and rolled back) by TaskDB.reserve_task_ids
+def reserve_task_ids_query(row_count):
+    return f"""
+        INSERT INTO tasks (description) VALUES {", ".join(["(NULL)"] * row_count)};
+    """
+
+
+def delete_tasks_query(id_count):
+    return f"""
+        DELETE from tasks
+        WHERE id IN ({", ".join(["%s"] * id_count)});
+    """
+
+
+def soft_delete_tasks_query(id_count):
+    return f"""
+        UPDATE tasks
+        SET deleted_at = NOW(6)
+        WHERE id IN ({", ".join(["%s"] * id_count)}) AND deleted_at IS NULL;
+    """
+
+
+# Build the SELECT used by TaskDB.select_tasks() and filtered searches.
+#   Returns (sql, params).
+#   * fields - columns to return (all of them when None)
+#   * completed - only completed (True) or not completed (False) tasks
+#   * created_after / created_before - only tasks created after / before a datetime
+#   * sort / descending - order by a column of SORT_COLUMNS, ties are broken by id
+#   * after_id / after_value - keyset pagination, only tasks that come after the
+#       task with this id (and sort column value) in the chosen order
+#   * limit - most rows to return
+#   * match / like - FULLTEXT terms (see fulltext_terms) / text the description contains
+#
+#   The indexes on creation_datetime and (completed, creation_datetime) (see
+#   utils/db.py:init_db) let MySQL filter and sort without reading the whole table.
+def select_tasks_query(fields=None, completed=None, created_after=None, created_before=None,
+                       sort=None, descending=False, after_id=None, after_value=None, limit=None,
+                       match=None, like=None):
+    conditions = ["deleted_at IS NULL"]
+    params = []
+
+    if match is not None:
+        conditions.append("MATCH(description) AGAINST (%s IN BOOLEAN MODE)")
+        params.append(match)
+    if like is not None:
+        conditions.append("description LIKE %s")
+        params.append(f"%{like}%")
+    if completed is not None:
+        conditions.append("completed = %s")
+        params.append(int(completed))
+    if created_after is not None:
+        conditions.append("creation_datetime > %s")
+        params.append(created_after)
+    if created_before is not None:
+        conditions.append("creation_datetime < %s")
+        params.append(created_before)
+
+    direction = " DESC" if descending else ""
+    comparison = "<" if descending else ">"
+    if after_id is not None:
+        if sort in (None, "id"):
+            conditions.append(f"id {comparison} %s")
+            params.append(after_id)
+        else:
+            conditions.append(f"({sort} {comparison} %s OR ({sort} = %s AND id {comparison} %s))")
+            params.extend((after_value, after_value, after_id))
+
+    if sort is None and match is not None and after_id is None and limit is None:
+        # Best matches first, like SEARCH_TASKS. Pages of search results are in
+        #   id order instead, as a page token cannot say where a rank left off.
+        order_by = "MATCH(description) AGAINST (%s IN BOOLEAN MODE) DESC, id"
+        params.append(match)
+    elif sort in (None, "id"):
+        order_by = f"id{direction}"
+    else:
+        order_by = f"{sort}{direction}, id{direction}"
+
+    sql = f"SELECT {', '.join(fields or TASK_COLUMNS)} from tasks WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_by}"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql + ";", params
+
+
+# Turn search text into a boolean mode FULLTEXT search where every word also
+#   matches longer words that start with it ("mil" becomes "mil*").
+#   Returns None when no word is long enough for the index (3 or more letters).
+def fulltext_terms(text):
+    words = [word for word in re.findall(r"\w+", text) if len(word) >= 3]
+    if not words:
+        return None
+    return " ".join(f"{word}*" for word in words)
+
+
+# The kinds of search a page of search results can come from (see TaskDB.search_tasks_page)
+SEARCH_MODES = ("fulltext", "like")
+
+
+# The task a "created" event describes, with the same fields as a row from the tasks table
+def task_event_data(task_id, task):
+    return {
+        "id": task_id,
+        "description": task.description,
+        "creation_datetime": task.creation_datetime,
+        "completed": int(task.completed),
+    }
+
+
+# Server-side prepared statements, kept for the life of each connection.
+#   A prepared cursor remembers the one statement it last ran and reuses it
+#   when it is given the same SQL string again, so every connection keeps one
+#   prepared cursor per statement. MySQL then parses and plans each statement
+#   once per connection instead of on every call, and only the parameter values
+#   are sent with each execution.
+#
+#   Entries disappear along with their connection. Each statement uses one of
+#   the server's max_prepared_stmt_count slots per connection.
+_prepared_cursors = weakref.WeakKeyDictionary()
+_prepared_cursors_lock = threading.Lock()
+
+
+def prepared_cursor(db_conn, sql):
+    with _prepared_cursors_lock:
+        cursors = _prepared_cursors.get(db_conn)
+        if cursors is None:
+            cursors = _prepared_cursors[db_conn] = {}
+
+    # A connection is only used by one request at a time, so there is no need
+    #   to hold the lock while preparing the cursor
+    cursor = cursors.get(sql)
+    if cursor is None:
+        cursor = cursors[sql] = db_conn.cursor(prepared=True, dictionary=True)
+    return cursor
+
+
+# Cache key of the counter that is bumped every time the tasks table changes
+TASKS_GENERATION_KEY = "tasks:generation"
+
+
+# Decorator for TaskDB select methods that checks the cache (see utils/cache.py)
+#   before running the query and stores the result afterwards.
+#   * "task" results hold a single task and are keyed by its id, so a write
+#       only needs to forget that one entry
+#   * "list" results can include any task, so their key contains the tasks
+#       generation counter; bumping the counter makes every old list unreachable
+#
+#   Once select_tasks_version() has run on a TaskDB (the API does this to build
+#   its ETag) both kinds are keyed by that database version instead. The version
+#   and the rows are read in the same transaction (with MySQL's default
+#   REPEATABLE READ isolation, from the same snapshot), so a cached result always
+#   belongs to the version in its key: a response can never pair a new ETag with
+#   an old body, even when another process (with its own cache) made the change
+#   or the change was committed but not yet invalidated here.
+def read_through(kind):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self._cache is None:
+                return method(self, *args, **kwargs)
+
+            if self._version is not None:
+                key = f"v{self._version}:{kind}:{method.__name__}:{args!r}:{sorted(kwargs.items())!r}"
+            elif kind == "task":
+                key = f"task:{args[0]}"
+            else:
+                generation = self._cache.counter(TASKS_GENERATION_KEY)
+                key = f"list:{generation}:{method.__name__}:{args!r}:{sorted(kwargs.items())!r}"
+
+            result = self._cache.get(key)
+            if result is None:
+                result = method(self, *args, **kwargs)
+                self._cache.set(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
 # Class to support reading/writing Task objects with the database
+#   An optional cache (see utils/cache.py) is used to answer repeated selects
+#   without going to the database. Every write method invalidates the entries it
+#   affects once its changes are committed.
+#
+#   With prepared=True the single-task statements and the common selects run as
+#   server-side prepared statements that are reused by every TaskDB on the same
+#   connection (see prepared_cursor above). The bulk methods (whose statements
+#   mostly change with the number of rows) always send text through db_cursor.
+#
+#   With an event log (see utils/events.py) every committed insert, update and
+#   delete is also published there for the /api/v1/tasks/stream route.
+#
+#   With soft_delete=True deleting a task only sets its deleted_at column (one
+#   primary key update, the row and its index entries stay where they are).
+#   Every select skips those tasks, and purge_deleted_tasks() removes them later
+#   in small batches (see utils/compaction.py).
 class TaskDB:
-    def __init__(self, db_conn, db_cursor):
+    def __init__(self, db_conn, db_cursor, cache=None, prepared=False, events=None, soft_delete=False):
         self._db_conn = db_conn
         self._cursor = db_cursor
+        self._cache = cache
+        self._prepared = prepared
+        self._events = events
+        self._soft_delete = soft_delete
+        # Tasks version read by select_tasks_version(), used in cache keys
+        self._version = None
+        # Tasks written with commit=False, invalidated and published by commit()
+        self._uncommitted_ids = []
+        self._uncommitted_events = []
     
 
+    # Run one of the statements above and return the cursor holding its result
+    def _execute(self, sql, params=()):
+        cursor = prepared_cursor(self._db_conn, sql) if self._prepared else self._cursor
+        cursor.execute(sql, params)
+        return cursor
+
+
+    # Forget cached results that may include the given tasks
+    def _invalidate(self, task_ids):
+        if self._cache is None:
+            return
+        for task_id in task_ids:
+            self._cache.delete(f"task:{task_id}")
+        self._cache.incr(TASKS_GENERATION_KEY)
+
+
+    # Tell the stream's clients about committed changes, events are (kind, data) pairs
+    def _publish(self, events):
+        if self._events is None:
+            return
+        for kind, data in events:
+            self._events.publish(kind, data)
+
+
+    @read_through("list")
     def select_all_tasks(self):
-        select_all_query = """
-            SELECT * from tasks;
-        """
-        self._cursor.execute(select_all_query)
+        return self._execute(SELECT_ALL_TASKS).fetchall()
+
+
+    # Keyset pagination: return up to limit tasks with an id greater than after_id.
+    #   Unlike LIMIT/OFFSET, the database can jump straight to after_id using the
+    #   primary key, so every page costs the same no matter how deep it is.
+    @read_through("list")
+    def select_tasks_page(self, after_id=0, limit=100):
+        return self._execute(SELECT_TASKS_PAGE, (after_id, limit)).fetchall()
 
+
+    # Generator that yields every task one at a time. The rows are read from the
+    #   server batch_size at a time with an unbuffered cursor, so memory use stays
+    #   the same regardless of how many tasks are in the table.
+    #   The filters, sort and fields of select_tasks() can be added.
+    def iter_all_tasks(self, batch_size=500, **options):
+        sql, params = select_tasks_query(**options) if options else (SELECT_ALL_TASKS_BY_ID, ())
+        cursor = self._db_conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            cursor.close()
+
+
+    # The same tasks as select_tasks(), as Task objects instead of dictionaries.
+    #   Rows are read as plain tuples (no dictionary is made for each row) and
+    #   turned into Tasks all at once with Task.from_rows(). Use this when holding
+    #   on to many tasks, a Task takes about a third of the memory of a dictionary row.
+    #   Results are not cached. The ?fields= option does not apply, Tasks always
+    #   have every column.
+    def select_task_objects(self, **options):
+        sql, params = select_tasks_query(fields=TASK_COLUMNS, **options)
+        cursor = self._db_conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return Task.from_rows(cursor.fetchall())
+        finally:
+            cursor.close()
+
+
+    # Generator like iter_all_tasks() that yields lists of up to batch_size
+    #   (id, description, creation_datetime, completed) tuples, in id order.
+    #   Used to export the whole table (see utils/transfer.py).
+    def iter_task_rows(self, batch_size=500):
+        sql, params = select_tasks_query(fields=TASK_COLUMNS, sort="id")
+        cursor = self._db_conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                yield rows
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            cursor.close()
+
+
+    # Generator like iter_task_rows() that yields lists of up to batch_size Tasks
+    def iter_task_objects(self, batch_size=500):
+        for rows in self.iter_task_rows(batch_size):
+            yield Task.from_rows(rows)
+
+
+    # Tasks chosen and ordered by the database, see select_tasks_query() for the options
+    @read_through("list")
+    def select_tasks(self, **options):
+        return self._select_tasks(**options)
+
+
+    # The filtered queries are built for each request, so they are sent as text
+    #   rather than kept as prepared statements
+    def _select_tasks(self, **options):
+        sql, params = select_tasks_query(**options)
+        self._cursor.execute(sql, params)
         return self._cursor.fetchall()
 
 
+    @read_through("list")
     def select_all_tasks_by_description(self, description):
-        select_tasks_by_description = """
-            SELECT * from tasks WHERE description LIKE %s;
-        """
-        self._cursor.execute(select_tasks_by_description, (f"%{description}%",))
-        return self._cursor.fetchall()
+        return self._execute(SELECT_TASKS_BY_DESCRIPTION, (f"%{description}%",)).fetchall()
     
 
+    # Ranked search using the FULLTEXT index on description (see utils/db.py:init_db).
+    #   Every word in the search text also matches words that start with it, so
+    #   "mil" finds "Milk" and "Milkshakes". The best matches are returned first.
+    #
+    #   The index only knows about whole words of 3 or more letters, so when it finds
+    #   nothing we fall back to the (slower) substring search to keep finding text
+    #   that appears in the middle of a word.
+    #
+    #   The options of select_tasks() (filters, sort and fields) can be added.
+    @read_through("list")
+    def search_tasks(self, text, **options):
+        terms = fulltext_terms(text)
+        if terms is not None:
+            if options:
+                result = self._select_tasks(match=terms, **options)
+            else:
+                result = self._execute(SEARCH_TASKS, (terms, terms)).fetchall()
+            if result:
+                return result
+
+        if options:
+            return self._select_tasks(like=text, **options)
+        return self.select_all_tasks_by_description(text)
+
+
+    # One page of a search (options has the page's limit, after_id, ...).
+    #   Every page of a search must come from the same kind of search, or a later
+    #   page could switch to the substring search once the FULLTEXT matches run
+    #   out. So the first page (mode=None) picks "fulltext" or "like" the way
+    #   search_tasks() does, and the later pages are given that mode back.
+    #   Returns (mode, tasks).
+    @read_through("list")
+    def search_tasks_page(self, text, mode=None, **options):
+        terms = fulltext_terms(text)
+        if terms is None:
+            mode = "like"
+        if mode in (None, "fulltext"):
+            result = self._select_tasks(match=terms, **options)
+            if result or mode == "fulltext":
+                return "fulltext", result
+        return "like", self._select_tasks(like=text, **options)
+
+
+    # Returns the tasks table version: a counter that every TaskDB write adds one
+    #   to (see BUMP_TASKS_VERSION) and the (unix) time of that change. Reading
+    #   it is a primary key lookup on a one row table.
+    def select_tasks_version(self):
+        self._cursor.execute(SELECT_TASKS_VERSION)
+        version = self._cursor.fetchone()
+        self._version = version["version"]
+        return version
+
+
+    @read_through("task")
     def select_task_by_id(self, task_id):
-        select_task_by_id = """
-                SELECT * from tasks WHERE id = %s;
-        """
-        self._cursor.execute(select_task_by_id, (task_id,))
-        return self._cursor.fetchall()
+        return self._execute(SELECT_TASK_BY_ID, (task_id,)).fetchall()
+
 
+    # Insert a task and return its new id as {"task_id": id}.
+    #   The id comes back with the INSERT's reply (the cursor's lastrowid), so
+    #   there is no need for a separate SELECT LAST_INSERT_ID() round-trip.
+    #
+    #   With commit=False the insert is left in the open transaction so a caller
+    #   writing many tasks can commit them all at once with commit() below.
+    def insert_task(self, task, commit=True):
+        cursor = self._execute(INSERT_TASK, (task.description, task.creation_datetime, task.completed))
+        task_id = cursor.lastrowid
+        self._uncommitted_ids.append(task_id)
+        self._uncommitted_events.append(("created", task_event_data(task_id, task)))
+        if commit:
+            self.commit()
+        return {"task_id": task_id}
 
-    def insert_task(self, task):
-        insert_query = """
-            INSERT INTO tasks (description, creation_datetime, completed)
-            VALUES (%s, %s, %s);
-        """
 
-        self._cursor.execute(insert_query, (task.description, task.creation_datetime, task.completed))
-        self._cursor.execute("SELECT LAST_INSERT_ID() task_id")
-        task_id = self._cursor.fetchone()
+    # Commit the open transaction, then forget cached results for the tasks
+    #   written with commit=False (the cache must not be refreshed before the
+    #   changes are visible to other connections) and publish their events
+    def commit(self):
+        if self._uncommitted_ids:
+            self._execute(BUMP_TASKS_VERSION)
         self._db_conn.commit()
-        return task_id
+        task_ids, self._uncommitted_ids = self._uncommitted_ids, []
+        events, self._uncommitted_events = self._uncommitted_events, []
+        self._invalidate(task_ids)
+        self._publish(events)
 
 
-    def update_task(self, task_id, new_task):
-        update_query = """
-            UPDATE tasks
-            SET description=%s
-            WHERE id=%s;
-        """
-        self._cursor.execute(update_query, (new_task.description, task_id))
+    # Commit a write, adding one to the tasks version first
+    def _commit_with_version(self):
+        self._execute(BUMP_TASKS_VERSION)
         self._db_conn.commit()
 
+
+    def update_task(self, task_id, new_task):
+        self._execute(UPDATE_TASK, (new_task.description, task_id))
+        self._commit_with_version()
+        self._invalidate([task_id])
+        self._publish([("updated", {"id": task_id, "description": new_task.description})])
+
     def delete_task_by_id(self, task_id):
-        delete_query = """
-            DELETE from tasks
-            WHERE id=%s;
-        """
-        self._cursor.execute(delete_query, (task_id,))
-        self._db_conn.commit()
+        self._execute(SOFT_DELETE_TASK if self._soft_delete else DELETE_TASK, (task_id,))
+        self._commit_with_version()
+        self._invalidate([task_id])
+        self._publish([("deleted", {"id": task_id})])
+
+
+    # Insert many tasks in a single transaction and return their new ids.
+    #   Each chunk is sent as one multi-row INSERT ... VALUES (...), (...) statement.
+    #   MySQL hands out consecutive ids to the rows of a multi-row insert, and
+    #   lastrowid is the id of the first row, so we can work out every new id
+    #   without asking the database.
+    def insert_tasks(self, tasks):
+        tasks = list(tasks)
+        task_ids = []
+        try:
+            for chunk in chunked(tasks):
+                insert_query = insert_tasks_query(len(chunk))
+                params = []
+                for task in chunk:
+                    params.extend((task.description, task.creation_datetime, task.completed))
+
+                self._cursor.execute(insert_query, params)
+                first_id = self._cursor.lastrowid
+                task_ids.extend(range(first_id, first_id + len(chunk)))
+            self._commit_with_version()
+        except Exception:
+            # All or nothing: undo any chunks that were already inserted
+            self._db_conn.rollback()
+            raise
+        self._invalidate(task_ids)
+        self._publish(("created", task_event_data(task_id, task)) for task_id, task in zip(task_ids, tasks))
+        return task_ids
+
+
+    # Insert many tasks with ids that were handed out by reserve_task_ids(),
+    #   all or nothing in a single transaction. Used by the write-behind queue
+    #   (see utils/write_behind.py), which tells clients the ids up front.
+    def insert_tasks_with_ids(self, tasks, task_ids):
+        rows = list(zip(task_ids, tasks))
+        try:
+            for chunk in chunked(rows):
+                params = []
+                for task_id, task in chunk:
+                    params.extend((task_id, task.description, task.creation_datetime, task.completed))
+                self._cursor.execute(insert_tasks_with_ids_query(len(chunk)), params)
+            self._commit_with_version()
+        except Exception:
+            self._db_conn.rollback()
+            raise
+        self._invalidate([task_id for task_id, _ in rows])
+        self._publish(("created", task_event_data(task_id, task)) for task_id, task in rows)
+
+
+    # Reserve count consecutive task ids that AUTO_INCREMENT will never hand out
+    #   and return them as a range.
+    #   We insert count empty rows with one multi-row INSERT (which gets
+    #   consecutive ids, see insert_tasks) and roll them back. InnoDB never hands
+    #   out an AUTO_INCREMENT value again once it was used, even by a rolled back
+    #   insert, so the ids are ours. This only locks the new rows: other requests
+    #   keep reading and writing the table, and every other insert (including ones
+    #   made with the mysql client) still gets its id from AUTO_INCREMENT and
+    #   cannot take one of ours. Ids that are never used just leave a gap.
+    #
+    #   The rollback ends the open transaction, so call this on a connection
+    #   that is not in the middle of other work.
+    def reserve_task_ids(self, count):
+        try:
+            self._cursor.execute(reserve_task_ids_query(count))
+            first_id = self._cursor.lastrowid
+        finally:
+            self._db_conn.rollback()
+        return range(first_id, first_id + count)
+
+
+    # Update the descriptions of many tasks in a single transaction.
+    #   updates is a list of (task_id, new_task) pairs. Returns the number of
+    #   tasks that were changed.
+    def update_tasks(self, updates):
+        try:
+            self._cursor.executemany(UPDATE_TASK, [(task.description, task_id) for task_id, task in updates])
+            updated = self._cursor.rowcount
+            self._commit_with_version()
+        except Exception:
+            self._db_conn.rollback()
+            raise
+        self._invalidate([task_id for task_id, _ in updates])
+        self._publish(("updated", {"id": task_id, "description": task.description}) for task_id, task in updates)
+        return updated
+
+
+    # Delete many tasks in a single transaction with DELETE ... WHERE id IN (...)
+    #   (or UPDATE ... WHERE id IN (...) with soft_delete).
+    #   Returns the number of tasks that were deleted.
+    def delete_tasks(self, task_ids):
+        task_ids = list(task_ids)
+        query = soft_delete_tasks_query if self._soft_delete else delete_tasks_query
+        deleted = 0
+        try:
+            for chunk in chunked(task_ids):
+                delete_query = query(len(chunk))
+                self._cursor.execute(delete_query, chunk)
+                deleted += self._cursor.rowcount
+            self._commit_with_version()
+        except Exception:
+            self._db_conn.rollback()
+            raise
+        self._invalidate(task_ids)
+        self._publish(("deleted", {"id": task_id}) for task_id in task_ids)
+        return deleted
+
+
+    # Remove up to limit soft deleted tasks that were deleted at least older_than
+    #   seconds ago, in one short transaction. Returns the number removed.
+    #   The tasks already look deleted to every select, so nothing needs to be
+    #   invalidated or published. A MySQL lock lets only one process (of all the
+    #   gunicorn workers) purge at a time; the others return 0 without waiting.
+    def purge_deleted_tasks(self, limit=500, older_than=0):
+        self._cursor.execute("SELECT GET_LOCK(%s, 0) AS locked;", (COMPACTION_LOCK,))
+        if not self._cursor.fetchone()["locked"]:
+            return 0
+        try:
+            self._cursor.execute(PURGE_DELETED_TASKS, (older_than, limit))
+            purged = self._cursor.rowcount
+            self._db_conn.commit()
+        except Exception:
+            self._db_conn.rollback()
+            raise
+        finally:
+            self._cursor.execute("SELECT RELEASE_LOCK(%s) AS released;", (COMPACTION_LOCK,))
+            self._cursor.fetchone()
+        return purged
+
+
+    # How far behind purging is: {"pending": soft deleted tasks waiting to be
+    #   purged (counted up to count_limit), "lag_seconds": how long ago the oldest
+    #   of them was deleted (0 when there are none)}
+    def deleted_backlog(self, count_limit=100_000):
+        self._cursor.execute(SELECT_DELETED_BACKLOG, (count_limit,))
+        row = self._cursor.fetchone()
+        return {"pending": int(row["pending"]), "lag_seconds": float(row["lag_seconds"] or 0)}
@@ -0,0 +1,181 @@
+"""
+Caches used to avoid re-running the same database queries
+
+Both caches have the same methods so TaskDB can use either one:
+    * get(key) - the cached value, or None if it is missing or expired
+    * set(key, value) - store a value until it expires
+    * delete(key) - forget a value
+    * counter(key) / incr(key) - read / add one to a counter that never expires
+    * stats() - hit and miss counts for monitoring
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+# In-process cache that forgets the least recently used entry when it is full
+#   and treats entries older than ttl seconds as missing.
+#   Each worker process gets its own copy of this cache.
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=30):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        # Counters are kept apart from the entries so they are never evicted
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(key, None)
+                self._misses += 1
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+# Values shared through Redis are stored as JSON, never pickled: anyone who can
+#   write to the Redis server could otherwise make every worker run their code.
+#   Cached values are query results (lists and dicts of numbers, strings and
+#   datetimes), datetimes are stored as {"__datetime__": "2022-04-21T11:10:53"}.
+#   Tuples come back as lists.
+def encode_cache_value(value):
+    return json.dumps(value, default=_encode_datetime, separators=(",", ":"))
+
+
+def decode_cache_value(data):
+    return json.loads(data, object_hook=_decode_datetime)
+
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} values cannot be cached in Redis")
+
+
+def _decode_datetime(obj):
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+# Cache stored in Redis (or any server that speaks the Redis protocol) so that
+#   every worker process shares the same entries. client is a redis.Redis object.
+#   Values are stored as JSON (see encode_cache_value).
+class RedisCache:
+    def __init__(self, client, ttl=30, prefix="tasks-cache:"):
+        self._client = client
+        self._ttl = ttl
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+
+    def get(self, key):
+        value = self._client.get(self._prefix + key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return decode_cache_value(value)
+
+
+    def set(self, key, value):
+        self._client.set(self._prefix + key, encode_cache_value(value), ex=self._ttl)
+
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+
+    def counter(self, key):
+        return int(self._client.get(self._prefix + key) or 0)
+
+
+    def incr(self, key):
+        return self._client.incr(self._prefix + key)
+
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + "*"):
+            self._client.delete(key)
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "redis",
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+# Build the cache selected by the CACHE_BACKEND setting:
+#   * memory - LRUCache (the default)
+#   * redis - RedisCache connected to CACHE_REDIS_URL (requires: pip install redis)
+#   * none - no caching
+def create_cache(config):
+    backend = config.get("CACHE_BACKEND", "memory")
+
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return LRUCache(config.get("CACHE_MAX_ENTRIES", 1024), config.get("CACHE_TTL", 30))
+    if backend == "redis":
+        # Only needed for this backend, so it is imported here
+        import redis
+        return RedisCache(redis.Redis.from_url(config["CACHE_REDIS_URL"]), config.get("CACHE_TTL", 30))
+
+    raise ValueError(f"Unknown CACHE_BACKEND {backend}. Expected memory, redis or none")
@@ -0,0 +1,86 @@
+"""
+Background compaction of soft deleted tasks
+
+With SOFT_DELETE=1 deleting a task only sets its deleted_at column (see
+models/task.py:TaskDB), which is much cheaper than removing the row and its
+index entries while the request waits. The rows still take up space, so a
+background thread removes them later:
+
+    * a few tasks at a time (batch_size), each batch in its own short
+        transaction so other writers are never held up for long
+    * with interval seconds between batches, so a mass delete is purged at
+        most batch_size / interval tasks per second instead of all at once
+    * when there is nothing left to purge it checks again every idle_interval seconds
+
+How far behind it is (the tasks waiting and the age of the oldest one) is
+reported by stats() for the /stats/compaction and /metrics routes.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger("tasks.compaction")
+
+
+# Background thread that purges soft deleted tasks in small batches
+#   * compact(batch_size) - purges up to batch_size tasks and returns
+#       (tasks purged, tasks still waiting, seconds since the oldest waiting task was deleted)
+#   * batch_size - most tasks purged per transaction
+#   * interval - seconds to wait after a full batch, before purging the next one
+#   * idle_interval - seconds to wait once everything that can be purged is gone
+class Compactor:
+    def __init__(self, compact, batch_size=500, interval=1.0, idle_interval=30.0):
+        self._compact = compact
+        self._batch_size = batch_size
+        self._interval = interval
+        self._idle_interval = idle_interval
+        self._stop = threading.Event()
+
+        # Counters reported by stats()
+        self._pending = 0
+        self._lag_seconds = 0.0
+        self._purged = 0
+        self._batches = 0
+        self._errors = 0
+        self._batch_time_total = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="tasks-compaction", daemon=True)
+        self._thread.start()
+
+
+    # Background thread: purge a batch, then wait. A full batch means more tasks
+    #   are probably waiting, so the next batch comes sooner.
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._idle_interval
+            start = time.perf_counter()
+            try:
+                purged, self._pending, self._lag_seconds = self._compact(self._batch_size)
+            except Exception:
+                self._errors += 1
+                logger.warning("Purging soft deleted tasks failed", exc_info=True)
+            else:
+                if purged:
+                    self._purged += purged
+                    self._batches += 1
+                    self._batch_time_total += time.perf_counter() - start
+                if purged >= self._batch_size:
+                    wait = self._interval
+            self._stop.wait(wait)
+
+
+    # Stop the background thread, a batch being purged is finished first
+    def close(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+    def stats(self):
+        return {
+            "pending": self._pending,
+            "lag_seconds": self._lag_seconds,
+            "purged": self._purged,
+            "batches": self._batches,
+            "errors": self._errors,
+            "batch_time_avg_ms": self._batch_time_total / self._batches * 1000 if self._batches else 0.0,
+        }
@@ -1,43 +1,281 @@
 """
 Collection of functions to help establish the database
 """
-import mysql.connector
+import threading
+import time
+from collections import deque
+
+from utils.migrations import migrate
 
 
 # Connect to MySQL and the task database
-def connect_db(config):
+#   mysql.connector is imported here rather than at the top of the file because
+#   loading it takes a noticeable part of the app's start up time (see
+#   `flask profile-startup`), and it is not needed until the first connection.
+#   Python only loads a module once, later imports just look it up.
+#   options are passed on to mysql.connector.connect() (like allow_local_infile=True)
+def connect_db(config, **options):
+    import mysql.connector
+
     conn = mysql.connector.connect(
         host=config["DBHOST"],
         user=config["DBUSERNAME"],
         password=config["DBPASSWORD"],
-        database=config["DATABASE"]
+        database=config["DATABASE"],
+        **options
     )
     return conn
 
 
-# Setup for the Database
-#   Will erase the database if it exists
-def init_db(config):
-    conn = mysql.connector.connect(
+# Raised when no connection becomes available before the checkout timeout
+class PoolTimeoutError(Exception):
+    pass
+
+
+# Thread-safe pool of MySQL connections
+#   Opening a connection costs a full TCP + authentication handshake with the
+#   MySQL server, so instead of connecting for every request we keep a few
+#   connections open and lend them out (acquire) and take them back (release).
+#
+#   * size - number of connections kept open while idle
+#   * max_overflow - extra connections allowed under load, closed on release
+#   * idle_timeout - seconds an idle connection may sit before it is replaced
+#   * checkout_timeout - seconds to wait for a connection before giving up
+#   * connect - function used to open a new connection (defaults to connect_db)
+class ConnectionPool:
+    def __init__(self, config, size=5, max_overflow=10, idle_timeout=300,
+                 checkout_timeout=30, connect=connect_db):
+        self._config = config
+        self._size = size
+        self._max_overflow = max_overflow
+        self._idle_timeout = idle_timeout
+        self._checkout_timeout = checkout_timeout
+        self._connect = connect
+
+        # Idle connections are stored with the time they were returned so we
+        #   can tell how long they have been sitting unused
+        self._idle = deque()
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+        # Counters reported by stats()
+        self._checkouts = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+        self._opened = 0
+        self._discarded = 0
+
+
+    @property
+    def capacity(self):
+        return self._size + self._max_overflow
+
+
+    # Lend a connection out of the pool, opening a new one if needed
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = time.monotonic() + self._checkout_timeout
+
+        while True:
+            conn, last_used = self._reserve(deadline)
+
+            if conn is None:
+                # _reserve() counted us as in use, so open the connection
+                #   outside of the lock to avoid blocking other threads
+                try:
+                    conn = self._connect(self._config)
+                except Exception:
+                    self._forget()
+                    raise
+                with self._lock:
+                    self._opened += 1
+                break
+
+            # Health-check on checkout: replace connections that sat idle too
+            #   long or that the server has dropped in the meantime
+            if time.monotonic() - last_used > self._idle_timeout or not self._is_healthy(conn):
+                self._discard(conn)
+                self._forget()
+                continue
+            break
+
+        self._record_checkout(time.perf_counter() - start)
+        return conn
+
+
+    # Take a connection back from a borrower
+    def release(self, conn):
+        # Never hand the next borrower a half finished transaction
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            self._forget()
+            return
+
+        with self._lock:
+            self._in_use -= 1
+            keep = not self._closed and len(self._idle) < self._size
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+        # Overflow connections (or those returned after close()) are shut down
+        if not keep:
+            self._discard(conn)
+
+
+    # Fill the pool with size open connections before they are needed, so the
+    #   first requests do not each wait for a new connection. setup(conn), when
+    #   given, is run on every connection (like preparing statements).
+    #   Returns the number of connections that were set up.
+    def warm(self, setup=None):
+        with self._lock:
+            count = max(self._size - self._in_use, 0)
+
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(self.acquire())
+            if setup is not None:
+                for conn in conns:
+                    setup(conn)
+        finally:
+            for conn in conns:
+                self.release(conn)
+        return len(conns)
+
+
+    # Close all idle connections and refuse to keep any more
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._lock.notify_all()
+
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+    # Snapshot of the pool's counters for monitoring
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self._size,
+                "max_overflow": self._max_overflow,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "checkouts": checkouts,
+                "checkout_time_avg_ms": (self._checkout_time_total / checkouts * 1000) if checkouts else 0.0,
+                "checkout_time_max_ms": self._checkout_time_max * 1000,
+                "connections_opened": self._opened,
+                "connections_discarded": self._discarded,
+            }
+
+
+    # Either pop an idle connection or reserve the right to open a new one.
+    #   Returns (None, None) when the caller should open a new connection.
+    def _reserve(self, deadline):
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool has been closed")
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use += 1
+                    return conn, last_used
+
+                if self._in_use < self.capacity:
+                    self._in_use += 1
+                    return None, None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self._checkout_timeout} seconds"
+                    )
+
+                self._waiters += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+
+    # Give back a reservation for a connection that is no longer usable
+    def _forget(self):
+        with self._lock:
+            self._in_use -= 1
+            self._lock.notify()
+
+
+    def _record_checkout(self, elapsed):
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+
+
+    def _discard(self, conn):
+        with self._lock:
+            self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+
+# Connect to the MySQL server without choosing a database
+def connect_server(config):
+    import mysql.connector
+
+    return mysql.connector.connect(
         host=config["DBHOST"],
         user=config["DBUSERNAME"],
         password=config["DBPASSWORD"]
     )
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute(f"DROP DATABASE IF EXISTS {config['DATABASE']};")
-    cursor.execute(f"CREATE DATABASE {config['DATABASE']};")
+
+
+# Setup for the Database
+#   Creates the database if it does not exist yet and applies any schema
+#   migrations it is missing (see utils/migrations.py). Existing tasks are kept.
+#   Returns the (version, name) of each migration that was applied.
+def init_db(config, target=None):
+    conn = connect_server(config)
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {config['DATABASE']};")
     cursor.execute(f"use {config['DATABASE']};")
-    cursor.execute(
-        f""" 
-        CREATE TABLE tasks
-        (
-            id SMALLINT UNSIGNED AUTO_INCREMENT NOT NULL,
-            description VARCHAR(50),
-            creation_datetime timestamp,
-            completed TINYINT(1),
-            CONSTRAINT pk_todo PRIMARY KEY (id)
-        );
-        """
-    )
+    cursor.close()
+    try:
+        return migrate(conn, target)
+    finally:
+        conn.close()
+
+
+# Erase the database and set it up again from scratch (used by the tests and benchmarks)
+def reset_db(config, target=None):
+    drop_db(config)
+    return init_db(config, target)
+
+
+# Removes the database and every table in it
+def drop_db(config):
+    conn = connect_server(config)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {config['DATABASE']};")
     cursor.close()
     conn.close()
@@ -0,0 +1,150 @@
+"""
+Change feed for the tasks table
+
+TaskDB publishes an event to an EventLog every time it commits a change to a
+task (see models/task.py). The /api/v1/tasks/stream route sends those events to
+clients as Server-Sent Events, so a page can keep its task list up to date
+without asking for the whole list again every few seconds.
+
+The log only keeps the newest max_events events. A client that reconnects with
+the id of the last event it saw (the Last-Event-ID header that browsers send by
+themselves) is sent everything it missed, as long as it is still in the log.
+Otherwise it is told to reload the full list.
+
+Each process has its own log, so a client only hears about changes made by the
+process it is connected to (see the README and gunicorn.conf.py). Every open
+stream also holds one of the process's threads, so at most max_streams are
+kept open at once.
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+
+
+# One change to the tasks table. id is the event's position in the log,
+#   kind is "created", "updated" or "deleted" and data describes the task
+class TaskEvent:
+    def __init__(self, id, kind, data):
+        self.id = id
+        self.kind = kind
+        self.data = data
+
+
+# Bounded in-memory log of task events that streams can wait on.
+#   max_streams is the most streams open at once (0 for no limit).
+class EventLog:
+    def __init__(self, max_events=1000, max_streams=0):
+        self._events = deque(maxlen=max_events)
+        self._ids = itertools.count(1)
+        self._changed = threading.Condition()
+        self._closed = False
+        # Event ids start again at 1 when the process restarts, so every id sent
+        #   to a client also names the log it came from (see event_id below).
+        #   An id from an older log means the client may have missed events.
+        self.log_id = uuid.uuid4().hex[:8]
+        self._published = 0
+        self._max_streams = max_streams
+        self._streams = 0
+        self._rejected_streams = 0
+
+
+    # Add an event for every client that is listening and return its id
+    def publish(self, kind, data):
+        with self._changed:
+            event = TaskEvent(next(self._ids), kind, data)
+            self._events.append(event)
+            self._published += 1
+            self._changed.notify_all()
+        return event.id
+
+
+    # The id a client sees for a position: "<log id>-<position>", for example "3f2a9c1d-42"
+    def event_id(self, position):
+        return f"{self.log_id}-{position}"
+
+
+    # Turn a client's Last-Event-ID back into a position in this log.
+    #   Returns None when the id is missing, malformed or not from this log.
+    def position(self, last_event_id):
+        log_id, _, number = (last_event_id or "").partition("-")
+        if log_id != self.log_id or not number.isdigit():
+            return None
+        with self._changed:
+            return int(number) if int(number) <= self._published else None
+
+
+    # Position of the newest event, new streams start from here
+    def last_position(self):
+        with self._changed:
+            return self._events[-1].id if self._events else 0
+
+
+    # Events after position. Returns (events, complete) where complete is False
+    #   when some of the events after position have already been dropped from the log.
+    def events_after(self, position):
+        with self._changed:
+            return self._events_after(position)
+
+
+    def _events_after(self, position):
+        if not self._events:
+            return [], True
+        first = self._events[0].id
+        if position < first - 1:
+            return list(self._events), False
+        return [event for event in self._events if event.id > position], True
+
+
+    # Block until there are events after position or timeout seconds have passed
+    def wait(self, position, timeout):
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not self._closed:
+                events, complete = self._events_after(position)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events, complete
+                self._changed.wait(remaining)
+            return [], True
+
+
+    # Count a new stream. Returns False when max_streams are already open, the
+    #   caller must call close_stream() once a stream it was allowed is finished.
+    def open_stream(self):
+        with self._changed:
+            if self._max_streams and self._streams >= self._max_streams:
+                self._rejected_streams += 1
+                return False
+            self._streams += 1
+            return True
+
+
+    def close_stream(self):
+        with self._changed:
+            self._streams -= 1
+
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+    # Wake every waiting stream so it can finish (when the process shuts down)
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+    def stats(self):
+        with self._changed:
+            return {
+                "events": len(self._events),
+                "max_events": self._events.maxlen,
+                "published": self._published,
+                "streams": self._streams,
+                "max_streams": self._max_streams,
+                "rejected_streams": self._rejected_streams,
+            }
@@ -0,0 +1,65 @@
+"""
+Caching of rendered HTML fragments for the task list pages
+
+The task list (templates/index.html) is made of one table row per task, each
+rendered from templates/_task_row.html. Most rows look the same from one page
+view to the next, so each rendered row is kept in a cache (utils/cache.py:LRUCache)
+and only rows that are new or have changed are rendered again.
+
+A row is cached under the task id and the version of the row: the values the
+row template shows. When a task changes its row gets a new key, so a cached row
+never needs to be thrown away when the task changes; old versions simply fall out
+of the cache once they are the least recently used.
+"""
+from markupsafe import Markup
+
+from utils.cache import LRUCache
+
+# Template rendered for each row of the task list
+TASK_ROW_TEMPLATE = "_task_row.html"
+
+
+def create_fragment_cache(config):
+    if config["FRAGMENT_CACHE_MAX_ENTRIES"] <= 0:
+        return None
+    return LRUCache(max_entries=config["FRAGMENT_CACHE_MAX_ENTRIES"], ttl=config["FRAGMENT_CACHE_TTL"])
+
+
+# Cache key of a task's row. Works with the dictionary rows TaskDB returns.
+def row_key(task):
+    return ("task-row", task["id"], task["description"], task["completed"])
+
+
+# The rendered HTML of every task's row, joined into one piece of HTML.
+#   template is the compiled row template (app.jinja_env.get_template(TASK_ROW_TEMPLATE)),
+#   rendered directly rather than through render_template() because it is only a
+#   piece of a page.
+def render_task_rows(template, tasks, cache=None):
+    rows = []
+    for task in tasks:
+        key = row_key(task)
+        row = cache.get(key) if cache is not None else None
+        if row is None:
+            # Markup marks the row as safe HTML so index.html does not escape it again
+            row = Markup(template.render(task=task))
+            if cache is not None:
+                cache.set(key, row)
+        rows.append(row)
+    # One string for index.html, rather than a loop over thousands of rows in the template
+    return Markup("\n".join(rows))
+
+
+# Same as render_task_rows() for Quart (see views/async_task_view.py), whose
+#   templates can only be rendered with await
+async def render_task_rows_async(template, tasks, cache=None):
+    rows = []
+    for task in tasks:
+        key = row_key(task)
+        row = cache.get(key) if cache is not None else None
+        if row is None:
+            row = Markup(await template.render_async(task=task))
+            if cache is not None:
+                cache.set(key, row)
+        rows.append(row)
+    # One string for index.html, rather than a loop over thousands of rows in the template
+    return Markup("\n".join(rows))
@@ -0,0 +1,261 @@
+"""
+Request and SQL instrumentation for the tasks app
+
+    * RequestTimings - how long the current request spent connecting to the
+        database, running SQL and serializing JSON
+    * InstrumentedConnection / InstrumentedCursor - wrap a MySQL connection so
+        every statement is timed, counted and logged when slow
+    * TimedJSONProvider - wraps the app's JSON provider to time serialization
+    * Metrics - in-process counters and histograms rendered in the Prometheus
+        text format for the /metrics route
+
+Each worker process keeps its own metrics, Prometheus adds them up when it
+scrapes every worker.
+"""
+import logging
+import threading
+import time
+
+from flask import g, has_request_context
+from flask.json.provider import JSONProvider
+
+slow_query_logger = logging.getLogger("tasks.sql")
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+# Time spent in each phase of a single request, kept on flask.g
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connect = 0.0
+        self.query = 0.0
+        self.serialize = 0.0
+        self.statements = 0
+
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+# Add time to a phase of the current request (if there is one)
+def record_phase(phase, elapsed):
+    timings = g.get("timings") if has_request_context() else None
+    if timings is not None:
+        setattr(timings, phase, getattr(timings, phase) + elapsed)
+
+
+# Count a SQL statement for the current request (if there is one)
+def record_statement():
+    timings = g.get("timings") if has_request_context() else None
+    if timings is not None:
+        timings.statements += 1
+
+
+# Thread-safe store of counters and histograms
+class Metrics:
+    def __init__(self, slow_query_seconds=0.2):
+        self.slow_query_seconds = slow_query_seconds
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            key = (name, tuple(labels))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+
+    def observe(self, name, value, labels=(), buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            key = (name, tuple(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+
+    # Count a finished SQL statement and log it when slow
+    def record_query(self, sql, elapsed):
+        self.inc("tasks_sql_statements_total")
+        self.observe("tasks_sql_statement_seconds", elapsed)
+
+        if elapsed >= self.slow_query_seconds:
+            self.inc("tasks_sql_slow_statements_total")
+            slow_query_logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(sql.split()))
+
+
+    # Prometheus text exposition format
+    #   extra_gauges is a list of (name, help text, labels, value) measured at scrape time
+    def render(self, extra_gauges=()):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        described = set()
+
+        def header(name, kind, text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            kind, text = self._help.get(name, ("counter", name))
+            header(name, kind, text)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            kind, text = self._help.get(name, ("histogram", name))
+            header(name, kind, text)
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+        for name, text, labels, value in extra_gauges:
+            header(name, "gauge", text)
+            lines.append(f"{name}{format_labels(tuple(labels))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Wraps a MySQL cursor so every statement and fetch is timed
+#   For unbuffered cursors the rows are read from the server while fetching,
+#   so fetch time counts towards the statement that produced the rows.
+class InstrumentedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._sql = None
+        self._elapsed = 0.0
+
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+
+    # Record the previous statement once all of its time is known
+    def _finish_statement(self):
+        if self._sql is not None:
+            self._metrics.record_query(self._sql, self._elapsed)
+            self._sql = None
+            self._elapsed = 0.0
+
+
+    def _timed(self, function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._elapsed += elapsed
+            record_phase("query", elapsed)
+
+
+    def execute(self, operation, params=(), *args, **kwargs):
+        self._finish_statement()
+        self._sql = operation
+        record_statement()
+        return self._timed(self._cursor.execute, operation, params, *args, **kwargs)
+
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._finish_statement()
+        self._sql = operation
+        record_statement()
+        return self._timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, *args, **kwargs)
+
+
+    def fetchall(self):
+        try:
+            return self._timed(self._cursor.fetchall)
+        finally:
+            self._finish_statement()
+
+
+    def close(self):
+        self._finish_statement()
+        return self._cursor.close()
+
+
+# Wraps a MySQL connection so that every cursor it creates is instrumented.
+#   The pool keeps the wrapper for the life of the connection, so anything that
+#   remembers the connection (or its cursors) between requests still gets timed.
+class InstrumentedConnection:
+    def __init__(self, conn, metrics):
+        self._conn = conn
+        self._metrics = metrics
+
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._metrics)
+
+
+# Wraps the app's JSON provider (app.json) to time serialization
+class TimedJSONProvider(JSONProvider):
+    def __init__(self, app, provider):
+        super().__init__(app)
+        self._provider = provider
+
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._provider.dumps(obj, **kwargs)
+        finally:
+            record_phase("serialize", time.perf_counter() - start)
+
+
+    def loads(self, s, **kwargs):
+        return self._provider.loads(s, **kwargs)
+
+
+    # The wrapped provider builds the response itself, so its output (compact,
+    #   or indented in debug mode) is the same with or without the metrics
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._provider.response(*args, **kwargs)
+        finally:
+            record_phase("serialize", time.perf_counter() - start)
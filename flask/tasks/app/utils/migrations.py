@@ -0,0 +1,295 @@
+"""
+Versioned schema migrations for the task database
+
+Every change to the schema is a numbered migration function below. The
+schema_migrations table records the migrations a database has already had, so
+migrate() only runs the new ones, in order. Each migration also checks the
+schema before changing it, so databases created before this table existed (by
+the old init_db) are brought up to date without errors.
+
+Migrations are written to run while the app keeps serving requests:
+    * indexes are added with ALGORITHM=INPLACE, LOCK=NONE so reads and writes continue
+    * column type changes use copy_table_online(), which fills a new copy of the
+        table in small chunks and swaps it in with a single RENAME TABLE
+    * nullable columns are added with ALGORITHM=INSTANT, which leaves the rows alone
+    * the one exception is the FULLTEXT index (migration 5), which holds up
+        writes (not reads) while it is built
+
+    $ flask migrate            (or flask initdb) - apply every new migration
+    $ flask migrate --to 2     - stop after migration 2
+"""
+import logging
+import re
+import time
+
+logger = logging.getLogger("tasks.migrations")
+
+# Name of the MySQL lock held while migrating, so two processes (like several
+#   gunicorn workers starting at once) never run the same migration twice
+MIGRATION_LOCK = "tasks_schema_migrations"
+
+# Rows copied per transaction by copy_table_online()
+COPY_CHUNK_SIZE = 10_000
+
+# (version, name, function) for every migration, filled in by @migration
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def decorator(function):
+        MIGRATIONS.append((version, name, function))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return function
+    return decorator
+
+
+# information_schema column names are given aliases because MySQL 8 returns
+#   them in upper case
+def column_type(cursor, table, column):
+    cursor.execute(
+        """
+        SELECT data_type AS data_type FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s;
+        """,
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row["data_type"].lower() if row else None
+
+
+def index_exists(cursor, table, index):
+    cursor.execute(
+        """
+        SELECT COUNT(*) AS found FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s;
+        """,
+        (table, index)
+    )
+    return cursor.fetchone()["found"] > 0
+
+
+def table_columns(cursor, table):
+    cursor.execute(
+        """
+        SELECT column_name AS column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s ORDER BY ordinal_position;
+        """,
+        (table,)
+    )
+    return [row["column_name"] for row in cursor.fetchall()]
+
+
+# The id the table's AUTO_INCREMENT will hand out next.
+#   SHOW CREATE TABLE leaves out AUTO_INCREMENT until the first insert.
+def next_auto_increment(cursor, table):
+    cursor.execute(f"SHOW CREATE TABLE {table};")
+    match = re.search(r"AUTO_INCREMENT=(\d+)", cursor.fetchone()["Create Table"])
+    return int(match.group(1)) if match else 1
+
+
+# Change a table without locking it for the whole change (like pt-online-schema-change).
+#   1. Create an empty copy of the table and apply `alter` to the copy
+#   2. Add triggers so every insert, update and delete on the table is repeated on the copy
+#   3. Copy the existing rows chunk_size ids at a time, one short transaction per chunk
+#       (rows the triggers already copied are skipped)
+#   4. Swap the tables with one atomic RENAME TABLE and drop the old one
+#
+#   Requests keep reading and writing the table until the rename, which only waits
+#   for the transactions using the table at that moment. Triggers of the caller's
+#   own on the table would be dropped along with the old table.
+def copy_table_online(conn, cursor, table, alter, chunk_size=COPY_CHUNK_SIZE):
+    new_table = f"{table}_new"
+    old_table = f"{table}_old"
+    events = ("insert", "update", "delete")
+
+    # Clean up after a copy that was interrupted
+    for event in events:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_copy_after_{event};")
+    cursor.execute(f"DROP TABLE IF EXISTS {new_table};")
+
+    cursor.execute(f"CREATE TABLE {new_table} LIKE {table};")
+    cursor.execute(f"ALTER TABLE {new_table} {alter};")
+
+    column_names = table_columns(cursor, table)
+    columns = ", ".join(column_names)
+    new_values = ", ".join(f"NEW.{column}" for column in column_names)
+    cursor.execute(
+        f"""
+        CREATE TRIGGER {table}_copy_after_insert AFTER INSERT ON {table} FOR EACH ROW
+            REPLACE INTO {new_table} ({columns}) VALUES ({new_values});
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER {table}_copy_after_update AFTER UPDATE ON {table} FOR EACH ROW
+            REPLACE INTO {new_table} ({columns}) VALUES ({new_values});
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER {table}_copy_after_delete AFTER DELETE ON {table} FOR EACH ROW
+            DELETE FROM {new_table} WHERE id = OLD.id;
+        """
+    )
+
+    cursor.execute(f"SELECT MIN(id) AS low, MAX(id) AS high FROM {table};")
+    bounds = cursor.fetchone()
+    if bounds["low"] is not None:
+        start = time.perf_counter()
+        copied_to = bounds["low"]
+        while copied_to <= bounds["high"]:
+            # LOCK IN SHARE MODE makes a delete of a row we are copying wait
+            #   until the row is in the copy, so its trigger can remove it there
+            cursor.execute(
+                f"""
+                INSERT IGNORE INTO {new_table} ({columns})
+                SELECT {columns} FROM {table} WHERE id >= %s AND id < %s LOCK IN SHARE MODE;
+                """,
+                (copied_to, copied_to + chunk_size)
+            )
+            conn.commit()
+            copied_to += chunk_size
+            logger.info("Copied %s up to id %d of %d (%.0f s)", table, copied_to - 1,
+                        bounds["high"], time.perf_counter() - start)
+
+    # Ids must keep going up from where the table is, including ids reserved by
+    #   the write-behind queue. Leave a gap for inserts that happen before the
+    #   rename, the AUTO_INCREMENT is corrected again right after it.
+    cursor.execute(f"ALTER TABLE {new_table} AUTO_INCREMENT = {next_auto_increment(cursor, table) + chunk_size};")
+    cursor.execute(f"RENAME TABLE {table} TO {old_table}, {new_table} TO {table};")
+    cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {next_auto_increment(cursor, old_table)};")
+    cursor.execute(f"DROP TABLE {old_table};")
+
+
+@migration(1, "Create the tasks and tasks_version tables")
+def create_tasks_tables(conn, cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tasks
+        (
+            id SMALLINT UNSIGNED AUTO_INCREMENT NOT NULL,
+            description VARCHAR(50),
+            creation_datetime timestamp,
+            completed TINYINT(1),
+            CONSTRAINT pk_todo PRIMARY KEY (id),
+            FULLTEXT INDEX ft_tasks_description (description)
+        );
+        """
+    )
+
+    # One row table holding a counter that TaskDB adds one to in every transaction
+    #   that changes tasks (see models/task.py:BUMP_TASKS_VERSION).
+    #   The API uses it to build ETags (see api/task_api.py:get_tasks).
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tasks_version
+        (
+            id TINYINT UNSIGNED NOT NULL,
+            version BIGINT UNSIGNED NOT NULL,
+            updated_at TIMESTAMP(6) NOT NULL,
+            CONSTRAINT pk_tasks_version PRIMARY KEY (id)
+        );
+        """
+    )
+    cursor.execute("INSERT IGNORE INTO tasks_version (id, version, updated_at) VALUES (1, 0, NOW(6));")
+
+
+# A SMALLINT UNSIGNED id runs out after 65,535 tasks (ever, deleted ones count)
+@migration(2, "Widen tasks.id to BIGINT and tasks.description to VARCHAR(255)")
+def widen_task_columns(conn, cursor):
+    if column_type(cursor, "tasks", "id") == "bigint":
+        return
+
+    copy_table_online(
+        conn, cursor, "tasks",
+        "MODIFY id BIGINT UNSIGNED AUTO_INCREMENT NOT NULL, MODIFY description VARCHAR(255)"
+    )
+
+
+# Filtering and sorting by ?created_after=, ?created_before=, ?completed= and
+#   ?sort=creation_datetime (see models/task.py:select_tasks_query).
+#   InnoDB adds the id to every index, so ties in the sort are ordered too.
+@migration(3, "Index tasks.creation_datetime and tasks.completed")
+def add_task_indexes(conn, cursor):
+    indexes = {
+        "ix_tasks_creation_datetime": "creation_datetime",
+        "ix_tasks_completed_creation_datetime": "completed, creation_datetime",
+    }
+    for name, columns in indexes.items():
+        if not index_exists(cursor, "tasks", name):
+            cursor.execute(f"ALTER TABLE tasks ADD INDEX {name} ({columns}), ALGORITHM=INPLACE, LOCK=NONE;")
+
+
+# Soft deletes (see models/task.py:TaskDB) flag a task by setting deleted_at.
+#   ALGORITHM=INSTANT adds a nullable column by changing only the table's
+#   metadata, so no rows are rewritten however big the table is. The index lets
+#   the compactor find the flagged tasks, oldest first, without a table scan.
+@migration(4, "Add tasks.deleted_at for soft deletes")
+def add_task_deleted_at(conn, cursor):
+    if column_type(cursor, "tasks", "deleted_at") is None:
+        cursor.execute("ALTER TABLE tasks ADD COLUMN deleted_at TIMESTAMP(6) NULL DEFAULT NULL, ALGORITHM=INSTANT;")
+    if not index_exists(cursor, "tasks", "ix_tasks_deleted_at"):
+        cursor.execute("ALTER TABLE tasks ADD INDEX ix_tasks_deleted_at (deleted_at, id), ALGORITHM=INPLACE, LOCK=NONE;")
+
+
+# ?search= uses a FULLTEXT index (see models/task.py:TaskDB.search_tasks), but
+#   migration 1 only creates it with a new tasks table. A tasks table made by
+#   the old init_db never had one, so without this every search there falls
+#   back to the LIKE scan. Building the first FULLTEXT index of a table adds a
+#   hidden FTS_DOC_ID column, which rebuilds the table: reads continue, but
+#   writes wait until it is done (LOCK=SHARED), so run it when traffic is low.
+@migration(5, "Add the FULLTEXT index on tasks.description")
+def add_task_fulltext_index(conn, cursor):
+    if not index_exists(cursor, "tasks", "ft_tasks_description"):
+        cursor.execute(
+            "ALTER TABLE tasks ADD FULLTEXT INDEX ft_tasks_description (description), ALGORITHM=INPLACE, LOCK=SHARED;"
+        )
+
+
+def applied_migrations(cursor):
+    cursor.execute("SELECT version FROM schema_migrations;")
+    return {row["version"] for row in cursor.fetchall()}
+
+
+# Apply every migration that has not been applied yet, up to version `target`
+#   (all of them when None). conn must already be using the task database.
+#   Returns the (version, name) of each migration that was applied.
+def migrate(conn, target=None):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT GET_LOCK(%s, 60) AS locked;", (MIGRATION_LOCK,))
+    if not cursor.fetchone()["locked"]:
+        cursor.close()
+        raise RuntimeError("Timed out waiting for another process to finish migrating the database")
+
+    applied = []
+    try:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations
+            (
+                version INT UNSIGNED NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+                CONSTRAINT pk_schema_migrations PRIMARY KEY (version)
+            );
+            """
+        )
+        done = applied_migrations(cursor)
+
+        for version, name, function in MIGRATIONS:
+            if version in done or (target is not None and version > target):
+                continue
+
+            logger.info("Applying migration %d: %s", version, name)
+            start = time.perf_counter()
+            function(conn, cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+            conn.commit()
+            logger.info("Applied migration %d in %.1f s", version, time.perf_counter() - start)
+            applied.append((version, name))
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s) AS released;", (MIGRATION_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+
+    return applied
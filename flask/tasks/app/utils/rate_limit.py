@@ -0,0 +1,268 @@
+"""
+Rate limiting and admission control for requests that use the database
+
+Two checks run before a request borrows a database connection (see
+main_app.py:before):
+
+    * RateLimiter - a token bucket for each client and endpoint. A bucket holds
+        up to `burst` tokens and gains `rate` tokens per second; each request
+        takes one. A client that runs out is answered 429 Too Many Requests with
+        a Retry-After header saying when its next token arrives.
+    * ConcurrencyLimiter - caps the requests using the database at the same time
+        in this process. A request waits at most `timeout` seconds for a free slot,
+        then is answered 503 Service Unavailable so a burst is turned away quickly
+        instead of piling up waiting for connections.
+
+The buckets are kept in one of two stores, which have the same methods:
+
+    * MemoryBuckets - in this process only, each worker process limits on its own
+    * SQLiteBuckets - in a SQLite file on this computer, shared by every worker
+        process (like gunicorn's), so a client gets the same limit however many
+        workers there are
+"""
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+# Work out a bucket's tokens at `now` from what it held at `updated`, then take
+#   one token if there is one. Returns (tokens left, seconds until the next token
+#   or 0 when a token was taken).
+def take_token(tokens, updated, now, rate, burst):
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+# Token buckets kept in memory. Only the max_keys most recently used buckets are
+#   kept; a bucket that is dropped starts again full.
+class MemoryBuckets:
+    def __init__(self, max_keys=100_000):
+        self._max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    # Take a token from key's bucket. Returns 0 when the request may go ahead,
+    #   otherwise the seconds until it may try again.
+    def take(self, key, rate, burst, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, retry_after = take_token(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "buckets": len(self._buckets)}
+
+
+# Token buckets kept in a SQLite file so every process on this computer shares them.
+#   Each take is one short write transaction (BEGIN IMMEDIATE), so two processes
+#   never take the same token. The file uses write-ahead logging, so takes do not
+#   wait for readers. Buckets not used for stale_seconds are deleted now and then.
+class SQLiteBuckets:
+    def __init__(self, path, stale_seconds=3600, prune_every=10_000):
+        self._path = path
+        self._stale_seconds = stale_seconds
+        self._prune_every = prune_every
+        self._local = threading.local()
+        self._takes = 0
+        self._connect().execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets
+            (
+                key TEXT NOT NULL PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+
+
+    # One connection per thread, as a sqlite3 connection is not thread safe.
+    #   A process forked after the connection was opened (like a gunicorn worker)
+    #   opens a new one rather than sharing its parent's.
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None leaves the transactions to us
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+    # Same as MemoryBuckets.take(). The time is the wall clock, which is the same
+    #   for every process.
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?;", (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            tokens, retry_after = take_token(tokens, updated, now, rate, burst)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?);", (key, tokens, now))
+
+            self._takes += 1
+            if self._takes % self._prune_every == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?;", (now - self._stale_seconds,))
+            conn.execute("COMMIT;")
+        except Exception:
+            conn.execute("ROLLBACK;")
+            raise
+        return retry_after
+
+
+    def clear(self):
+        self._connect().execute("DELETE FROM buckets;")
+
+
+    def stats(self):
+        return {
+            "backend": "sqlite",
+            "buckets": self._connect().execute("SELECT COUNT(*) FROM buckets;").fetchone()[0],
+        }
+
+
+# Parse per endpoint limits written as "endpoint=rate/burst,endpoint=rate/burst"
+#   (like RATE_LIMIT_ENDPOINTS in .env) into {endpoint: (rate, burst)}
+def parse_endpoint_limits(text):
+    limits = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        endpoint, _, limit = item.partition("=")
+        rate, _, burst = limit.partition("/")
+        # A bucket smaller than one token would refuse every request
+        limits[endpoint.strip()] = (float(rate), max(1.0, float(burst or rate)))
+    return limits
+
+
+# Token bucket limits for each client and endpoint
+#   * buckets - MemoryBuckets or SQLiteBuckets
+#   * rate / burst - the limit of every endpoint not in endpoint_limits
+#       (a rate of 0 leaves those endpoints unlimited)
+#   * endpoint_limits - {endpoint: (rate, burst)} for endpoints with limits of their own
+class RateLimiter:
+    def __init__(self, buckets, rate=0, burst=0, endpoint_limits=None):
+        self._buckets = buckets
+        self._default = (rate, max(burst, 1))
+        self._endpoint_limits = endpoint_limits or {}
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._limited = 0
+
+
+    # Take a token for one request. Returns 0 when the request may go ahead,
+    #   otherwise the seconds until the client may try again.
+    def check(self, client, endpoint, now=None):
+        rate, burst = self._endpoint_limits.get(endpoint, self._default)
+        retry_after = self._buckets.take(f"{client} {endpoint}", rate, burst, now) if rate > 0 else 0
+        with self._lock:
+            if retry_after:
+                self._limited += 1
+            else:
+                self._allowed += 1
+        return retry_after
+
+
+    def clear(self):
+        self._buckets.clear()
+
+
+    def stats(self):
+        with self._lock:
+            return {**self._buckets.stats(), "allowed": self._allowed, "limited": self._limited}
+
+
+# Caps the requests using the database at the same time (in this process)
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent, timeout=1.0):
+        self._max_concurrent = max_concurrent
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+
+
+    # Wait up to timeout seconds for a free slot. Returns False when there was
+    #   none, otherwise the caller must call release() when it is done.
+    def acquire(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._in_flight += 1
+            self._admitted += 1
+        return True
+
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self._max_concurrent,
+                "in_flight": self._in_flight,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+            }
+
+
+# Value for the Retry-After header: whole seconds, at least 1
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+# Build the rate limiter selected by the RATE_LIMIT_BACKEND setting:
+#   * memory - MemoryBuckets (the default)
+#   * sqlite - SQLiteBuckets in RATE_LIMIT_SQLITE_PATH, shared by the worker processes
+#   * none - no rate limiting
+#   Returns None when no endpoint has a limit.
+def create_rate_limiter(config):
+    backend = config.get("RATE_LIMIT_BACKEND", "memory")
+    rate = config.get("RATE_LIMIT_PER_SECOND", 0)
+    endpoint_limits = config.get("RATE_LIMIT_ENDPOINTS", {})
+
+    if backend == "none" or (rate <= 0 and not endpoint_limits):
+        return None
+    if backend == "memory":
+        buckets = MemoryBuckets()
+    elif backend == "sqlite":
+        path = config.get("RATE_LIMIT_SQLITE_PATH") or os.path.join(tempfile.gettempdir(), "tasks_rate_limit.sqlite3")
+        buckets = SQLiteBuckets(path)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend}. Expected memory, sqlite or none")
+
+    return RateLimiter(buckets, rate, config.get("RATE_LIMIT_BURST", rate), endpoint_limits)
+
+
+# Build the admission control for DB_MAX_CONCURRENCY (None when it is 0)
+def create_concurrency_limiter(config):
+    if config.get("DB_MAX_CONCURRENCY", 0) <= 0:
+        return None
+    return ConcurrencyLimiter(config["DB_MAX_CONCURRENCY"], config.get("DB_ADMISSION_TIMEOUT", 1.0))
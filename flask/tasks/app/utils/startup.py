@@ -0,0 +1,93 @@
+"""
+Measures how long the app takes to start
+
+Both measurements run in a new Python process, the way a freshly started server
+would, since a process that has already imported a module imports it again for free.
+
+    * profile_imports() - time spent importing each module, from Python's own
+        -X importtime report
+    * time_to_first_request() - time from starting the process until the app has
+        answered its first request, split into importing main_app, create_app()
+        and the request itself
+
+    $ flask profile-startup
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+# The folder holding main_app.py
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code run by the new process for time_to_first_request(). Every time is measured
+#   from the moment the parent started the process (passed in as argv[1]).
+FIRST_REQUEST_SCRIPT = """
+import json, sys, time
+started = float(sys.argv[1])
+milestones = {"interpreter_ready": time.time() - started}
+
+import main_app
+milestones["imported"] = time.time() - started
+app = main_app.create_app()
+milestones["app_created"] = time.time() - started
+response = app.test_client().get(sys.argv[2])
+milestones["first_response"] = time.time() - started
+
+print(json.dumps({"status": response.status_code, "milestones": milestones}))
+"""
+
+
+# One line of the -X importtime report
+class ImportTime:
+    def __init__(self, module, self_us, cumulative_us, depth):
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        # 1 for modules imported directly by the profiled code, 2 for the modules
+        #   those import, and so on
+        self.depth = depth
+
+
+# Turn the stderr of `python -X importtime` into ImportTimes. Lines look like
+#   import time:       348 |      31238 |   utils.db
+#   with two more spaces before the name for every level of nesting
+def parse_importtime(report):
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2 + 1
+        imports.append(ImportTime(name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def run_importtime(code, cwd):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+
+# Import time of every module loaded by `code` in a new process.
+#   The modules Python loads while starting up (site, encodings, ...) come first
+#   in the report, so they are found with an empty program and left out.
+def profile_imports(code="import main_app; main_app.create_app()", cwd=APP_FOLDER):
+    startup = {item.module for item in run_importtime("pass", cwd)}
+    imports = run_importtime(code, cwd)
+    first = 0
+    while first < len(imports) and imports[first].module in startup:
+        first += 1
+    return imports[first:]
+
+
+# Seconds from starting a new process until each milestone in FIRST_REQUEST_SCRIPT,
+#   plus the status code of the response. env can change settings for the new
+#   process (like DATABASE).
+def time_to_first_request(path="/stats/events", cwd=APP_FOLDER, env=None):
+    started = time.time()
+    result = subprocess.run([sys.executable, "-c", FIRST_REQUEST_SCRIPT, str(started), path],
+                            cwd=cwd, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, **(env or {})))
+    return json.loads(result.stdout.splitlines()[-1])
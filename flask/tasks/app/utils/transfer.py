@@ -0,0 +1,252 @@
+"""
+Bulk import and export of tasks
+
+Moves the whole tasks table to or from a file without going through the API
+one task at a time. Three file formats are supported:
+
+    * ndjson - one JSON object per line, like GET /api/v1/tasks/?stream=ndjson
+    * csv - a header row (id,description,creation_datetime,completed) then one row per task
+    * parquet - a columnar file for data tools like pandas, DuckDB or Spark
+        (requires: pip install pyarrow)
+
+Both directions work batch_size tasks at a time, so memory use stays the same
+no matter how many tasks are in the file or the table:
+
+    * export_tasks() reads the table with an unbuffered cursor (the rows stay on
+        the server until they are fetched) and appends each batch to the file
+    * import_tasks() writes each batch to a temporary tab separated file and loads
+        it with LOAD DATA LOCAL INFILE, which MySQL parses and inserts far faster
+        than INSERT statements. The MySQL server has to allow it (local_infile=ON);
+        when it does not, the batch is sent as multi-row INSERTs instead.
+
+    $ flask export-tasks tasks.parquet
+    $ flask import-tasks tasks.ndjson --keep-ids
+
+Imported tasks skip the app (and its caches and change feed), so a running
+server may show the old tasks until its cached results expire (CACHE_TTL).
+"""
+import csv
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from itertools import islice
+
+from models.task import TASK_COLUMNS, BULK_CHUNK_SIZE, BUMP_TASKS_VERSION, chunked
+
+logger = logging.getLogger("tasks.transfer")
+
+FORMATS = ("ndjson", "csv", "parquet")
+
+EXTENSIONS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".parquet": "parquet"}
+
+# Tasks read or written per batch
+IMPORT_BATCH_SIZE = 50_000
+EXPORT_BATCH_SIZE = 10_000
+
+# MySQL errors meaning LOAD DATA LOCAL INFILE is turned off on the server (1148, 3948)
+#   or in the client (2068)
+LOCAL_INFILE_DISABLED = {1148, 2068, 3948}
+
+# LOCAL sends the file from this computer (without it MySQL would look for the
+#   file on the server's disk). The file uses LOAD DATA's default format: tab
+#   separated fields, one task per line, \ escapes tabs, newlines and
+#   backslashes, \N is NULL. With LOCAL, rows whose id already exists are
+#   skipped (like INSERT IGNORE).
+LOAD_DATA = """
+    LOAD DATA LOCAL INFILE %s INTO TABLE tasks CHARACTER SET utf8mb4 ({columns});
+"""
+
+
+def file_format_for(path, file_format=None):
+    if file_format is not None:
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown format {file_format}. Expected one of {', '.join(FORMATS)}")
+        return file_format
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError(f"Cannot tell the format of {path} from its extension, choose one of {', '.join(FORMATS)}")
+    return EXTENSIONS[extension]
+
+
+# Helper to split any iterable into lists of at most size items
+def batched(items, size):
+    items = iter(items)
+    batch = list(islice(items, size))
+    while batch:
+        yield batch
+        batch = list(islice(items, size))
+
+
+# A task read from a file as an (id, description, creation_datetime, completed)
+#   tuple. id may be missing (the database picks one), creation_datetime
+#   defaults to `now` and completed to 0.
+def task_row(record, now):
+    task_id = record.get("id")
+    created = record.get("creation_datetime")
+    if isinstance(created, str):
+        created = datetime.fromisoformat(created) if created else None
+    return (
+        int(task_id) if task_id not in (None, "") else None,
+        record["description"],
+        created if created is not None else now,
+        int(record.get("completed") or 0),
+    )
+
+
+# Readers: generators of lists of task rows
+
+def read_ndjson(path, batch_size, now):
+    with open(path, encoding="utf-8") as file:
+        yield from batched((task_row(json.loads(line), now) for line in file if line.strip()), batch_size)
+
+
+def read_csv(path, batch_size, now):
+    with open(path, newline="", encoding="utf-8") as file:
+        yield from batched((task_row(record, now) for record in csv.DictReader(file)), batch_size)
+
+
+def read_parquet(path, batch_size, now):
+    # Only needed for this format, so it is imported here
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield [task_row(record, now) for record in batch.to_pylist()]
+
+
+# Writers: write every batch of task rows to path, returning the number of tasks
+
+def write_ndjson(path, batches):
+    count = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for rows in batches:
+            file.writelines(
+                json.dumps({
+                    "id": task_id,
+                    "description": description,
+                    "creation_datetime": created.isoformat() if created is not None else None,
+                    "completed": int(completed),
+                }) + "\n"
+                for task_id, description, created, completed in rows
+            )
+            count += len(rows)
+    return count
+
+
+def write_csv(path, batches):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(TASK_COLUMNS)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+# Each batch becomes one row group of the Parquet file
+def write_parquet(path, batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.uint64()),
+        ("description", pa.string()),
+        ("creation_datetime", pa.timestamp("us")),
+        ("completed", pa.int8()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            count += len(rows)
+    return count
+
+
+READERS = {"ndjson": read_ndjson, "csv": read_csv, "parquet": read_parquet}
+WRITERS = {"ndjson": write_ndjson, "csv": write_csv, "parquet": write_parquet}
+
+
+# Write every task to path, in id order. Returns the number of tasks written.
+def export_tasks(taskdb, path, file_format=None, batch_size=EXPORT_BATCH_SIZE):
+    return WRITERS[file_format_for(path, file_format)](path, taskdb.iter_task_rows(batch_size))
+
+
+# A value as LOAD DATA's default format expects it
+def load_data_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    return str(value)
+
+
+# Insert one batch with LOAD DATA LOCAL INFILE. Returns the number of tasks added.
+def load_batch(cursor, rows, columns):
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", delete=False) as file:
+        file.writelines("\t".join(load_data_value(value) for value in row) + "\n" for row in rows)
+    try:
+        cursor.execute(LOAD_DATA.format(columns=", ".join(columns)), (file.name,))
+        return cursor.rowcount
+    finally:
+        os.remove(file.name)
+
+
+# Insert one batch with multi-row INSERT IGNORE statements (the same rows are
+#   skipped as with LOAD DATA LOCAL). Returns the number of tasks added.
+def insert_batch(cursor, rows, columns):
+    added = 0
+    for chunk in chunked(rows, BULK_CHUNK_SIZE):
+        placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        cursor.execute(
+            f"INSERT IGNORE INTO tasks ({', '.join(columns)}) VALUES {', '.join([placeholders] * len(chunk))};",
+            [value for row in chunk for value in row]
+        )
+        added += cursor.rowcount
+    return added
+
+
+# Add every task in path to the database, batch_size tasks per transaction.
+#   conn must be opened with allow_local_infile=True for the LOAD DATA path.
+#   keep_ids=True keeps the ids from the file (tasks whose id is already taken
+#   are skipped), otherwise the tasks get new ids. use_load_data=False always
+#   uses INSERT statements (for comparison, see benchmarks/bench_transfer.py).
+#   Returns {"read": tasks in the file, "added": tasks added, "method": "load_data" or "insert"}
+def import_tasks(conn, path, file_format=None, batch_size=IMPORT_BATCH_SIZE, keep_ids=False, use_load_data=True):
+    reader = READERS[file_format_for(path, file_format)]
+    columns = TASK_COLUMNS if keep_ids else TASK_COLUMNS[1:]
+    now = datetime.now().replace(microsecond=0)
+    load = load_batch if use_load_data else insert_batch
+    read = added = 0
+    start = time.perf_counter()
+
+    cursor = conn.cursor()
+    try:
+        for rows in reader(path, batch_size, now):
+            if not keep_ids:
+                rows = [row[1:] for row in rows]
+            try:
+                batch_added = load(cursor, rows, columns)
+            except Exception as error:
+                if load is not load_batch or getattr(error, "errno", None) not in LOCAL_INFILE_DISABLED:
+                    raise
+                logger.warning("LOAD DATA LOCAL INFILE is not allowed (%s), using INSERT statements", error)
+                load = insert_batch
+                batch_added = load(cursor, rows, columns)
+            # Like TaskDB's writes, so ETags change once per batch
+            cursor.execute(BUMP_TASKS_VERSION)
+            conn.commit()
+
+            read += len(rows)
+            added += batch_added
+            logger.info("Imported %d tasks (%.0f tasks/s)", read, read / (time.perf_counter() - start))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {"read": read, "added": added, "method": "load_data" if load is load_batch else "insert"}
@@ -0,0 +1,230 @@
+"""
+Write-behind queue for new tasks
+
+Normally POST /api/v1/tasks/ inserts the task and waits for MySQL to commit it
+before answering. During bursts of new tasks each request pays for its own
+commit (a flush of the redo log to disk). In write-behind mode the request only
+puts the task in a queue and answers right away. A background thread takes
+whatever has piled up and saves it with one multi-row INSERT and one commit per
+batch (a "group commit").
+
+    * Ids are handed out up front from blocks reserved with reserve_ids, so
+        the client learns the id of its task before it is saved
+    * The queue holds at most max_size tasks. When it is full submit() raises
+        QueueFullError so the API can ask the client to retry (backpressure)
+    * Once close() is called submit() raises QueueClosedError, every task
+        accepted before that is saved before the thread stops
+    * submit(task, wait=True) waits until the task's batch is committed, for
+        clients that need to know the task is saved (durability). With a timeout
+        it raises WriteTimeoutError when the batch takes longer than that.
+
+Tasks that were not waited for are lost if the process dies before they are
+flushed, or if saving their batch keeps failing (this is logged).
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger("tasks.write_behind")
+
+
+# Raised by submit() when the queue is full
+class QueueFullError(Exception):
+    pass
+
+
+# Raised by submit() once close() has been called (like while a gunicorn
+#   worker shuts down). Like a full queue, the client should try again later.
+class QueueClosedError(QueueFullError):
+    pass
+
+
+# Raised by submit() when no id could be reserved for the task, and by
+#   submit(wait=True) when the task could not be saved
+class WriteFailedError(Exception):
+    pass
+
+
+# Raised by submit(wait=True, timeout=...) when the task was not saved in time.
+#   It stays in the queue and may still be saved later.
+class WriteTimeoutError(WriteFailedError):
+    pass
+
+
+# A task waiting in the queue
+class _PendingTask:
+    def __init__(self, task, task_id):
+        self.task = task
+        self.task_id = task_id
+        self.done = threading.Event()
+        self.error = None
+
+
+# Bounded queue of new tasks saved in batches by a background thread
+#   * write_batch(tasks, task_ids) - saves and commits a batch of tasks
+#   * reserve_ids(count) - returns a range of count ids no one else will use
+#   * max_size - most tasks waiting to be saved before submit() refuses more
+#   * batch_size - most tasks saved by a single INSERT and commit
+#   * flush_interval - seconds the worker waits for more tasks to join a batch
+#   * id_block_size - ids reserved from the database at a time
+#   * retries - extra attempts to save a batch before giving up on it
+class WriteBehindQueue:
+    def __init__(self, write_batch, reserve_ids, max_size=10_000, batch_size=500,
+                 flush_interval=0.05, id_block_size=1000, retries=2):
+        self._write_batch = write_batch
+        self._reserve_ids = reserve_ids
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._id_block_size = id_block_size
+        self._retries = retries
+
+        self._queue = queue.Queue(max_size)
+        self._ids = iter(())
+        self._ids_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # Held while a task is put in the queue and while close() adds the None
+        #   that stops the thread, so no task can land behind the None and be lost
+        self._put_lock = threading.Lock()
+        self._closed = False
+
+        # Counters reported by stats()
+        self._submitted = 0
+        self._rejected = 0
+        self._flushed = 0
+        self._failed = 0
+        self._batches = 0
+        self._flush_time_total = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="tasks-write-behind", daemon=True)
+        self._thread.start()
+
+
+    # Queue a task and return its id. With wait=True this returns once the task
+    #   is committed (or raises WriteFailedError when it could not be saved, and
+    #   WriteTimeoutError when that took longer than timeout seconds).
+    def submit(self, task, wait=False, timeout=None):
+        if self._closed:
+            raise QueueClosedError("The write-behind queue is closed")
+        # Refuse before reserving an id to keep gaps in the ids small
+        if self._queue.full():
+            self._count_rejected()
+            raise QueueFullError("Too many tasks are waiting to be saved")
+
+        try:
+            task_id = self._next_id()
+        except Exception as error:
+            raise WriteFailedError("Could not reserve an id for the task") from error
+
+        pending = _PendingTask(task, task_id)
+        with self._put_lock:
+            if self._closed:
+                raise QueueClosedError("The write-behind queue is closed")
+            try:
+                self._queue.put_nowait(pending)
+            except queue.Full:
+                self._count_rejected()
+                raise QueueFullError("Too many tasks are waiting to be saved") from None
+        with self._stats_lock:
+            self._submitted += 1
+
+        if wait:
+            if not pending.done.wait(timeout):
+                raise WriteTimeoutError(f"Task {pending.task_id} was not saved within {timeout} s")
+            if pending.error is not None:
+                raise WriteFailedError(f"Task {pending.task_id} was not saved") from pending.error
+        return pending.task_id
+
+
+    def _count_rejected(self):
+        with self._stats_lock:
+            self._rejected += 1
+
+
+    def _next_id(self):
+        with self._ids_lock:
+            task_id = next(self._ids, None)
+            if task_id is None:
+                self._ids = iter(self._reserve_ids(self._id_block_size))
+                task_id = next(self._ids)
+            return task_id
+
+
+    # Background thread: wait for a task, give others flush_interval seconds to
+    #   arrive, then save them together. None in the queue means close().
+    def _run(self):
+        while True:
+            pending = self._queue.get()
+            if pending is None:
+                return
+
+            batch = [pending]
+            deadline = time.monotonic() + self._flush_interval
+            stop = False
+            while len(batch) < self._batch_size:
+                try:
+                    pending = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stop = True
+                    break
+                batch.append(pending)
+
+            self._flush(batch)
+            if stop:
+                return
+
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        error = None
+        for attempt in range(self._retries + 1):
+            try:
+                self._write_batch([pending.task for pending in batch], [pending.task_id for pending in batch])
+                error = None
+                break
+            except Exception as exception:
+                error = exception
+                logger.warning("Saving %d queued tasks failed (attempt %d)", len(batch), attempt + 1, exc_info=True)
+                if attempt < self._retries:
+                    time.sleep(0.1 * (attempt + 1))
+
+        if error is not None:
+            logger.error("Gave up saving tasks %s", [pending.task_id for pending in batch])
+        with self._stats_lock:
+            if error is None:
+                self._flushed += len(batch)
+                self._batches += 1
+            else:
+                self._failed += len(batch)
+            self._flush_time_total += time.perf_counter() - start
+        for pending in batch:
+            pending.error = error
+            pending.done.set()
+
+
+    # Save everything still in the queue and stop the background thread
+    def close(self, timeout=None):
+        with self._put_lock:
+            if self._closed:
+                return
+            self._closed = True
+            # Waits while the queue is full, the thread keeps emptying it
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_size": self._queue.maxsize,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "flushed": self._flushed,
+                "failed": self._failed,
+                "batches": self._batches,
+                "batch_size_avg": self._flushed / self._batches if self._batches else 0.0,
+                "flush_time_avg_ms": self._flush_time_total / self._batches * 1000 if self._batches else 0.0,
+            }
@@ -0,0 +1,46 @@
+from quart import Blueprint, request, redirect, url_for, flash
+from quart import render_template, g, current_app
+from models.task import Task
+from utils.fragments import TASK_ROW_TEMPLATE, render_task_rows_async
+
+# The HTML pages from task_view.py for the ASGI app (asgi_app.py)
+async_task_list_blueprint = Blueprint('async_task_list_blueprint', __name__)
+
+@async_task_list_blueprint.route('/', methods=["GET", "POST"])
+async def index():
+    database = g.task_db
+
+    # Same deleting, paging and row caching as views/task_view.py:index
+    after_id = request.args.get("after_id", 0, type=int)
+
+    if request.method == "POST":
+        form = await request.form
+        task_ids = form.getlist("task_item", type=int)
+        deleted = await database.delete_tasks(task_ids) if task_ids else 0
+        await flash(f"Deleted {deleted} task{'' if deleted == 1 else 's'}")
+        return redirect(url_for(request.endpoint, after_id=after_id or None))
+
+    per_page = current_app.config["TASKS_PER_PAGE"]
+    tasks = await database.select_tasks_page(after_id, per_page + 1)
+    next_after_id = tasks[per_page - 1]['id'] if len(tasks) > per_page else None
+
+    template = current_app.jinja_env.get_template(TASK_ROW_TEMPLATE)
+    task_rows = await render_task_rows_async(template, tasks[:per_page], current_app.extensions["fragment_cache"])
+    return await render_template('index.html', task_rows=task_rows, after_id=after_id, next_after_id=next_after_id)
+
+
+@async_task_list_blueprint.route('/task-entry', methods=["GET"])
+async def task_entry():
+    return await render_template("task-entry.html")
+
+
+@async_task_list_blueprint.route('/add-task', methods=["POST"])
+async def add_task():
+    form = await request.form
+
+    new_task = Task(form.get("task_description"))
+    database = g.task_db
+
+    await database.insert_task(new_task)
+
+    return redirect('/')
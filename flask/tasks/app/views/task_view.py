@@ -1,19 +1,40 @@
-from flask import Blueprint, request, redirect
-from flask import render_template, g, Blueprint
-from models.task import Task, TaskDB
+from flask import Blueprint, request, redirect, url_for, flash
+from flask import render_template, g, Blueprint, current_app
+from models.task import Task
+from utils.fragments import TASK_ROW_TEMPLATE, render_task_rows
 
 task_list_blueprint = Blueprint('task_list_blueprint', __name__)
 
+# The task list is shown TASKS_PER_PAGE tasks at a time (?after_id= picks the page,
+#   like the API's keyset pagination). Rows come from the fragment cache, so after
+#   adding or deleting a task only the rows that are new on the page are rendered.
 @task_list_blueprint.route('/', methods=["GET", "POST"])
 def index():
-    database = TaskDB(g.mysql_db, g.mysql_cursor)
+    database = g.task_db
 
+    after_id = request.args.get("after_id", 0, type=int)
+
+    # All the checked tasks are deleted together in one transaction
+    #   (a few DELETE ... WHERE id IN (...) statements and one commit), then the
+    #   browser is sent back to the same page so a refresh does not post the form again
     if request.method == "POST":
-        task_ids = request.form.getlist("task_item")
-        for id in task_ids:
-            database.delete_task_by_id(id)
+        task_ids = request.form.getlist("task_item", type=int)
+        deleted = database.delete_tasks(task_ids) if task_ids else 0
+        flash(f"Deleted {deleted} task{'' if deleted == 1 else 's'}")
+        return redirect(url_for(request.endpoint, after_id=after_id or None))
+
+    per_page = current_app.config["TASKS_PER_PAGE"]
+    # Reading the tasks version first makes the cache look the page up under
+    #   that version (like the API routes do), so a task deleted through another
+    #   process is gone from the page right after the redirect
+    database.select_tasks_version()
+    # One extra task tells us whether there is a next page
+    tasks = database.select_tasks_page(after_id, per_page + 1)
+    next_after_id = tasks[per_page - 1]['id'] if len(tasks) > per_page else None
 
-    return render_template('index.html', todo_list=database.select_all_tasks())    
+    template = current_app.jinja_env.get_template(TASK_ROW_TEMPLATE)
+    task_rows = render_task_rows(template, tasks[:per_page], g.fragment_cache)
+    return render_template('index.html', task_rows=task_rows, after_id=after_id, next_after_id=next_after_id)
 
 
 @task_list_blueprint.route('/task-entry', methods=["GET"])
@@ -24,10 +45,10 @@ def task_entry():
 @task_list_blueprint.route('/add-task', methods=["POST"])
 def add_task():
     task_description = request.form.get("task_description")
-    
+
     new_task = Task(task_description)
-    database = TaskDB(g.mysql_db, g.mysql_cursor)
+    database = g.task_db
 
     database.insert_task(new_task)
 
-    return redirect('/')
\ No newline at end of file
+    return redirect('/')
@@ -0,0 +1,72 @@
+"""
+bench_json.py
+
+Compares the time to turn a list of tasks into a JSON response with Flask's
+default provider against the orjson provider (see app/utils/json_provider.py).
+The task rows look like the dictionaries the MySQL cursor returns, so no
+database is needed.
+
+    $ python benchmarks/bench_json.py
+
+Run it from the project folder with your virtual environment activated.
+"""
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Same trick as conftest.py so the app's modules can be imported
+sys.path.append('app/')
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from utils.json_provider import OrjsonProvider
+
+LIST_SIZES = [10_000, 100_000]
+REPEATS = 10
+
+
+# Rows shaped like the ones returned by TaskDB.select_all_tasks()
+def make_tasks(count):
+    start = datetime(2022, 4, 21, 11, 10, 53)
+    return [
+        {
+            "id": number,
+            "description": f"Task number {number}",
+            "creation_datetime": start + timedelta(seconds=number),
+            "completed": number % 2,
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+# Median time in milliseconds to build the get_tasks response body
+def time_response(app, provider, tasks):
+    timings = []
+    with app.app_context():
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            provider.response({"status": "success", "tasks": tasks}).get_data()
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    app = Flask(__name__)
+    providers = {
+        "default": DefaultJSONProvider(app),
+        "orjson": OrjsonProvider(app),
+        "orjson (iso)": OrjsonProvider(app, iso_datetimes=True),
+    }
+
+    print(f"{'tasks':>8} " + " ".join(f"{name + ' ms':>16}" for name in providers) + f" {'speedup':>9}")
+    for size in LIST_SIZES:
+        tasks = make_tasks(size)
+        results = {name: time_response(app, provider, tasks) for name, provider in providers.items()}
+        speedup = results["default"] / results["orjson"]
+        print(f"{size:>8} " + " ".join(f"{ms:>16.1f}" for ms in results.values()) + f" {speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+bench_memory.py
+
+Measures the memory a large result set takes as the dictionary rows the MySQL
+cursor returns (what TaskDB.select_tasks() gives back) versus Task objects made
+with Task.from_rows() (what TaskDB.select_task_objects() gives back), and the
+time it takes to build them. A Task class without __slots__ is included to show
+how much of the saving comes from __slots__.
+
+By default the rows are made up in memory so no database is needed. With
+--database the test database is filled with --tasks tasks and they are read
+back with TaskDB instead.
+
+    $ python benchmarks/bench_memory.py --tasks 1000000
+    $ python benchmarks/bench_memory.py --tasks 1000000 --database
+
+Run it from the project folder with your virtual environment activated.
+With --database ********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append('benchmarks/')
+sys.path.append('app/')
+
+from models.task import Task, TASK_COLUMNS
+
+
+# The Task class before it had __slots__, for comparison
+class DictTask:
+    def __init__(self, task_id, description, creation_datetime, completed):
+        self._id = task_id
+        self._description = description
+        self._creation_datetime = creation_datetime
+        self._completed = completed
+
+
+# Rows as (id, description, creation_datetime, completed) tuples, made one at a
+#   time so only the representation being measured is kept in memory
+def make_rows(count):
+    start = datetime(2022, 4, 21, 11, 10, 53)
+    for number in range(1, count + 1):
+        yield (number, f"Task number {number}", start + timedelta(seconds=number), number % 2)
+
+
+# Each representation of count tasks, built from an iterable of tuple rows
+REPRESENTATIONS = {
+    "dict rows (select_tasks)": lambda rows: [dict(zip(TASK_COLUMNS, row)) for row in rows],
+    "tuple rows": lambda rows: list(rows),
+    "Task without __slots__": lambda rows: [DictTask(*row) for row in rows],
+    "Task with __slots__ (from_rows)": Task.from_rows,
+}
+
+
+# Memory held by what build() returns (allocations still alive afterwards) and the
+#   time to build it. tracemalloc slows allocations down, so the time comes from a
+#   second run without it.
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(result)
+    del result
+    gc.collect()
+
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    del result
+    return size / count, elapsed
+
+
+def measure_in_memory(count):
+    results = {}
+    for name, represent in REPRESENTATIONS.items():
+        results[name] = measure(lambda: represent(make_rows(count)))
+    return results
+
+
+# Read the tasks with TaskDB from the test database
+def measure_database(count):
+    import utils.db as UtilsDB
+    from models.task import TaskDB
+    from server import test_database_config
+
+    config = test_database_config()
+    UtilsDB.reset_db(config)
+    conn = UtilsDB.connect_db(config)
+    cursor = conn.cursor(dictionary=True)
+    taskdb = TaskDB(conn, cursor)
+    print(f"Adding {count} tasks to {config['DATABASE']}")
+    for first in range(0, count, 100_000):
+        taskdb.insert_tasks(Task(f"Task number {number}") for number in range(first, min(first + 100_000, count)))
+
+    results = {
+        "dict rows (select_tasks)": measure(lambda: taskdb._select_tasks()),
+        "Task with __slots__ (select_task_objects)": measure(lambda: taskdb.select_task_objects()),
+    }
+    cursor.close()
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory used by task rows and Task objects")
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--database", action="store_true", help="read the tasks from the test database")
+    args = parser.parse_args()
+
+    results = measure_database(args.tasks) if args.database else measure_in_memory(args.tasks)
+
+    baseline = next(iter(results.values()))[0]
+    print(f"\n{args.tasks} tasks (bytes include the description strings and datetimes)")
+    print(f"{'representation':<45} {'bytes/task':>11} {'vs dict':>8} {'build s':>8}")
+    for name, (per_task, elapsed) in results.items():
+        print(f"{name:<45} {per_task:>11.0f} {per_task / baseline:>7.0%} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
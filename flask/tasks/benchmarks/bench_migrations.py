@@ -0,0 +1,189 @@
+"""
+bench_migrations.py
+
+Exercises the schema migrations (see app/utils/migrations.py) on a large tasks
+table while a writer keeps adding and updating tasks, the way the app would
+during a deploy:
+
+    1. Migrates a new test database up to migration 2 (BIGINT ids) and fills it
+        with --rows tasks (10 million by default)
+    2. Times the filtered and sorted list queries without the secondary indexes
+    3. Applies migration 3 (the indexes) online and reports how long it took and
+        the writer's latency meanwhile
+    4. Times the same queries with the indexes
+    5. Rebuilds the whole table with copy_table_online() (the method migration 2
+        uses to widen the id) and reports the same numbers, then checks no rows
+        were lost
+
+    $ python benchmarks/bench_migrations.py --rows 10000000
+
+Run it from the project folder with your virtual environment activated. Filling
+10 million rows takes a while, use --rows 1000000 for a quicker run.
+********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.append('benchmarks/')
+sys.path.append('app/')
+
+import utils.db as UtilsDB
+from utils.migrations import migrate, copy_table_online
+from models.task import chunked, insert_tasks_query
+from server import test_database_config
+
+INSERT_BATCH = 10_000
+QUERY_REPEATS = 5
+
+# The list queries the new indexes are for (see models/task.py:select_tasks_query)
+QUERIES = {
+    "not completed, newest first": "SELECT * from tasks WHERE completed = 0 ORDER BY creation_datetime DESC, id DESC LIMIT 100;",
+    "created in one day": "SELECT * from tasks WHERE creation_datetime > %s AND creation_datetime < %s ORDER BY id LIMIT 100;",
+    "count completed": "SELECT COUNT(*) AS tasks from tasks WHERE completed = 1;",
+}
+
+START = datetime(2020, 1, 1)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+# Fill the table with rows tasks spread over two years, a third of them completed
+def fill_table(conn, cursor, rows):
+    start = time.perf_counter()
+    for batch in chunked(range(rows), INSERT_BATCH):
+        params = []
+        for number in batch:
+            params.extend((f"Task number {number}", START + timedelta(seconds=number * 6), int(number % 3 == 0)))
+        cursor.execute(insert_tasks_query(len(batch)), params)
+        conn.commit()
+    print(f"Inserted {rows} tasks in {time.perf_counter() - start:.0f} s")
+
+
+def time_queries(cursor):
+    day = START + timedelta(days=100)
+    results = {}
+    for name, sql in QUERIES.items():
+        params = (day, day + timedelta(days=1)) if "%s" in sql else ()
+        timings = []
+        for _ in range(QUERY_REPEATS):
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append(time.perf_counter() - start)
+        results[name] = statistics.median(timings) * 1000
+    return results
+
+
+# Inserts and updates tasks on its own connection until stopped, recording the
+#   latency of every write so we can see how much the migration got in the way
+class Writer(threading.Thread):
+    def __init__(self, config, max_id):
+        super().__init__(daemon=True)
+        self.config = config
+        self.max_id = max_id
+        self.latencies = []
+        self.errors = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        conn = UtilsDB.connect_db(self.config)
+        cursor = conn.cursor()
+        while not self.stopping.is_set():
+            start = time.perf_counter()
+            try:
+                if random.random() < 0.5:
+                    cursor.execute(insert_tasks_query(1), ("Written during the migration", datetime.now(), 0))
+                else:
+                    cursor.execute("UPDATE tasks SET completed = 1 WHERE id = %s;", (random.randint(1, self.max_id),))
+                conn.commit()
+            except Exception:
+                self.errors += 1
+                conn.rollback()
+            self.latencies.append(time.perf_counter() - start)
+        cursor.close()
+        conn.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+        latencies = sorted(self.latencies)
+        return {
+            "writes": len(latencies),
+            "errors": self.errors,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        }
+
+
+# Run change() while the writer is busy and report its duration and write latencies
+def with_writer(config, max_id, name, change):
+    writer = Writer(config, max_id)
+    writer.start()
+    start = time.perf_counter()
+    change()
+    elapsed = time.perf_counter() - start
+    stats = writer.stop()
+    print(f"\n{name}: {elapsed:.1f} s")
+    print(f"  concurrent writes: {stats['writes']} ({stats['errors']} errors), p50 {stats['p50_ms']:.1f} ms, "
+          f"p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+    return stats
+
+
+def print_queries(before, after):
+    print(f"\n{'query':<30} {'no index ms':>12} {'indexed ms':>12}")
+    for name in QUERIES:
+        print(f"{name:<30} {before[name]:>12.1f} {after[name]:>12.1f}")
+
+
+def count_rows(cursor):
+    cursor.execute("SELECT COUNT(*) AS tasks FROM tasks;")
+    return cursor.fetchone()["tasks"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark online schema migrations on a large tasks table")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    config = test_database_config()
+    print(f"Creating {config['DATABASE']} up to migration 2")
+    UtilsDB.reset_db(config, target=2)
+
+    conn = UtilsDB.connect_db(config)
+    cursor = conn.cursor(dictionary=True)
+    fill_table(conn, cursor, args.rows)
+
+    before = time_queries(cursor)
+    with_writer(config, args.rows, "Migration 3 (add indexes online)", lambda: migrate(conn))
+    after = time_queries(cursor)
+    print_queries(before, after)
+
+    rows_before = count_rows(cursor)
+    with_writer(config, args.rows, "Online copy of the whole table",
+                lambda: copy_table_online(conn, cursor, "tasks", "ENGINE=InnoDB"))
+
+    # Every row that was there before, plus the ones the writer inserted, made it into the copy
+    cursor.execute("SELECT COUNT(*) AS tasks FROM tasks WHERE description = 'Written during the migration';")
+    written = cursor.fetchone()["tasks"]
+    rows_after = count_rows(cursor)
+    print(f"\nRows before the copy: {rows_before}, after: {rows_after} "
+          f"({written} written during the migrations)")
+    if rows_after < rows_before:
+        print("ROWS WERE LOST")
+
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+bench_prepared.py
+
+Measures how many tasks per second TaskDB.select_task_by_id() can look up when
+the SQL text is sent with every call versus when it runs as a server-side
+prepared statement (TaskDB(..., prepared=True), see app/models/task.py).
+The query cache is turned off so every lookup goes to the database.
+
+    $ python benchmarks/bench_prepared.py
+
+Run it from the project folder with your virtual environment activated.
+********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import random
+import sys
+import time
+
+sys.path.append('benchmarks/')
+sys.path.append('app/')
+
+import utils.db as UtilsDB
+from models.task import TaskDB
+from server import test_database_config, seed_database
+
+SEED_TASKS = 10_000
+DURATION = 5
+ROUNDS = 3
+
+
+# Lookups per second of random task ids for DURATION seconds
+def lookups_per_second(taskdb):
+    count = 0
+    deadline = time.perf_counter() + DURATION
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        taskdb.select_task_by_id(random.randint(1, SEED_TASKS))
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    config = test_database_config()
+    print(f"Seeding {SEED_TASKS} tasks into {config['DATABASE']}")
+    seed_database(config, SEED_TASKS)
+
+    conn = UtilsDB.connect_db(config)
+    cursor = conn.cursor(dictionary=True)
+
+    # Alternate between the two modes so neither benefits from running last
+    results = {"text": [], "prepared": []}
+    for _ in range(ROUNDS):
+        for mode in results:
+            taskdb = TaskDB(conn, cursor, prepared=(mode == "prepared"))
+            results[mode].append(lookups_per_second(taskdb))
+
+    cursor.close()
+    conn.close()
+
+    text = max(results["text"])
+    prepared = max(results["prepared"])
+    print(f"{'mode':<10} {'lookups/s':>10}")
+    print(f"{'text':<10} {text:>10.0f}")
+    print(f"{'prepared':<10} {prepared:>10.0f}")
+    print(f"prepared statements: {(prepared - text) / text * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+bench_rate_limit.py
+
+Measures what rate limiting adds to every request (see app/utils/rate_limit.py):
+the rate limit checks per second, and the time per check, with the buckets in
+memory and in a shared SQLite file. The SQLite store is also run with several
+processes taking tokens from the same file at once, like gunicorn workers do.
+No database or server is needed.
+
+    $ python benchmarks/bench_rate_limit.py --checks 50000 --processes 4
+
+Run it from the project folder with your virtual environment activated.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append('app/')
+
+from utils.rate_limit import MemoryBuckets, SQLiteBuckets, RateLimiter
+
+# Enough clients that most checks refill a bucket rather than empty it
+CLIENTS = 1000
+
+
+def run_checks(limiter, count):
+    start = time.perf_counter()
+    for number in range(count):
+        limiter.check(f"10.0.{number % CLIENTS // 256}.{number % 256}", "task_api_blueprint.get_tasks")
+    return time.perf_counter() - start
+
+
+def sqlite_worker(path, count, results):
+    limiter = RateLimiter(SQLiteBuckets(path), rate=100, burst=200)
+    results.put(run_checks(limiter, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of the rate limit check")
+    parser.add_argument("--checks", type=int, default=50_000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    results = {}
+    results["memory, 1 process"] = (args.checks, run_checks(RateLimiter(MemoryBuckets(), rate=100, burst=200), args.checks))
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "buckets.sqlite3")
+        limiter = RateLimiter(SQLiteBuckets(path), rate=100, burst=200)
+        results["sqlite, 1 process"] = (args.checks, run_checks(limiter, args.checks))
+
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=sqlite_worker, args=(path, args.checks, queue))
+                     for _ in range(args.processes)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        results[f"sqlite, {args.processes} processes"] = (args.checks * args.processes, time.perf_counter() - start)
+
+    print(f"\n{'buckets':<25} {'checks/s':>10} {'us/check':>9}")
+    for name, (count, elapsed) in results.items():
+        print(f"{name:<25} {count / elapsed:>10.0f} {elapsed / count * 1_000_000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
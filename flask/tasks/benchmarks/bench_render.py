@@ -0,0 +1,130 @@
+"""
+bench_render.py
+
+Measures the time to render the HTML task list (views/task_view.py:index) with
+--tasks tasks in the table, comparing:
+
+    * the whole list re-rendered on every request (how index.html worked before
+        it was paginated)
+    * the whole list from the fragment cache, and again after one task changed
+        (only that task's row is rendered)
+    * one page of TASKS_PER_PAGE tasks, with the rows rendered each time and with
+        the rows from the fragment cache
+
+The tasks are kept in memory so no database is needed; only the rendering is timed.
+
+    $ python benchmarks/bench_render.py --tasks 10000 --runs 20
+
+Run it from the project folder with your virtual environment activated.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+sys.path.append('app/')
+
+from flask import g, render_template_string
+
+import main_app
+from utils.cache import LRUCache
+from views.task_view import index
+
+# index.html before the rows were paginated and cached
+WHOLE_LIST_TEMPLATE = """
+{% extends "layout.html" %}
+
+{% block body %}
+    <h1>ToDo List:</h1>
+    <a href="/task-entry">Add a new task</a>
+    <form action="/" method="post">
+        <table>
+            {% for task in todo_list %}
+                <tr>
+                    <td>{{ task['description'] }}</td>
+                    <td><input type="checkbox" name="task_item" value={{ task['id'] }}></td>
+                </tr>
+            {% endfor %}
+        </table>
+        <input type="submit" value="Delete Tasks">
+    </form>
+{% endblock %}
+"""
+
+
+# Stands in for TaskDB, with the rows in a list
+class InMemoryTasks:
+    def __init__(self, count):
+        self.rows = [{"id": number, "description": f"Task number {number}", "completed": 0}
+                     for number in range(1, count + 1)]
+
+    def select_all_tasks(self):
+        return self.rows
+
+    def select_tasks_page(self, after_id=0, limit=100):
+        return self.rows[after_id:after_id + limit]
+
+
+# Median milliseconds to run render() inside a request for GET /
+def time_render(app, render, runs):
+    times = []
+    for _ in range(runs):
+        with app.test_request_context('/'):
+            start = time.perf_counter()
+            render()
+            times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+# Calls the index view the way a request would
+def render_index(app, tasks, cache):
+    g.task_db = tasks
+    g.fragment_cache = cache
+    return index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare task list render times with and without the fragment cache")
+    parser.add_argument("--tasks", type=int, default=10_000)
+    parser.add_argument("--per-page", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    app = main_app.create_app({"TESTING": True})
+    tasks = InMemoryTasks(args.tasks)
+    cache = LRUCache(max_entries=args.tasks * 2, ttl=3600)
+    results = {}
+
+    results["whole list, rendered every time (before)"] = time_render(
+        app, lambda: render_template_string(WHOLE_LIST_TEMPLATE, todo_list=tasks.select_all_tasks()), args.runs
+    )
+
+    app.config["TASKS_PER_PAGE"] = args.tasks
+    time_render(app, lambda: render_index(app, tasks, cache), 1)
+    results["whole list, cached rows"] = time_render(app, lambda: render_index(app, tasks, cache), args.runs)
+
+    # Change a different task before every run so each request renders exactly one row
+    changed = iter(range(args.tasks))
+
+    def change_one_and_render():
+        row = tasks.rows[next(changed) % args.tasks]
+        row["description"] += " (changed)"
+        return render_index(app, tasks, cache)
+
+    results["whole list, cached rows, one task changed"] = time_render(app, change_one_and_render, args.runs)
+
+    app.config["TASKS_PER_PAGE"] = args.per_page
+    results[f"page of {args.per_page}, rendered every time"] = time_render(
+        app, lambda: render_index(app, tasks, None), args.runs
+    )
+    results[f"page of {args.per_page}, cached rows"] = time_render(app, lambda: render_index(app, tasks, cache), args.runs)
+
+    baseline = next(iter(results.values()))
+    print(f"\nGET / with {args.tasks} tasks, median of {args.runs} runs")
+    print(f"{'page':<45} {'ms':>9} {'speedup':>8}")
+    for name, elapsed in results.items():
+        print(f"{name:<45} {elapsed:>9.2f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+bench_search.py
+
+Compares the time to search task descriptions with the old LIKE '%text%' scan
+against the FULLTEXT index search as the tasks table grows.
+
+    $ python benchmarks/bench_search.py
+
+Run it from the project folder with your virtual environment activated.
+********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+# Same trick as conftest.py so the app's modules can be imported
+sys.path.append('app/')
+
+from dotenv import load_dotenv
+
+import utils.db as UtilsDB
+from models.task import TaskDB
+
+TABLE_SIZES = [1_000, 10_000, 100_000]
+QUERIES_PER_SIZE = 50
+INSERT_BATCH = 1_000
+
+WORDS = [
+    "milk", "eggs", "bread", "laundry", "homework", "email", "dentist", "garage",
+    "groceries", "report", "meeting", "lawn", "dishes", "taxes", "project", "birthday",
+    "gift", "flight", "hotel", "library", "return", "call", "plumber", "budget",
+]
+
+
+def random_description():
+    return " ".join(random.choices(WORDS, k=random.randint(2, 5)))
+
+
+# Add rows until the table holds `size` tasks
+def grow_table(conn, cursor, current_size, size):
+    insert_query = """
+        INSERT INTO tasks (description, creation_datetime, completed)
+        VALUES (%s, NOW(), 0);
+    """
+    remaining = size - current_size
+    while remaining > 0:
+        batch = min(INSERT_BATCH, remaining)
+        cursor.executemany(insert_query, [(random_description(),) for _ in range(batch)])
+        remaining -= batch
+    conn.commit()
+
+
+# Median time in milliseconds to run search(term) over a list of search terms
+def time_queries(search, terms):
+    timings = []
+    for term in terms:
+        start = time.perf_counter()
+        search(term)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    load_dotenv()
+    config = {
+        "DBHOST": os.getenv("DBHOST"),
+        "DATABASE": os.getenv("TEST_DATABASE"),
+        "DBUSERNAME": os.getenv("DBUSERNAME"),
+        "DBPASSWORD": os.getenv("DBPASSWORD")
+    }
+
+    UtilsDB.reset_db(config)
+    conn = UtilsDB.connect_db(config)
+    cursor = conn.cursor(dictionary=True)
+    taskdb = TaskDB(conn, cursor)
+
+    print(f"{'rows':>10} | {'LIKE (ms)':>10} | {'FULLTEXT (ms)':>14} | {'speedup':>8}")
+    print("-" * 52)
+
+    size = 0
+    for target_size in TABLE_SIZES:
+        grow_table(conn, cursor, size, target_size)
+        size = target_size
+
+        terms = [random.choice(WORDS) for _ in range(QUERIES_PER_SIZE)]
+        like_ms = time_queries(taskdb.select_all_tasks_by_description, terms)
+        fulltext_ms = time_queries(taskdb.search_tasks, terms)
+
+        print(f"{size:>10} | {like_ms:>10.2f} | {fulltext_ms:>14.2f} | {like_ms / fulltext_ms:>7.1f}x")
+
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
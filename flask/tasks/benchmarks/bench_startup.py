@@ -0,0 +1,47 @@
+"""
+bench_startup.py
+
+Measures the cold start of the tasks app: the time from starting a new Python
+process until the app has answered its first request (see app/utils/startup.py).
+Each measurement is repeated and the median is printed for:
+
+    * GET /stats/events - a route that does not use the database
+    * GET /api/v1/tasks/?limit=1 - a route that connects to the test database
+        (which also loads the MySQL driver)
+
+    $ python benchmarks/bench_startup.py --runs 10
+
+Run it from the project folder with your virtual environment activated.
+`flask profile-startup` lists the modules that take longest to import.
+"""
+import argparse
+import statistics
+import sys
+
+sys.path.append('benchmarks/')
+sys.path.append('app/')
+
+from utils.startup import time_to_first_request
+from server import test_database_config
+
+PATHS = ["/stats/events", "/api/v1/tasks/?limit=1"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the time until a new process answers its first request")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    # The database route reads from the test database, which only needs to exist
+    env = {"DATABASE": test_database_config()["DATABASE"] or ""}
+
+    for path in PATHS:
+        results = [time_to_first_request(path, env=env) for _ in range(args.runs)]
+        print(f"\nGET {path} (status {results[0]['status']}), median of {args.runs} runs")
+        for milestone in results[0]["milestones"]:
+            median = statistics.median(result["milestones"][milestone] for result in results)
+            print(f"  {milestone:<20} {median * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
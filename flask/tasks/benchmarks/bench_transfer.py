@@ -0,0 +1,127 @@
+"""
+bench_transfer.py
+
+Measures the throughput (tasks/sec) of `flask import-tasks` and `flask export-tasks`
+(see app/utils/transfer.py) with --tasks tasks:
+
+    * import from NDJSON, CSV and Parquet with LOAD DATA LOCAL INFILE, and from
+        NDJSON with multi-row INSERT statements for comparison
+    * export to NDJSON, CSV and Parquet
+
+followed by the peak memory of the process, which stays flat as --tasks grows.
+The import source files are made up first, in a temporary folder that is
+removed at the end. With --files-only no database is used: the files are
+written and read back without MySQL, which shows how much of the time goes to
+each file format.
+
+    $ python benchmarks/bench_transfer.py --tasks 1000000
+    $ python benchmarks/bench_transfer.py --tasks 1000000 --files-only
+
+Run it from the project folder with your virtual environment activated. Parquet
+needs pyarrow (pip install pyarrow) and is left out without it. LOAD DATA LOCAL
+INFILE needs local_infile=ON on the MySQL server (SET GLOBAL local_infile = 1).
+********* Without --files-only THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import argparse
+import importlib.util
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append('benchmarks/')
+sys.path.append('app/')
+
+from utils.transfer import READERS, WRITERS, batched, import_tasks, export_tasks
+
+
+def made_up_rows(count):
+    start = datetime(2022, 4, 21, 11, 10, 53)
+    for number in range(1, count + 1):
+        yield (number, f"Task number {number}", start + timedelta(seconds=number), number % 2)
+
+
+def formats():
+    if importlib.util.find_spec("pyarrow") is None:
+        print("pyarrow is not installed, leaving out parquet")
+        return ["ndjson", "csv"]
+    return ["ndjson", "csv", "parquet"]
+
+
+# Peak memory (resident set size) of this process so far, in MB
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_files_only(count, paths):
+    results = {}
+    for file_format, path in paths.items():
+        results[f"write {file_format}"] = timed(lambda: WRITERS[file_format](path, batched(made_up_rows(count), 10_000)))
+        results[f"read {file_format}"] = timed(
+            lambda: sum(len(rows) for rows in READERS[file_format](path, 50_000, datetime.now()))
+        )
+    return results
+
+
+def run_database(count, paths, folder):
+    import utils.db as UtilsDB
+    from models.task import TaskDB
+    from server import test_database_config
+
+    config = test_database_config()
+    results = {}
+
+    imports = [(file_format, path, True) for file_format, path in paths.items()] + [("ndjson", paths["ndjson"], False)]
+    for file_format, path, use_load_data in imports:
+        UtilsDB.reset_db(config)
+        conn = UtilsDB.connect_db(config, allow_local_infile=True)
+        outcome = {}
+        elapsed = timed(lambda: outcome.update(import_tasks(conn, path, use_load_data=use_load_data)))
+        conn.close()
+        results[f"import {file_format} ({outcome['method']})"] = elapsed
+
+    # The table now holds the tasks from the last import
+    for file_format in paths:
+        conn = UtilsDB.connect_db(config)
+        cursor = conn.cursor(dictionary=True)
+        path = os.path.join(folder, f"export.{file_format}")
+        results[f"export {file_format}"] = timed(lambda: export_tasks(TaskDB(conn, cursor), path))
+        cursor.close()
+        conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bulk import and export throughput")
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--files-only", action="store_true", help="only write and read the files, no database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = {file_format: os.path.join(folder, f"tasks.{file_format}") for file_format in formats()}
+        if args.files_only:
+            results = run_files_only(args.tasks, paths)
+        else:
+            for file_format, path in paths.items():
+                WRITERS[file_format](path, batched(made_up_rows(args.tasks), 10_000))
+            results = run_database(args.tasks, paths, folder)
+        sizes = {file_format: os.path.getsize(path) / 1_000_000 for file_format, path in paths.items()}
+
+    print(f"\n{args.tasks} tasks")
+    print(f"{'step':<30} {'seconds':>8} {'tasks/s':>10}")
+    for name, elapsed in results.items():
+        print(f"{name:<30} {elapsed:>8.2f} {args.tasks / elapsed:>10.0f}")
+    print(f"\nPeak memory of this process: {peak_memory_mb():.0f} MB")
+    print("File sizes: " + ", ".join(f"{file_format} {size:.1f} MB" for file_format, size in sizes.items()))
+
+
+if __name__ == "__main__":
+    main()
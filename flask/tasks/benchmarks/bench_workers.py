@@ -0,0 +1,88 @@
+"""
+bench_workers.py
+
+Shows how throughput grows with the number of gunicorn worker processes. For
+each worker count the service is started with the production settings (see
+app/gunicorn.conf.py) and load tested with the same mix of requests, then
+requests/sec, p99 latency and the speedup over a single worker are printed.
+
+    $ python benchmarks/bench_workers.py --workers 1,2,4,8 --concurrency 200 --duration 20
+
+Run it from the project folder with your virtual environment activated. The
+load generator needs CPU time too, so the speedup flattens out before the number
+of workers reaches the number of CPUs.
+********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.append('benchmarks/')
+
+from loadtest import run_load, summarize
+from server import test_database_config, seed_database, server_command, start_server, stop_server
+
+SEED_TASKS = 1_000
+RESULTS_FILE = os.path.join("benchmarks", "results", "bench_workers.json")
+
+
+# Mostly reads with some writes, like compare_wsgi_asgi.py
+def next_request():
+    roll = random.random()
+    if roll < 0.6:
+        return "get_by_id", "GET", f"/api/v1/tasks/{random.randint(1, SEED_TASKS)}/", None
+    if roll < 0.9:
+        return "get_page", "GET", "/api/v1/tasks/?limit=50", None
+    return "post", "POST", "/api/v1/tasks/", {"description": "load test"}
+
+
+# Requests/sec, errors and p99 latency over every kind of request
+def totals(report):
+    requests = sum(row["requests"] for row in report.values())
+    return {
+        "requests_per_sec": sum(row["requests_per_sec"] for row in report.values()),
+        "errors": sum(row["errors"] for row in report.values()),
+        "p99_ms": max(row["p99_ms"] for row in report.values()) if requests else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput as the number of gunicorn workers grows")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    config = test_database_config()
+    results = {"threads": args.threads, "concurrency": args.concurrency, "duration": args.duration, "runs": {}}
+
+    for workers in [int(count) for count in args.workers.split(",")]:
+        seed_database(config, SEED_TASKS)
+        server = start_server(server_command("wsgi", workers, args.threads, args.port), config["DATABASE"], args.port)
+        try:
+            samples, elapsed = asyncio.run(run_load(
+                f"http://127.0.0.1:{args.port}", next_request, args.concurrency, args.duration
+            ))
+        finally:
+            stop_server(server)
+        results["runs"][workers] = totals(summarize(samples, elapsed))
+
+    single = next(iter(results["runs"].values()))["requests_per_sec"]
+    print(f"\n{'workers':>8} {'req/s':>10} {'speedup':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers, run in results["runs"].items():
+        speedup = run["requests_per_sec"] / single if single else 0.0
+        print(f"{workers:>8} {run['requests_per_sec']:>10.1f} {speedup:>7.2f}x {run['p99_ms']:>8.1f} {run['errors']:>7}")
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"\nSaved results to {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+compare_wsgi_asgi.py
+
+Load tests the WSGI app (main_app.py on gunicorn) and the ASGI app (asgi_app.py
+on hypercorn) against the same database and prints requests/sec and latency
+percentiles for each, then saves the numbers to benchmarks/results/.
+
+    $ python benchmarks/compare_wsgi_asgi.py --concurrency 500 --duration 30
+
+Run it from the project folder with your virtual environment activated.
+********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.append('benchmarks/')
+
+from loadtest import run_load, summarize, print_report
+from server import test_database_config, seed_database, server_command, start_server, stop_server
+
+SEED_TASKS = 1_000
+RESULTS_FILE = os.path.join("benchmarks", "results", "compare_wsgi_asgi.json")
+
+
+# Mostly reads, like a dashboard polling the API, with some writes mixed in
+def next_request():
+    roll = random.random()
+    if roll < 0.6:
+        return "get_by_id", "GET", f"/api/v1/tasks/{random.randint(1, SEED_TASKS)}/", None
+    if roll < 0.9:
+        return "get_page", "GET", "/api/v1/tasks/?limit=50", None
+    return "post", "POST", "/api/v1/tasks/", {"description": "load test"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the WSGI and ASGI versions of the tasks service")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16, help="threads per gunicorn worker")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    config = test_database_config()
+    results = {"concurrency": args.concurrency, "duration": args.duration, "workers": args.workers}
+
+    for mode in ("wsgi", "asgi"):
+        seed_database(config, SEED_TASKS)
+        command = server_command(mode, args.workers, args.threads, args.port)
+        server = start_server(command, config["DATABASE"], args.port)
+        try:
+            samples, elapsed = asyncio.run(run_load(
+                f"http://127.0.0.1:{args.port}", next_request, args.concurrency, args.duration
+            ))
+        finally:
+            stop_server(server)
+
+        report = summarize(samples, elapsed)
+        results[mode] = report
+        print(f"\n{mode.upper()} ({command[0]}) at {args.concurrency} concurrent clients")
+        print_report(report)
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"\nSaved results to {RESULTS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+loadtest.py
+
+A small asynchronous load generator for the tasks API. Many simulated clients
+send requests at the same time for a fixed number of seconds, and the latency of
+every request is recorded so we can report throughput and percentiles.
+
+    $ python benchmarks/loadtest.py http://localhost:8000 --concurrency 100 --duration 10
+
+The other benchmark scripts import run_load() and summarize() from here.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+# The value below which pct percent of the sorted values fall
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Turn the raw latencies recorded by run_load() into a report per request name
+def summarize(samples, elapsed):
+    report = {}
+    for name, sample in sorted(samples.items()):
+        latencies = sorted(sample["latencies"])
+        count = len(latencies)
+        report[name] = {
+            "requests": count,
+            "errors": sample["errors"],
+            "requests_per_sec": count / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p90_ms": percentile(latencies, 90) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        }
+    return report
+
+
+# Run `concurrency` clients against base_url for `duration` seconds.
+#   next_request() is called for every request and returns a tuple of
+#   (name, method, path, json_body). The name groups requests in the report.
+#   Returns (samples, elapsed) where samples maps name -> {"latencies": [...], "errors": n}.
+async def run_load(base_url, next_request, concurrency, duration, timeout=30):
+    samples = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        deadline = time.perf_counter() + duration
+
+        async def client_loop():
+            while time.perf_counter() < deadline:
+                name, method, path, body = next_request()
+                sample = samples.setdefault(name, {"latencies": [], "errors": 0})
+
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                sample["latencies"].append(time.perf_counter() - start)
+                if failed:
+                    sample["errors"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return samples, elapsed
+
+
+def print_report(report):
+    print(f"{'request':<14} {'count':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, row in report.items():
+        print(f"{name:<14} {row['requests']:>8} {row['errors']:>7} {row['requests_per_sec']:>9.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send GET /api/v1/tasks/ requests to a running tasks service")
+    parser.add_argument("base_url")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--path", default="/api/v1/tasks/?limit=50")
+    args = parser.parse_args()
+
+    samples, elapsed = asyncio.run(run_load(
+        args.base_url, lambda: ("get", "GET", args.path, None), args.concurrency, args.duration
+    ))
+    report = summarize(samples, elapsed)
+    print_report(report)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+run_benchmarks.py
+
+Benchmark harness for the tasks API. It recreates the test database with a
+known number of tasks, starts the service, drives a mix of requests at a target
+concurrency and reports throughput and latency percentiles per endpoint. The
+report is saved as JSON (with the git commit it was measured on) so runs can be
+compared between versions.
+
+    $ python benchmarks/run_benchmarks.py --mix read-heavy --concurrency 50 --duration 30
+    $ python benchmarks/run_benchmarks.py --mix get_by_id=70,post=30 --server asgi
+    $ python benchmarks/run_benchmarks.py --baseline benchmarks/results/<earlier run>.json
+
+Run it from the project folder with your virtual environment activated.
+********* THIS ERASES YOUR TEST_DATABASE (from the .env file) *********
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime
+
+sys.path.append('benchmarks/')
+
+from loadtest import run_load, summarize, print_report
+from server import test_database_config, seed_database, server_command, start_server, stop_server
+
+RESULTS_FOLDER = os.path.join("benchmarks", "results")
+
+# Words used for seeded task descriptions and search requests
+WORDS = ["milk", "eggs", "bread", "laundry", "homework", "email", "dentist", "garage", "report", "meeting"]
+
+# Named request mixes, as percentages of requests per endpoint
+MIXES = {
+    "read-heavy": {"get_all": 5, "get_by_id": 60, "search": 15, "post": 10, "put": 7, "delete": 3},
+    "balanced": {"get_all": 5, "get_by_id": 35, "search": 10, "post": 25, "put": 15, "delete": 10},
+    "write-heavy": {"get_all": 2, "get_by_id": 18, "search": 5, "post": 45, "put": 20, "delete": 10},
+}
+
+
+# Parse "--mix read-heavy" or "--mix get_by_id=70,post=30"
+def parse_mix(text):
+    if text in MIXES:
+        return MIXES[text]
+
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in MIXES["balanced"]:
+            raise ValueError(f"Unknown endpoint {name}. Expected one of {', '.join(MIXES['balanced'])}")
+        mix[name] = float(weight)
+    return mix
+
+
+# Build the next_request() function used by loadtest.run_load for a mix.
+#   Reads and updates target the seeded ids. Deletes also pick seeded ids,
+#   deleting a task that is already gone is still a valid (cheap) request.
+def request_picker(mix, seed_tasks):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    def next_request():
+        name = random.choices(names, weights)[0]
+        task_id = random.randint(1, seed_tasks)
+
+        if name == "get_all":
+            return name, "GET", "/api/v1/tasks/", None
+        if name == "get_by_id":
+            return name, "GET", f"/api/v1/tasks/{task_id}/", None
+        if name == "search":
+            return name, "GET", f"/api/v1/tasks/?search={random.choice(WORDS)}", None
+        if name == "post":
+            return name, "POST", "/api/v1/tasks/", {"description": f"Benchmark {random.choice(WORDS)}"}
+        if name == "put":
+            return name, "PUT", f"/api/v1/tasks/{task_id}/", {"description": f"Updated {random.choice(WORDS)}"}
+        return name, "DELETE", f"/api/v1/tasks/{task_id}/", None
+
+    return next_request
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Print how each endpoint changed compared to an earlier run
+def print_comparison(report, baseline):
+    print(f"\nCompared to {baseline['commit']} ({baseline['started']}):")
+    print(f"{'request':<14} {'req/s':>10} {'p50':>10} {'p99':>10}")
+    for name, row in report.items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            continue
+
+        def change(key):
+            if not old[key]:
+                return "n/a"
+            return f"{(row[key] - old[key]) / old[key] * 100:+.1f}%"
+
+        print(f"{name:<14} {change('requests_per_sec'):>10} {change('p50_ms'):>10} {change('p99_ms'):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tasks API")
+    parser.add_argument("--mix", default="read-heavy",
+                        help=f"one of {', '.join(MIXES)} or endpoint=weight pairs like get_by_id=70,post=30")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--seed-tasks", type=int, default=10_000)
+    parser.add_argument("--server", choices=["wsgi", "asgi", "flask"], default="wsgi")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16, help="threads per gunicorn worker")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--output", help="where to save the JSON report (default benchmarks/results/)")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    config = test_database_config()
+
+    print(f"Seeding {args.seed_tasks} tasks into {config['DATABASE']}")
+    seed_database(config, args.seed_tasks, description="Benchmark {number} " + " ".join(WORDS[:3]))
+
+    command = server_command(args.server, args.workers, args.threads, args.port)
+    server = start_server(command, config["DATABASE"], args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    next_request = request_picker(mix, args.seed_tasks)
+    started = datetime.now().isoformat(timespec="seconds")
+
+    try:
+        if args.warmup:
+            asyncio.run(run_load(base_url, next_request, args.concurrency, args.warmup))
+        samples, elapsed = asyncio.run(run_load(base_url, next_request, args.concurrency, args.duration))
+    finally:
+        stop_server(server)
+
+    report = summarize(samples, elapsed)
+    total = sum(row["requests"] for row in report.values())
+    print(f"\n{args.server} server, {args.concurrency} clients, {total / elapsed:.1f} req/s overall")
+    print_report(report)
+
+    results = {
+        "commit": git_commit(),
+        "started": started,
+        "server": args.server,
+        "workers": args.workers,
+        "threads": args.threads,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "seed_tasks": args.seed_tasks,
+        "mix": mix,
+        "total_requests_per_sec": total / elapsed,
+        "endpoints": report,
+    }
+
+    output = args.output or os.path.join(RESULTS_FOLDER, f"{started.replace(':', '')}-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            print_comparison(report, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
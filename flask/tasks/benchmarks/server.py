@@ -0,0 +1,85 @@
+"""
+server.py
+
+Helpers shared by the benchmark scripts to prepare the test database and start
+the tasks service in a separate process.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.append('app/')
+
+from dotenv import load_dotenv
+
+import utils.db as UtilsDB
+from models.task import Task, TaskDB
+
+
+# Database settings for the benchmarks: always the TEST_DATABASE from .env
+def test_database_config():
+    load_dotenv()
+    return {
+        "DBHOST": os.getenv("DBHOST"),
+        "DATABASE": os.getenv("TEST_DATABASE"),
+        "DBUSERNAME": os.getenv("DBUSERNAME"),
+        "DBPASSWORD": os.getenv("DBPASSWORD")
+    }
+
+
+# Recreate the test database and fill it with task_count tasks
+def seed_database(config, task_count, description="Benchmark task {number}"):
+    UtilsDB.reset_db(config)
+    conn = UtilsDB.connect_db(config)
+    cursor = conn.cursor(dictionary=True)
+    TaskDB(conn, cursor).insert_tasks([Task(description.format(number=number)) for number in range(task_count)])
+    cursor.close()
+    conn.close()
+
+
+# Command lines that start each version of the service
+#   * wsgi - main_app.py on gunicorn with the production settings from app/gunicorn.conf.py
+#       (preloaded app, warm connection pools, gthread workers answering `threads` requests at once)
+#   * asgi - asgi_app.py on hypercorn, one event loop per worker
+#   * flask - the single process development server from `flask run`
+def server_command(mode, workers, threads, port):
+    if mode == "wsgi":
+        return ["gunicorn", "--config", "gunicorn.conf.py", "--workers", str(workers), "--threads", str(threads),
+                "--bind", f"127.0.0.1:{port}"]
+    if mode == "asgi":
+        return ["hypercorn", "asgi_app:app", "--workers", str(workers), "--bind", f"127.0.0.1:{port}"]
+    if mode == "flask":
+        return [sys.executable, "-m", "flask", "--app", "main_app", "run", "--port", str(port), "--with-threads"]
+    raise ValueError(f"Unknown server mode {mode}")
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start listening on port {port}")
+
+
+# Start the service against `database` and wait until it accepts connections.
+#   The servers read DATABASE from the environment (load_dotenv() does not
+#   override variables that are already set), so we point them at the test database.
+def start_server(command, database, port, extra_env=None):
+    env = dict(os.environ, DATABASE=database, **(extra_env or {}))
+    server = subprocess.Popen(command, cwd="app", env=env)
+    try:
+        wait_for_port(port)
+    except Exception:
+        server.terminate()
+        raise
+    return server
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
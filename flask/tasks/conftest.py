@@ -2,11 +2,19 @@
 conftest.py
 
 Supplies the necessary testing fixtures to allow for simulated testing of the flask
-application (see test_task_api.py) or database (see test_taskdb.py). Any tests for 
+application (see test_task_api.py) or database (see test_taskdb.py). Any tests for
 classes that do not require either the flask application or the database can be tested
 without using the fixtures below as test function parameters (see test_task.py).
 
-********* DO NOT MIX FIXTURES WITHIN THE SAME PYTHON TEST FILE *ßßßßß*********************
+The test database is created once per test run. Every test then runs inside a
+transaction that is rolled back when the test ends, so each test starts from the
+same (empty) database no matter which tests ran before it and in what order.
+Tests should not count on particular ids; use the ids the app hands back.
+
+Tests can run in parallel with pytest-xdist. Each worker gets a database of
+its own named after the worker (like tasks_test_gw0):
+
+    $ python -m pytest -n 4
 
 """
 import os
@@ -19,57 +27,187 @@ sys.path.append('app/')
 import pytest
 from dotenv import load_dotenv
 
-# We need to import fun_app so that we can access the app instance
+# We need to import main_app so that we can create an app instance
 import app.main_app as main_app
 import app.utils.db as UtilsDB
+from app.utils.metrics import InstrumentedConnection
+
+
+# Settings for this test run's database. TEST_DATABASE (from the .env file) when
+#   running alone, TEST_DATABASE plus the worker name (gw0, gw1, ...) when running
+#   with pytest -n, so workers never see each other's tasks
+def worker_database_config(suffix=""):
+    load_dotenv()
+    database = os.getenv("TEST_DATABASE")
+    worker = os.getenv("PYTEST_XDIST_WORKER")
+    if worker:
+        database = f"{database}_{worker}"
+    return {
+        "DBHOST": os.getenv("DBHOST"),
+        "DATABASE": database + suffix,
+        "DBUSERNAME": os.getenv("DBUSERNAME"),
+        "DBPASSWORD": os.getenv("DBPASSWORD")
+    }
+
+
+# Wraps a MySQL connection so a whole test runs in one transaction
+#   What the code under test sees as commit() only sets a savepoint and
+#   rollback() goes back to the last one, so the app behaves as usual while
+#   end() throws away everything the test did.
+class TransactionalConnection:
+    SAVEPOINT = "test_commit"
+
+    def __init__(self, conn):
+        self._conn = conn
+        # Finish whatever transaction the connection was left in
+        conn.rollback()
+        conn.start_transaction()
+        self._execute(f"SAVEPOINT {self.SAVEPOINT};")
+
+    def _execute(self, sql):
+        cursor = self._conn.cursor()
+        cursor.execute(sql)
+        cursor.close()
+
+    def commit(self):
+        self._execute(f"SAVEPOINT {self.SAVEPOINT};")
+
+    def rollback(self):
+        self._execute(f"ROLLBACK TO SAVEPOINT {self.SAVEPOINT};")
+
+    def end(self):
+        self._conn.rollback()
+
+    # Everything else (cursor(), is_connected(), ...) goes to the real connection
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+# Stands in for the app's ConnectionPool during a test
+#   Every request borrows the same connection, so they all share the test's
+#   transaction. Requests give it back with a rollback like the real pool does.
+class SingleConnectionPool:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def acquire(self):
+        return self._conn
+
+    def release(self, conn):
+        conn.rollback()
+
+    def warm(self, setup=None):
+        if setup is not None:
+            setup(self._conn)
+        return 1
+
+    def stats(self):
+        return {"size": 1, "max_overflow": 0, "in_use": 0, "idle": 1}
+
+    def close(self):
+        pass
+
+
+# The test database, created (with every migration) once per test run
+@pytest.fixture(scope='session')
+def test_database():
+    config = worker_database_config()
+    UtilsDB.reset_db(config)
+    conn = UtilsDB.connect_db(config)
+
+    yield config, conn
+
+    conn.close()
+    UtilsDB.drop_db(config)
+
+
+# One app for the whole test run, using the test database
+#   testing=True enables testing mode for the app.
+@pytest.fixture(scope='session')
+def flask_app(test_database):
+    config, _ = test_database
+    app = main_app.create_app({"DATABASE": config["DATABASE"], "TESTING": True})
+
+    yield app
+
+    # Close the cache, event log and the rest (otherwise done when the tests finish)
+    with app.app_context():
+        main_app.shut_down()
+
 
 # Here is a custom pytest fixture which yields a Flask test client which is
 # connected to the app and can simulate requests. Any test function in this
 # module that has a parameter named flask_test_client will automatically be passed
-# the flask test app. The database and the flask app maintain state per test file.
-@pytest.fixture(scope='module')
-def flask_test_client():
-    main_app.app.config["DATABASE"] = os.getenv("TEST_DATABASE")
-    # This enables testing mode for the app
-    main_app.app.testing = True
-    # A test client provides methods for simulating requests to the app
-    test_client = main_app.app.test_client()
-
-    # In order to call the init_db() function from task_app.py, we need to set
-    # up an application context.
-    with main_app.app.app_context():
-        UtilsDB.init_db(main_app.app.config)
-
-    # Any function using this fixture will be passed test_client
+# the flask test app. Whatever the test changes is rolled back when it ends.
+@pytest.fixture
+def flask_test_client(flask_app, test_database):
+    _, conn = test_database
+    conn = TransactionalConnection(conn)
+    flask_app.extensions["db_pool"] = SingleConnectionPool(
+        InstrumentedConnection(conn, flask_app.extensions["metrics"])
+    )
+
+    # Any function using this fixture will be passed the test client
     #   What's a yield?
-    #       For our purposes, the yield will hand off the test_client to all
-    #       the test cases in a file. When they are have all been executed and
-    #       are done using it, we come back to the yield and continue execution.
-    yield test_client
+    #       For our purposes, the yield will hand off the test_client to the test.
+    #       When it is done using it, we come back to the yield and continue execution.
+    yield flask_app.test_client()
+
+    conn.end()
+    # The cache and the change log would otherwise remember the rolled back tasks
+    with flask_app.app_context():
+        main_app.reset_task_cache()
+        main_app.close_task_events()
+        main_app.close_db_pool()
 
 
-# This fixture is used for database tests to load a test database in MySQL.
+# This fixture is used for database tests against the test database in MySQL.
 # Any test function in this module that has a parameter named db_test_client
-# will automatically be passed a MySQL connection. The database maintains state
-# per test file.
+# will automatically be passed a MySQL connection and cursor. Whatever the test
+# changes is rolled back when it ends.
+@pytest.fixture
+def db_test_client(test_database):
+    _, conn = test_database
+    conn = TransactionalConnection(conn)
+    cursor = conn.cursor(dictionary=True)
+
+    # Give the connection and cursor to the test
+    yield conn, cursor
+
+    # Clean-up the resources when the test is done
+    cursor.close()
+    conn.end()
+
+
+# The ASGI app (asgi_app.py) opens aiomysql connections of its own, which cannot
+# share a test's transaction, so its tests commit for real. They get a database
+# of their own, made fresh for each test file that uses asgi_test_app.
 @pytest.fixture(scope='module')
-def db_test_client():
-    load_dotenv()
+def asgi_test_app():
+    import app.asgi_app as asgi_app
 
-    config = {
-        "DBHOST": os.getenv("DBHOST"),
-        "DATABASE": os.getenv("TEST_DATABASE"),
-        "DBUSERNAME": os.getenv("DBUSERNAME"),
-        "DBPASSWORD": os.getenv("DBPASSWORD")
-    }
+    config = worker_database_config("_asgi")
+    UtilsDB.reset_db(config)
+    asgi_app.app.config.update(config)
+    asgi_app.app.config["TESTING"] = True
+
+    yield asgi_app.app
 
-    UtilsDB.init_db(config)
+    UtilsDB.drop_db(config)
+
+
+# Some statements commit on their own and cannot be rolled back (CREATE, ALTER,
+# LOCK TABLES, ...). Tests using them get a database of their own instead, made
+# fresh for each test file that uses db_scratch_client. It keeps state per test file.
+@pytest.fixture(scope='module')
+def db_scratch_client():
+    config = worker_database_config("_scratch")
+    UtilsDB.reset_db(config)
     conn = UtilsDB.connect_db(config)
     cursor = conn.cursor(dictionary=True)
 
-    # Give the connection and cursor to the tests that use this fixture
     yield conn, cursor
 
-    # Clean-up the resources when we are done with all tests in a file
     cursor.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    UtilsDB.drop_db(config)
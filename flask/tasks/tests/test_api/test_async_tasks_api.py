@@ -0,0 +1,138 @@
+import asyncio
+
+
+# Quart's test client is async, so each test hands its requests to run(), which
+#   starts the app the way an ASGI server would (opening the aiomysql pool, see
+#   asgi_app.py:create_db_pool) and gives them a client.
+#   By using the parameter asgi_test_app we get the ASGI app connected to a
+#   database of its own (see conftest.py). Its changes are committed, so the
+#   tests use the ids the app hands back and remove the tasks they add.
+def run(app, requests):
+    async def main():
+        async with app.test_app() as test_app:
+            return await requests(test_app.test_client())
+    return asyncio.run(main())
+
+
+async def add_task(client, description):
+    response = await client.post('/api/v1/tasks/', json={'description': description})
+    assert response.status_code == 200
+    return (await response.get_json())['id']
+
+
+def test_async_add_get_update_and_delete_task(asgi_test_app):
+    async def requests(client):
+        task_id = await add_task(client, 'async task')
+
+        response = await client.get(f'/api/v1/tasks/{task_id}/')
+        assert response.status_code == 200
+        assert (await response.get_json())['tasks'][0]['description'] == 'async task'
+
+        response = await client.put(f'/api/v1/tasks/{task_id}/', json={'description': 'async update'})
+        assert response.status_code == 200
+
+        response = await client.get('/api/v1/tasks/')
+        data = await response.get_json()
+        assert [task['description'] for task in data['tasks']] == ['async update']
+        assert response.headers['ETag']
+
+        response = await client.delete(f'/api/v1/tasks/{task_id}/')
+        assert response.status_code == 200
+        response = await client.get(f'/api/v1/tasks/{task_id}/')
+        assert (await response.get_json())['tasks'] == []
+
+    run(asgi_test_app, requests)
+
+
+def test_async_bulk_add_update_and_delete_tasks(asgi_test_app):
+    async def requests(client):
+        response = await client.post('/api/v1/tasks/bulk/', json={'tasks': [{'description': 'bulk A'},
+                                                                            {'description': 'bulk B'}]})
+        task_ids = (await response.get_json())['ids']
+        assert len(task_ids) == 2
+
+        response = await client.put('/api/v1/tasks/bulk/', json={'tasks': [{'id': task_ids[0], 'description': 'bulk C'}]})
+        assert (await response.get_json())['updated'] == 1
+
+        response = await client.get('/api/v1/tasks/?limit=1')
+        data = await response.get_json()
+        assert [task['description'] for task in data['tasks']] == ['bulk C']
+        assert data['next_page_token'] is not None
+
+        response = await client.delete('/api/v1/tasks/bulk/', json={'ids': task_ids})
+        assert (await response.get_json())['deleted'] == 2
+
+    run(asgi_test_app, requests)
+
+
+def test_async_task_list_pages(asgi_test_app):
+    async def requests(client):
+        response = await client.get('/task-entry')
+        assert response.status_code == 200
+
+        response = await client.post('/add-task', form={'task_description': 'async page task'})
+        assert response.status_code == 302
+
+        page = await (await client.get('/')).get_data(as_text=True)
+        assert 'async page task' in page
+
+        task_id = page.split('name="task_item" value="')[1].split('"')[0]
+        response = await client.post('/', form={'task_item': task_id})
+        assert response.status_code == 302
+        page = await (await client.get('/')).get_data(as_text=True)
+        assert 'async page task' not in page
+
+    run(asgi_test_app, requests)
+
+
+# Paging with filters and fields goes through the same code as the WSGI app
+#   (task_api.py:TaskListQuery), so the JSON is the same
+def test_async_task_list_options_and_paging(asgi_test_app):
+    async def requests(client):
+        task_ids = [await add_task(client, f'async option task {number}') for number in range(3)]
+
+        response = await client.get('/api/v1/tasks/?sort=-id&fields=description&limit=2')
+        data = await response.get_json()
+        assert data['tasks'] == [{'description': 'async option task 2'}, {'description': 'async option task 1'}]
+
+        response = await client.get(f"/api/v1/tasks/?sort=-id&fields=description&limit=2&page_token={data['next_page_token']}")
+        data = await response.get_json()
+        assert data['tasks'] == [{'description': 'async option task 0'}]
+        assert data['next_page_token'] is None
+
+        response = await client.get('/api/v1/tasks/?limit=0')
+        assert response.status_code == 400
+        response = await client.get('/api/v1/tasks/?stream=ndjson')
+        assert response.status_code == 400
+
+        await client.delete('/api/v1/tasks/bulk/', json={'ids': task_ids})
+
+    run(asgi_test_app, requests)
+
+
+# With SOFT_DELETE=1 the ASGI app only flags deleted tasks, like the WSGI app
+def test_async_soft_delete(asgi_test_app):
+    async def requests(client):
+        task_id = await add_task(client, 'async soft deleted task')
+        other_id = await add_task(client, 'async soft deleted bulk task')
+
+        await client.delete(f'/api/v1/tasks/{task_id}/')
+        response = await client.delete('/api/v1/tasks/bulk/', json={'ids': [other_id]})
+        assert (await response.get_json())['deleted'] == 1
+
+        response = await client.get('/api/v1/tasks/')
+        assert (await response.get_json())['tasks'] == []
+
+        async with asgi_test_app.extensions["db_pool"].acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT COUNT(*) FROM tasks WHERE deleted_at IS NOT NULL AND id IN (%s, %s)",
+                                     (task_id, other_id))
+                assert (await cursor.fetchone())[0] == 2
+                await cursor.execute("DELETE FROM tasks WHERE id IN (%s, %s)", (task_id, other_id))
+            await conn.commit()
+
+    asgi_test_app.config["SOFT_DELETE"] = True
+    try:
+        run(asgi_test_app, requests)
+    finally:
+        asgi_test_app.config["SOFT_DELETE"] = False
@@ -0,0 +1,48 @@
+# The HTML pages from views/task_view.py
+
+
+def test_task_list_pages_and_deletes(flask_test_client, monkeypatch):
+    monkeypatch.setitem(flask_test_client.application.config, "TASKS_PER_PAGE", 2)
+    for description in ["page one", "page two", "page three"]:
+        flask_test_client.post('/add-task', data={'task_description': description})
+
+    page = flask_test_client.get('/').data.decode()
+    assert "page one" in page and "page two" in page
+    assert "page three" not in page
+    assert "Next page" in page
+
+    # The next page link carries the id of the last task shown
+    next_page = page.split('Next page')[0].rsplit('href="', 1)[1].split('"')[0].replace("&amp;", "&")
+    page = flask_test_client.get(next_page).data.decode()
+    assert "page three" in page
+    assert "Next page" not in page
+
+    # Deleting sends us back to the same page, which says how many tasks were deleted
+    task_id = page.split('name="task_item" value="')[1].split('"')[0]
+    request = flask_test_client.post(next_page, data={'task_item': [task_id, '999999999']})
+    assert request.status_code == 302
+    page = flask_test_client.get(request.headers['Location']).data.decode()
+    assert "Deleted 1 task" in page
+    assert "page three" not in page
+
+    # The rows of the first page come from the fragment cache this time
+    hits = flask_test_client.get('/stats/cache').get_json()['fragments']['hits']
+    page = flask_test_client.get('/').data.decode()
+    assert "page one" in page and "Next page" not in page
+    assert flask_test_client.get('/stats/cache').get_json()['fragments']['hits'] == hits + 2
+
+
+# A task deleted through another process (which cannot touch this process's
+#   cache) must not stay on the page: the page is cached under the tasks version
+def test_task_list_sees_changes_from_other_processes(flask_test_client):
+    flask_test_client.post('/add-task', data={'task_description': 'other process'})
+    assert "other process" in flask_test_client.get('/').data.decode()
+
+    conn = flask_test_client.application.extensions["db_pool"].acquire()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tasks WHERE description = 'other process';")
+    cursor.execute("UPDATE tasks_version SET version = version + 1, updated_at = NOW(6) WHERE id = 1;")
+    cursor.close()
+    conn.commit()
+
+    assert "other process" not in flask_test_client.get('/').data.decode()
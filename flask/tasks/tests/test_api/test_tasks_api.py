@@ -18,7 +18,7 @@ def test_posting_a_task(flask_test_client):
     data = json.loads(request.data.decode())
 
     assert data['status'] == "success"
-    assert data['id'] == 1
+    first_id = data['id']
 
     request = flask_test_client.post('api/v1/tasks/', json={'description': 'second task'})
 
@@ -29,11 +29,22 @@ def test_posting_a_task(flask_test_client):
     # object.
     data = json.loads(request.data.decode())
 
-    assert data['id'] == 2
+    # Ids keep counting up, even across tests whose tasks were rolled back,
+    #   so only compare them with each other
+    assert data['id'] == first_id + 1
+
+
+# Add a task through the api and return its id
+def add_task(flask_test_client, description):
+    request = flask_test_client.post('/api/v1/tasks/', json={'description': description})
+    assert request.status_code == 200
+    return json.loads(request.data.decode())['id']
 
 
 def test_get_all_tasks(flask_test_client):
-    
+    first_id = add_task(flask_test_client, 'first task')
+    second_id = add_task(flask_test_client, 'second task')
+
     # Here is how to use the test client to simulate a GET request
     request = flask_test_client.get('/api/v1/tasks/')
 
@@ -44,7 +55,7 @@ def test_get_all_tasks(flask_test_client):
     # Make sure we got a status code of 200
     assert request.status_code == 200
 
-    # Verify data
+    # Verify data (each test starts with no tasks)
     assert len(data['tasks']) == 2
 
     # When getting all the tasks, we cannot rely on the ordering because I did
@@ -52,9 +63,9 @@ def test_get_all_tasks(flask_test_client):
     #   assumptions about order unless you have explicity
     #   ensured that the content will be ordered
     for task in data['tasks']:
-        if task['id'] == 1:
+        if task['id'] == first_id:
             assert task['description'] == 'first task'
-        elif task['id'] == 2:
+        elif task['id'] == second_id:
             assert task['description'] == 'second task'
         else:
             # We should not get here as there are only two items inserted
@@ -62,9 +73,10 @@ def test_get_all_tasks(flask_test_client):
 
 
 def test_get_task_by_id(flask_test_client):
-    
+    task_id = add_task(flask_test_client, 'first task')
+
     # Here is how to use the test client to simulate a GET request
-    request = flask_test_client.get('/api/v1/tasks/1/')
+    request = flask_test_client.get(f'/api/v1/tasks/{task_id}/')
 
     # The body of the response is JSON, so we turn it from a string into a JSON
     # object.
@@ -75,17 +87,21 @@ def test_get_task_by_id(flask_test_client):
 
     assert len(data['tasks']) == 1
 
-    # Get the first item from the list of tasks (which should only be task id 1)
+    # Get the first item from the list of tasks (which should only be the task we added)
     task = data['tasks'][0]
 
     # Check the id and description
-    assert task['id'] == 1
+    assert task['id'] == task_id
     assert task['description'] == 'first task'
 
 
 def test_get_task_by_description_search(flask_test_client):
+    add_task(flask_test_client, 'first task')
+    task_id = add_task(flask_test_client, 'second task')
 
     # Here is how to use the test client to simulate a GET request with a query string
+    #   (FULLTEXT indexes only see committed rows, so inside the test's transaction
+    #   this finds the task with the LIKE fallback)
     request = flask_test_client.get('/api/v1/tasks/?search=second')
 
     # The body of the response is JSON, so we turn it from a string into a JSON
@@ -102,22 +118,18 @@ def test_get_task_by_description_search(flask_test_client):
     #   the task from the list of tasks via its index
     task = data['tasks'][0]
 
-    assert task['id'] == 2
+    assert task['id'] == task_id
     assert task['description'] == 'second task'
 
 
 def test_update_task_by_id(flask_test_client):
-    
+
     # Add a new task to the list
-    request = flask_test_client.post('/api/v1/tasks/', json={'description': 'task to be updated'})
-    assert request.status_code == 200
-    
-    data = json.loads(request.data.decode())
-    task_id = data['id']
+    task_id = add_task(flask_test_client, 'task to be updated')
 
     # Here is how to use the test client to simulate a PUT request
     request = flask_test_client.put(f'/api/v1/tasks/{task_id}/', json={'description': 'updated via test'})
-    
+
     # Make sure we got a status code of 200
     assert request.status_code == 200
 
@@ -130,3 +142,242 @@ def test_update_task_by_id(flask_test_client):
     task = data['tasks'][0]
     assert task['id'] == task_id
     assert task['description'] == 'updated via test'
+
+
+def test_get_tasks_paginated(flask_test_client):
+    task_ids = [add_task(flask_test_client, f'page task {number}') for number in range(3)]
+
+    # There are three tasks in the database, so asking for pages of two tasks
+    #   should give us a full page and then a partial page
+    request = flask_test_client.get('/api/v1/tasks/?limit=2')
+    assert request.status_code == 200
+
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[:2]
+    assert data['next_page_token'] is not None
+
+    # The token from the first page is used to ask for the page after it
+    request = flask_test_client.get(f"/api/v1/tasks/?limit=2&page_token={data['next_page_token']}")
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[2:]
+    assert data['next_page_token'] is None
+
+    # after_id can be used instead of a token
+    request = flask_test_client.get(f'/api/v1/tasks/?after_id={task_ids[1]}')
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[2:]
+
+
+def test_get_tasks_streamed(flask_test_client):
+    task_ids = [add_task(flask_test_client, f'streamed task {number}') for number in range(3)]
+
+    # Each line of an NDJSON response is a JSON object for one task
+    request = flask_test_client.get('/api/v1/tasks/?stream=ndjson')
+    assert request.status_code == 200
+
+    lines = request.data.decode().splitlines()
+    tasks = [json.loads(line) for line in lines]
+    assert [task['id'] for task in tasks] == task_ids
+
+    # The streamed JSON document has the same shape as the regular response
+    request = flask_test_client.get('/api/v1/tasks/?stream=json')
+    data = json.loads(request.data.decode())
+    assert data['status'] == "success"
+    assert len(data['tasks']) == 3
+    assert request.headers['ETag']
+
+    # Filters, sort and fields apply to streams too
+    request = flask_test_client.get('/api/v1/tasks/?stream=ndjson&sort=-id&fields=id')
+    tasks = [json.loads(line) for line in request.data.decode().splitlines()]
+    assert tasks == [{'id': task_id} for task_id in task_ids[::-1]]
+
+    # Unknown stream formats, searches and pages are refused
+    assert flask_test_client.get('/api/v1/tasks/?stream=xml').status_code == 400
+    assert flask_test_client.get('/api/v1/tasks/?stream=json&search=streamed').status_code == 400
+
+
+def test_bulk_add_update_and_delete_tasks(flask_test_client):
+    before_id = add_task(flask_test_client, 'already there')
+
+    # The new tasks get the next three ids
+    request = flask_test_client.post('/api/v1/tasks/bulk/', json={'tasks': [
+        {'description': 'bulk one'},
+        {'description': 'bulk two'},
+        {'description': 'bulk three'},
+    ]})
+    assert request.status_code == 200
+
+    task_ids = json.loads(request.data.decode())['ids']
+    assert task_ids == [before_id + 1, before_id + 2, before_id + 3]
+
+    request = flask_test_client.put('/api/v1/tasks/bulk/', json={'tasks': [
+        {'id': task_ids[0], 'description': 'bulk one updated'},
+        {'id': task_ids[2], 'description': 'bulk three updated'},
+    ]})
+    data = json.loads(request.data.decode())
+    assert data['updated'] == 2
+
+    request = flask_test_client.get(f'/api/v1/tasks/{task_ids[2]}/')
+    data = json.loads(request.data.decode())
+    assert data['tasks'][0]['description'] == 'bulk three updated'
+
+    request = flask_test_client.delete('/api/v1/tasks/bulk/', json={'ids': task_ids})
+    data = json.loads(request.data.decode())
+    assert data['deleted'] == 3
+
+    request = flask_test_client.get(f'/api/v1/tasks/?after_id={before_id}')
+    data = json.loads(request.data.decode())
+    assert len(data['tasks']) == 0
+
+
+def test_conditional_get_tasks(flask_test_client):
+    add_task(flask_test_client, 'old version')
+
+    # Every response carries an ETag describing the current version of the tasks
+    request = flask_test_client.get('/api/v1/tasks/')
+    assert request.status_code == 200
+    etag = request.headers['ETag']
+
+    # Asking again with the same ETag means nothing needs to be sent back
+    request = flask_test_client.get('/api/v1/tasks/', headers={'If-None-Match': etag})
+    assert request.status_code == 304
+    assert request.data == b''
+
+    # After a change the old ETag no longer matches and we get the tasks again
+    add_task(flask_test_client, 'new version')
+    request = flask_test_client.get('/api/v1/tasks/', headers={'If-None-Match': etag})
+    assert request.status_code == 200
+    assert request.headers['ETag'] != etag
+
+
+def test_get_tasks_paginated_newest_first(flask_test_client):
+    task_ids = [add_task(flask_test_client, f'page task {number}') for number in range(3)]
+
+    request = flask_test_client.get('/api/v1/tasks/?sort=-id&limit=2')
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[:0:-1]
+
+    # The token remembers the - so the next page carries on downwards
+    request = flask_test_client.get(f"/api/v1/tasks/?sort=-id&limit=2&page_token={data['next_page_token']}")
+    assert request.status_code == 200
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[:1]
+    assert data['next_page_token'] is None
+
+
+def test_search_tasks_paginated(flask_test_client):
+    task_ids = [add_task(flask_test_client, f'buy milk {number}') for number in range(3)]
+    add_task(flask_test_client, 'buy bread')
+
+    # Only the tasks that match the search are paged through
+    request = flask_test_client.get('/api/v1/tasks/?search=milk&limit=2')
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[:2]
+
+    request = flask_test_client.get(f"/api/v1/tasks/?search=milk&limit=2&page_token={data['next_page_token']}")
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[2:]
+    assert data['next_page_token'] is None
+
+
+def test_page_token_keeps_search_mode():
+    from app.api.task_api import encode_page_token, decode_page_token
+
+    token = encode_page_token({'id': 7}, search_mode="fulltext")
+    assert decode_page_token(token) == {'after_id': 7, 'search_mode': "fulltext"}
+    assert decode_page_token(encode_page_token({'id': 7}, "-id", "like"), "-id") == {'after_id': 7, 'search_mode': "like"}
+
+    # Only the known modes are accepted
+    assert decode_page_token(encode_page_token({'id': 7}, search_mode="regexp")) is None
+
+
+# TaskListQuery only calls methods on the taskdb it is given, so the reading of the
+#   query string and the JSON body (shared with the ASGI app) can be checked with a
+#   stand-in that records the call and returns its own tasks.
+def test_task_list_query_reads_args_and_builds_body():
+    from werkzeug.datastructures import MultiDict
+    from app.api.task_api import TaskListQuery, decode_page_token
+
+    class RecordingTaskDB:
+        def search_tasks_page(self, text, mode, **options):
+            self.call = ("search_tasks_page", text, mode, options)
+            return "like", [{'id': 3, 'description': 'mi'}, {'id': 5, 'description': 'mi'}]
+
+    taskdb = RecordingTaskDB()
+    task_list = TaskListQuery(MultiDict({'search': 'mi', 'limit': '1', 'fields': 'description'}))
+    body = task_list.body(task_list.run(taskdb))
+
+    assert taskdb.call == ("search_tasks_page", 'mi', None, {'limit': 2, 'fields': ('description', 'id')})
+    assert body['tasks'] == [{'description': 'mi'}]
+    assert decode_page_token(body['next_page_token']) == {'after_id': 3, 'search_mode': "like"}
+
+    for args in ({'limit': '0'}, {'page_token': 'nonsense'}, {'completed': 'maybe'}):
+        try:
+            TaskListQuery(MultiDict(args))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{args} should be refused")
+
+
+def test_get_tasks_filtered_sorted_and_projected(flask_test_client):
+    descriptions = ['first task', 'second task', 'third task', 'fourth task']
+    task_ids = [add_task(flask_test_client, description) for description in descriptions]
+
+    # None of the tasks are completed
+    request = flask_test_client.get('/api/v1/tasks/?completed=1')
+    assert json.loads(request.data.decode())['tasks'] == []
+
+    request = flask_test_client.get('/api/v1/tasks/?completed=0&sort=-id&fields=id,description')
+    data = json.loads(request.data.decode())
+    assert [task['id'] for task in data['tasks']] == task_ids[::-1]
+    assert set(data['tasks'][0]) == {'id', 'description'}
+
+    # Paging through the newest tasks first, only asking for the descriptions
+    request = flask_test_client.get('/api/v1/tasks/?sort=-creation_datetime&fields=description&limit=3')
+    data = json.loads(request.data.decode())
+    assert [set(task) for task in data['tasks']] == [{'description'}] * 3
+
+    request = flask_test_client.get(
+        f"/api/v1/tasks/?sort=-creation_datetime&fields=description&limit=3&page_token={data['next_page_token']}"
+    )
+    last_page = json.loads(request.data.decode())
+    assert sorted(task['description'] for task in data['tasks'] + last_page['tasks']) == sorted(descriptions)
+    assert last_page['next_page_token'] is None
+
+    # A token only works with the sort it was made for
+    request = flask_test_client.get(f"/api/v1/tasks/?limit=3&page_token={data['next_page_token']}")
+    assert request.status_code == 400
+
+    request = flask_test_client.get('/api/v1/tasks/?sort=description')
+    assert request.status_code == 400
+
+
+# Read the first count messages of a Server-Sent Events stream and close it
+def read_events(flask_test_client, count, last_event_id):
+    response = flask_test_client.get('/api/v1/tasks/stream', headers={"Last-Event-ID": last_event_id}, buffered=False)
+    assert response.mimetype == "text/event-stream"
+    messages = []
+    for chunk in response.iter_encoded():
+        messages.append(chunk.decode())
+        if len(messages) == count:
+            break
+    response.close()
+    return [dict(line.split(": ", 1) for line in message.strip().splitlines()) for message in messages]
+
+
+def test_task_stream_sends_changes_and_resumes(flask_test_client):
+
+    # An unknown id gets a reset event, whose id is where the log is now
+    _, reset = read_events(flask_test_client, 2, "unknown")
+    assert reset['event'] == "reset"
+
+    task_id = add_task(flask_test_client, "streamed task")
+    flask_test_client.delete(f'/api/v1/tasks/{task_id}/')
+
+    # Reconnecting with the last id we saw sends the changes we missed
+    _, created, deleted = read_events(flask_test_client, 3, reset['id'])
+    assert created['event'] == "created"
+    assert json.loads(created['data'])['description'] == "streamed task"
+    assert deleted['event'] == "deleted"
+    assert json.loads(deleted['data']) == {"id": task_id}
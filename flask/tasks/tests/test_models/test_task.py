@@ -1,7 +1,7 @@
 import pytest
 from datetime import datetime
 
-from app.models.task import Task
+from app.models.task import Task, select_tasks_query
 
 def test_task_constructor():
     desc = "My task"
@@ -40,3 +40,39 @@ def test_task_properties_exceptions():
     # Cannot use set property on creation_datetime
     with pytest.raises(AttributeError):
         t.creation_datetime = datetime.now()
+
+
+def test_select_tasks_query():
+    sql, params = select_tasks_query(fields=("id", "description"), completed=False,
+                                     created_after=datetime(2022, 4, 21), sort="creation_datetime",
+                                     descending=True, after_id=10, after_value=datetime(2022, 4, 22), limit=50)
+
+    assert sql.startswith("SELECT id, description from tasks WHERE ")
+    assert "ORDER BY creation_datetime DESC, id DESC LIMIT %s" in sql
+    assert params == [0, datetime(2022, 4, 21), datetime(2022, 4, 22), datetime(2022, 4, 22), 10, 50]
+    assert sql.count("%s") == len(params)
+
+
+def test_select_tasks_query_search_order():
+    # Without a sort or a page the best matches come first
+    sql, params = select_tasks_query(match="milk*")
+    assert "ORDER BY MATCH(description) AGAINST (%s IN BOOLEAN MODE) DESC, id;" in sql
+    assert params == ["milk*", "milk*"]
+
+    # Pages are in id order so the next one can start after the last id
+    sql, params = select_tasks_query(match="milk*", after_id=10, limit=50)
+    assert "ORDER BY id LIMIT %s" in sql
+    assert params == ["milk*", 10, 50]
+
+
+def test_task_from_rows():
+    created = datetime(2022, 4, 21, 11, 10, 53)
+    tasks = Task.from_rows([(1, "first task", created, 0), (2, "second task", created, 1)])
+
+    assert [t.id for t in tasks] == [1, 2]
+    assert tasks[1].completed == True
+    assert tasks[0].to_dict() == {"id": 1, "description": "first task", "creation_datetime": created, "completed": 0}
+
+    # __slots__ means a Task has no __dict__ to hold other attributes
+    with pytest.raises(AttributeError):
+        tasks[0].priority = 1
@@ -3,28 +3,188 @@ from app.models.task import Task, TaskDB
 # By using the parameter db_test_client, we automatically get access to our test
 #   database provided by the pytest fixture in conftest.py
 #   (note the parameter name matches the name of the fixture function).
+#   Each test starts with an empty tasks table and its changes are rolled back
+#   afterwards, so use the ids TaskDB hands back instead of guessing them.
 def test_task_insert(db_test_client):
-    # The test fixture only setups the 
+    # The test fixture only sets up the connection and cursor
     conn, cursor = db_test_client
     taskdb = TaskDB(conn, cursor)
 
-    taskdb.insert_task(Task("Hi there"))
-    
-    result = taskdb.select_task_by_id(1)[0]
+    task_id = taskdb.insert_task(Task("Hi there"))['task_id']
+
+    result = taskdb.select_task_by_id(task_id)[0]
     assert result['description'] == "Hi there"
-    conn.commit()
 
 
 def test_task_delete(db_test_client):
     conn, cursor = db_test_client
     taskdb = TaskDB(conn, cursor)
-    
-    taskdb.insert_task(Task("Delete Me!"))
 
-    result = taskdb.select_task_by_id(2)[0]
+    task_id = taskdb.insert_task(Task("Delete Me!"))['task_id']
+
+    result = taskdb.select_task_by_id(task_id)[0]
     assert result['description'] == "Delete Me!"
 
-    taskdb.delete_task_by_id(2)
-    result = taskdb.select_task_by_id(2)
+    taskdb.delete_task_by_id(task_id)
+    result = taskdb.select_task_by_id(task_id)
     assert len(result) == 0
-    conn.commit()
+
+
+def test_task_bulk_insert_and_delete(db_test_client):
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor)
+
+    task_ids = taskdb.insert_tasks([Task("Bulk A"), Task("Bulk B"), Task("Bulk C")])
+    assert len(task_ids) == 3
+
+    for task_id, description in zip(task_ids, ["Bulk A", "Bulk B", "Bulk C"]):
+        assert taskdb.select_task_by_id(task_id)[0]['description'] == description
+
+    assert taskdb.delete_tasks(task_ids) == 3
+    for task_id in task_ids:
+        assert len(taskdb.select_task_by_id(task_id)) == 0
+
+
+def test_task_writes_bump_version_once(db_test_client):
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor)
+    version = taskdb.select_tasks_version()["version"]
+
+    # One bulk insert is one transaction, so the version goes up by one
+    task_ids = taskdb.insert_tasks([Task(f"Version {number}") for number in range(5)])
+    assert taskdb.select_tasks_version()["version"] == version + 1
+
+    taskdb.delete_tasks(task_ids)
+    assert taskdb.select_tasks_version()["version"] == version + 2
+
+
+def test_task_prepared_statements(db_test_client):
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor, prepared=True)
+
+    task_id = taskdb.insert_task(Task("Prepared"))['task_id']
+    assert taskdb.select_task_by_id(task_id)[0]['description'] == "Prepared"
+
+    # A second TaskDB on the same connection reuses the prepared statements
+    taskdb = TaskDB(conn, cursor, prepared=True)
+    taskdb.update_task(task_id, Task("Prepared again"))
+    assert taskdb.select_task_by_id(task_id)[0]['description'] == "Prepared again"
+
+    taskdb.delete_task_by_id(task_id)
+    assert len(taskdb.select_task_by_id(task_id)) == 0
+
+
+def test_task_reserved_ids(db_test_client):
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor)
+
+    task_ids = taskdb.reserve_task_ids(10)
+    taskdb.insert_tasks_with_ids([Task("Reserved A"), Task("Reserved B")], task_ids[:2])
+    assert taskdb.select_task_by_id(task_ids[1])[0]['description'] == "Reserved B"
+
+    # AUTO_INCREMENT continues after the reserved block
+    assert taskdb.insert_task(Task("After the block"))['task_id'] >= task_ids[-1] + 1
+
+
+def test_task_select_task_objects(db_test_client):
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor)
+    taskdb.insert_tasks([Task(f"Object {number}") for number in range(5)])
+
+    rows = taskdb.select_tasks(sort="id")
+    tasks = taskdb.select_task_objects(sort="id")
+    assert [task.to_dict()['id'] for task in tasks] == [row['id'] for row in rows]
+    assert [task.description for task in tasks] == [row['description'] for row in rows]
+
+    batches = list(taskdb.iter_task_objects(batch_size=2))
+    assert len(batches) == 3
+    assert all(len(batch) <= 2 for batch in batches)
+    assert [task.id for batch in batches for task in batch] == [task.id for task in tasks]
+
+
+def test_task_export_and_import(db_test_client, tmp_path):
+    from app.utils.transfer import export_tasks, import_tasks
+
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor)
+    taskdb.insert_tasks([Task(f"Transfer {number}") for number in range(5)])
+
+    path = str(tmp_path / "tasks.ndjson")
+    assert export_tasks(taskdb, path, batch_size=2) == 5
+
+    # The test connection does not allow LOAD DATA LOCAL INFILE, so this also
+    #   checks the INSERT fallback
+    result = import_tasks(conn, path, batch_size=2)
+    assert result == {"read": 5, "added": 5, "method": "insert"}
+    descriptions = [row['description'] for row in taskdb.select_tasks(sort="id")]
+    assert descriptions == [f"Transfer {number}" for number in range(5)] * 2
+
+
+def test_task_soft_delete_and_purge(db_test_client):
+    conn, cursor = db_test_client
+    taskdb = TaskDB(conn, cursor, soft_delete=True)
+    task_ids = taskdb.insert_tasks([Task("Soft A"), Task("Soft B"), Task("Soft C")])
+
+    taskdb.delete_task_by_id(task_ids[0])
+    assert taskdb.delete_tasks(task_ids[1:2]) == 1
+    assert [row['id'] for row in taskdb.select_tasks(sort="id")] == task_ids[2:]
+    assert len(taskdb.select_task_by_id(task_ids[0])) == 0
+
+    # The deleted tasks are still in the table until they are purged
+    cursor.execute("SELECT COUNT(*) AS flagged FROM tasks WHERE deleted_at IS NOT NULL;")
+    assert cursor.fetchone()['flagged'] == 2
+    assert taskdb.deleted_backlog()['pending'] == 2
+
+    assert taskdb.purge_deleted_tasks(limit=1) == 1
+    assert taskdb.purge_deleted_tasks(limit=10) == 1
+    assert taskdb.deleted_backlog() == {"pending": 0, "lag_seconds": 0.0}
+    assert [row['id'] for row in taskdb.select_tasks(sort="id")] == task_ids[2:]
+
+
+# InnoDB only adds committed rows to a FULLTEXT index, so the tests above (whose
+#   changes are never committed) always get the LIKE fallback of search_tasks().
+#   db_scratch_client really commits, so here the MATCH search is used.
+def test_task_fulltext_search(db_scratch_client):
+    conn, cursor = db_scratch_client
+    taskdb = TaskDB(conn, cursor)
+    task_ids = taskdb.insert_tasks(
+        [Task("Buy milk"), Task("Buttermilk pancakes"), Task("Milk, milk and more milk")]
+        + [Task(f"Walk the dog {number}") for number in range(10)]
+    )
+
+    # The task that says milk most often comes first even though it was added
+    #   last, and "Buttermilk" is left out as no word in it starts with milk.
+    #   The LIKE search would have listed all three in id order.
+    result = taskdb.search_tasks("milk")
+    assert [row['id'] for row in result] == [task_ids[2], task_ids[0]]
+
+    # The same search with a filter goes through select_tasks_query's MATCH
+    assert [row['id'] for row in taskdb.search_tasks("milk", completed=False)] == [task_ids[2], task_ids[0]]
+
+    # "ilk" is not the start of a word, so only the LIKE fallback finds it
+    assert len(taskdb.search_tasks("ilk")) == 3
+
+    taskdb.delete_tasks(task_ids)
+
+
+# Paging through a search past its last FULLTEXT match must not switch to the
+#   LIKE search, which would add "Buttermilk" (and the tasks before it) to the last page
+def test_task_fulltext_search_pages_keep_their_mode(db_scratch_client):
+    conn, cursor = db_scratch_client
+    taskdb = TaskDB(conn, cursor)
+    task_ids = taskdb.insert_tasks([Task("Buy milk"), Task("Milk the cow"), Task("Buttermilk pancakes")])
+
+    mode, first_page = taskdb.search_tasks_page("milk", limit=2)
+    assert mode == "fulltext"
+    assert [row['id'] for row in first_page] == task_ids[:2]
+
+    mode, next_page = taskdb.search_tasks_page("milk", mode, after_id=task_ids[1], limit=2)
+    assert (mode, next_page) == ("fulltext", [])
+
+    # Without the mode the empty page would have fallen back to LIKE
+    assert taskdb.search_tasks_page("milk", after_id=task_ids[1], limit=2)[0] == "like"
+
+    # Text too short for the index is always searched with LIKE
+    assert taskdb.search_tasks_page("mi", "fulltext", limit=5)[0] == "like"
+
+    taskdb.delete_tasks(task_ids)
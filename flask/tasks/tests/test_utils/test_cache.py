@@ -0,0 +1,185 @@
+import time
+
+from app.models.task import Task, TaskDB
+from datetime import datetime
+
+from app.utils.cache import LRUCache, RedisCache
+
+
+def test_lru_cache_get_and_set():
+    cache = LRUCache(max_entries=10, ttl=30)
+
+    assert cache.get("a") is None
+    cache.set("a", [1, 2, 3])
+    assert cache.get("a") == [1, 2, 3]
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    # Reading "a" makes "b" the least recently used entry
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(max_entries=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_lru_cache_counters_are_not_evicted():
+    cache = LRUCache(max_entries=1, ttl=30)
+    assert cache.incr("generation") == 1
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.counter("generation") == 1
+
+
+# Stands in for redis.Redis, keeping the bytes RedisCache stores in a dict
+class DictRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+
+def test_redis_cache_stores_json():
+    client = DictRedis()
+    cache = RedisCache(client)
+    tasks = [{"id": 1, "description": "cached", "creation_datetime": datetime(2022, 4, 21, 11, 10, 53), "completed": 0}]
+
+    cache.set("list", tasks)
+    cache.set("search", ("fulltext", tasks))
+
+    assert cache.get("list") == tasks
+    mode, result = cache.get("search")
+    assert (mode, result) == ("fulltext", tasks)
+    # Readable JSON in Redis, not a pickle
+    assert client.values["tasks-cache:list"].startswith(b'[{"id":1,')
+
+
+# Records the queries TaskDB runs so we can tell when the cache answered instead
+class FakeCursor:
+    def __init__(self):
+        self.queries = 0
+        self.lastrowid = 1
+        self.rowcount = 1
+
+    def execute(self, query, params=()):
+        self.queries += 1
+
+    def fetchall(self):
+        return [{"id": 1, "description": "cached"}]
+
+    def fetchone(self):
+        return {"task_id": 1}
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+
+def test_taskdb_reads_through_cache_and_invalidates_on_write():
+    cursor = FakeCursor()
+    taskdb = TaskDB(FakeConnection(), cursor, LRUCache())
+
+    taskdb.select_all_tasks()
+    taskdb.select_task_by_id(1)
+    assert cursor.queries == 2
+
+    # Repeated reads are answered from the cache
+    taskdb.select_all_tasks()
+    taskdb.select_task_by_id(1)
+    assert cursor.queries == 2
+
+    # Updating task 1 forgets both the task and every cached list
+    taskdb.update_task(1, Task("changed"))
+    queries = cursor.queries
+    taskdb.select_all_tasks()
+    taskdb.select_task_by_id(1)
+    assert cursor.queries == queries + 2
+
+
+class FakePreparedConnection(FakeConnection):
+    def __init__(self):
+        self.cursors = []
+
+    def cursor(self, **kwargs):
+        assert kwargs == {"prepared": True, "dictionary": True}
+        self.cursors.append(FakeCursor())
+        return self.cursors[-1]
+
+
+def test_taskdb_reuses_prepared_cursors_per_connection():
+    conn = FakePreparedConnection()
+
+    TaskDB(conn, None, prepared=True).select_task_by_id(1)
+    TaskDB(conn, None, prepared=True).select_task_by_id(2)
+    TaskDB(conn, None, prepared=True).select_all_tasks()
+
+    # One cursor per statement, shared by every TaskDB on the connection
+    assert len(conn.cursors) == 2
+    assert conn.cursors[0].queries == 2
+
+
+def test_taskdb_deferred_commit_invalidates_on_commit():
+    cursor = FakeCursor()
+    taskdb = TaskDB(FakeConnection(), cursor, LRUCache())
+    taskdb.select_all_tasks()
+
+    assert taskdb.insert_task(Task("later"), commit=False) == {"task_id": 1}
+    queries = cursor.queries
+    taskdb.select_all_tasks()
+    assert cursor.queries == queries
+
+    # commit() also bumps the tasks version
+    taskdb.commit()
+    queries = cursor.queries
+    taskdb.select_all_tasks()
+    assert cursor.queries == queries + 1
+
+
+# Answers SELECT_TASKS_VERSION with the version the test sets
+class VersionedCursor(FakeCursor):
+    version = 1
+
+    def fetchone(self):
+        return {"version": self.version, "updated_at": 0}
+
+
+def test_taskdb_keys_cached_reads_by_tasks_version():
+    cache = LRUCache()
+    cursor = VersionedCursor()
+
+    # Each TaskDB stands in for one request, reading the version for its ETag first
+    def request():
+        taskdb = TaskDB(FakeConnection(), cursor, cache)
+        taskdb.select_tasks_version()
+        taskdb.select_all_tasks()
+        taskdb.select_task_by_id(1)
+
+    request()
+    request()
+    assert cursor.queries == 4
+
+    # Another process changed the tasks, nothing was invalidated in this cache
+    cursor.version = 2
+    request()
+    assert cursor.queries == 7
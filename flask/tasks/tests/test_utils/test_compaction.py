@@ -0,0 +1,51 @@
+import threading
+
+from app.utils.compaction import Compactor
+
+
+# Stands in for the database: waiting tasks are purged batch_size at a time
+class FakeDatabase:
+    def __init__(self, waiting):
+        self.waiting = waiting
+        self.batches = []
+        self.fail = False
+        self.idle = threading.Event()
+
+    def compact(self, batch_size):
+        if self.fail:
+            self.idle.set()
+            raise RuntimeError("database is down")
+        purged = min(batch_size, self.waiting)
+        self.waiting -= purged
+        self.batches.append(purged)
+        if purged < batch_size:
+            self.idle.set()
+        return purged, self.waiting, 1.5 if self.waiting else 0.0
+
+
+def test_compactor_purges_in_batches_until_idle():
+    database = FakeDatabase(waiting=25)
+    compactor = Compactor(database.compact, batch_size=10, interval=0, idle_interval=60)
+
+    assert database.idle.wait(5)
+    compactor.close()
+    assert database.batches == [10, 10, 5]
+    stats = compactor.stats()
+    assert stats["purged"] == 25
+    assert stats["batches"] == 3
+    assert stats["pending"] == 0
+    assert stats["lag_seconds"] == 0.0
+
+
+def test_compactor_counts_errors_and_keeps_running():
+    database = FakeDatabase(waiting=5)
+    database.fail = True
+    compactor = Compactor(database.compact, batch_size=10, interval=0, idle_interval=0.01)
+
+    assert database.idle.wait(5)
+    database.idle.clear()
+    database.fail = False
+    assert database.idle.wait(5)
+    compactor.close()
+    assert compactor.stats()["errors"] >= 1
+    assert compactor.stats()["purged"] == 5
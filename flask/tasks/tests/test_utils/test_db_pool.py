@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+from app.utils.db import ConnectionPool, PoolTimeoutError
+
+
+# A stand-in for a MySQL connection so the pool can be tested without a
+#   database server. It only implements the methods the pool calls.
+class FakeConnection:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def fake_connect(config):
+    return FakeConnection()
+
+
+def test_pool_reuses_connections():
+    pool = ConnectionPool({}, size=2, max_overflow=0, connect=fake_connect)
+
+    conn = pool.acquire()
+    pool.release(conn)
+
+    # The same connection should come back out instead of a new one
+    assert pool.acquire() is conn
+    assert conn.rollbacks == 1
+    assert pool.stats()["connections_opened"] == 1
+    assert pool.stats()["in_use"] == 1
+
+
+def test_pool_closes_overflow_connections():
+    pool = ConnectionPool({}, size=1, max_overflow=1, connect=fake_connect)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    pool.release(second)
+
+    # Only size connections are kept around when idle
+    assert not first.closed
+    assert second.closed
+    assert pool.stats()["idle"] == 1
+
+
+def test_pool_replaces_unhealthy_connections():
+    pool = ConnectionPool({}, size=1, max_overflow=0, connect=fake_connect)
+
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.connected = False
+
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()["connections_discarded"] == 1
+
+
+def test_pool_replaces_idle_connections():
+    pool = ConnectionPool({}, size=1, max_overflow=0, idle_timeout=0, connect=fake_connect)
+
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is not conn
+
+
+def test_pool_checkout_timeout():
+    pool = ConnectionPool({}, size=1, max_overflow=0, checkout_timeout=0.05, connect=fake_connect)
+
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+
+
+def test_pool_waiter_gets_released_connection():
+    pool = ConnectionPool({}, size=1, max_overflow=0, checkout_timeout=5, connect=fake_connect)
+    conn = pool.acquire()
+    borrowed = []
+
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join()
+
+    assert borrowed == [conn]
+
+
+def test_pool_warm_opens_connections_up_front():
+    pool = ConnectionPool({}, size=3, max_overflow=2, connect=fake_connect)
+    set_up = []
+
+    assert pool.warm(setup=set_up.append) == 3
+    assert len(set_up) == 3
+    assert pool.stats()["idle"] == 3
+    assert pool.stats()["in_use"] == 0
+
+    # The first borrower gets one of the warm connections
+    assert pool.acquire() in set_up
+    assert pool.stats()["connections_opened"] == 3
@@ -0,0 +1,86 @@
+from app.models.task import Task, TaskDB
+from app.utils.events import EventLog
+
+
+class FakeCursor:
+    lastrowid = 7
+    rowcount = 1
+
+    def execute(self, query, params=()):
+        pass
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+
+def test_event_log_resumes_after_last_event_id():
+    events = EventLog(max_events=3)
+    first = events.publish("created", {"id": 1})
+    events.publish("updated", {"id": 1, "description": "changed"})
+
+    position = events.position(events.event_id(first))
+    missed, complete = events.events_after(position)
+    assert complete
+    assert [event.kind for event in missed] == ["updated"]
+
+    # Ids from another log (like before a restart) or from the future are not trusted
+    assert events.position("deadbeef-1") is None
+    assert events.position(events.event_id(99)) is None
+
+    # Once the log has dropped events the client missed, it has to start over
+    for number in range(3):
+        events.publish("deleted", {"id": number})
+    missed, complete = events.events_after(position)
+    assert not complete
+
+    # Nothing new: wait gives up after the timeout
+    assert events.wait(events.last_position(), timeout=0.01) == ([], True)
+
+
+def test_event_log_limits_open_streams():
+    events = EventLog(max_streams=1)
+    assert events.open_stream()
+    assert not events.open_stream()
+
+    events.close_stream()
+    assert events.open_stream()
+    assert events.stats()["rejected_streams"] == 1
+
+
+# The stream route needs no database, so this app never connects to one
+def test_stream_route_refuses_streams_over_the_limit():
+    import app.main_app as main_app
+
+    app = main_app.create_app({"TESTING": True, "TASK_STREAM_MAX": 1, "TASK_STREAM_HEARTBEAT": 0.01})
+    client = app.test_client()
+    first = client.get("/api/v1/tasks/stream", buffered=False)
+    assert first.status_code == 200
+
+    second = client.get("/api/v1/tasks/stream")
+    assert second.status_code == 503
+
+    # Closing the first stream (even before reading it) frees its place
+    first.close()
+    third = client.get("/api/v1/tasks/stream", buffered=False)
+    assert third.status_code == 200
+    third.close()
+    with app.app_context():
+        main_app.close_task_events()
+
+
+def test_taskdb_publishes_committed_changes():
+    events = EventLog()
+    taskdb = TaskDB(FakeConnection(), FakeCursor(), events=events)
+
+    taskdb.insert_task(Task("Buy milk"), commit=False)
+    assert events.last_position() == 0
+
+    taskdb.commit()
+    taskdb.update_task(7, Task("Buy oat milk"))
+    taskdb.delete_task_by_id(7)
+
+    published, _ = events.events_after(0)
+    assert [(event.kind, event.data["id"]) for event in published] == [("created", 7), ("updated", 7), ("deleted", 7)]
+    assert published[0].data["description"] == "Buy milk"
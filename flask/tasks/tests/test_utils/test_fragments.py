@@ -0,0 +1,25 @@
+import app.main_app as main_app
+from app.utils.cache import LRUCache
+from app.utils.fragments import TASK_ROW_TEMPLATE, render_task_rows
+
+
+def test_rows_are_rendered_once_per_version():
+    template = main_app.create_app({"TESTING": True}).jinja_env.get_template(TASK_ROW_TEMPLATE)
+    cache = LRUCache(max_entries=10, ttl=60)
+    tasks = [
+        {"id": 1, "description": "Get Milk", "completed": 0},
+        {"id": 2, "description": "<b>Get Eggs</b>", "completed": 0},
+    ]
+
+    rows = render_task_rows(template, tasks, cache)
+    assert 'value="1"' in rows and 'value="2"' in rows
+    # Descriptions are still escaped when the row is cached
+    assert "&lt;b&gt;Get Eggs&lt;/b&gt;" in rows
+    assert cache.stats()["misses"] == 2
+
+    # Showing the page again renders nothing, changing a task renders only its row
+    tasks[1] = dict(tasks[1], description="Get Bread")
+    rows = render_task_rows(template, tasks, cache)
+    assert "Get Bread" in rows and "Get Eggs" not in rows
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 3
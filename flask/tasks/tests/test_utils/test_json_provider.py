@@ -0,0 +1,33 @@
+import json
+from datetime import datetime
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.utils.json_provider import OrjsonProvider
+
+
+TASKS = [
+    {"id": 1, "description": "Buy milk", "creation_datetime": datetime(2022, 4, 21, 11, 10, 53), "completed": 0},
+    {"id": 2, "description": "Do laundry", "creation_datetime": datetime(2022, 4, 22, 9, 0, 0), "completed": 1},
+]
+
+
+def test_orjson_provider_matches_default_output():
+    app = Flask(__name__)
+    body = {"status": "success", "tasks": TASKS}
+
+    expected = json.loads(DefaultJSONProvider(app).dumps(body))
+    assert json.loads(OrjsonProvider(app).dumps(body)) == expected
+    assert expected["tasks"][0]["creation_datetime"] == "Thu, 21 Apr 2022 11:10:53 GMT"
+
+
+def test_orjson_provider_iso_datetimes():
+    app = Flask(__name__)
+    provider = OrjsonProvider(app, iso_datetimes=True)
+
+    with app.app_context():
+        response = provider.response({"tasks": TASKS[:1]})
+
+    assert response.mimetype == "application/json"
+    assert response.get_json()["tasks"][0]["creation_datetime"] == "2022-04-21T11:10:53"
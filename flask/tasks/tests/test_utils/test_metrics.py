@@ -0,0 +1,74 @@
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.utils.metrics import Metrics, InstrumentedConnection, TimedJSONProvider
+
+
+class FakeCursor:
+    def execute(self, operation, params=()):
+        pass
+
+    def fetchall(self):
+        return [{"id": 1}]
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, **kwargs):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+
+def test_instrumented_cursor_counts_statements():
+    metrics = Metrics()
+    conn = InstrumentedConnection(FakeConnection(), metrics)
+    cursor = conn.cursor(dictionary=True)
+
+    cursor.execute("SELECT * from tasks;")
+    assert cursor.fetchall() == [{"id": 1}]
+    cursor.execute("DELETE from tasks WHERE id=%s;", (1,))
+    cursor.close()
+
+    # Methods that are not instrumented are passed straight to the connection
+    conn.commit()
+
+    assert "tasks_sql_statements_total 2" in metrics.render()
+
+
+def test_slow_queries_are_logged(caplog):
+    metrics = Metrics(slow_query_seconds=0)
+    cursor = InstrumentedConnection(FakeConnection(), metrics).cursor()
+
+    cursor.execute("SELECT *\n    from tasks;")
+    cursor.fetchall()
+
+    assert "SELECT * from tasks;" in caplog.text
+    assert "tasks_sql_slow_statements_total 1" in metrics.render()
+
+
+def test_render_histogram_in_prometheus_format():
+    metrics = Metrics()
+    metrics.describe("request_seconds", "histogram", "Request time")
+    metrics.observe("request_seconds", 0.3, (("endpoint", "get_tasks"),), buckets=(0.1, 0.5))
+
+    text = metrics.render([("pool_in_use", "Connections in use", (), 2)])
+    assert "# TYPE request_seconds histogram" in text
+    assert 'request_seconds_bucket{endpoint="get_tasks",le="0.1"} 0' in text
+    assert 'request_seconds_bucket{endpoint="get_tasks",le="0.5"} 1' in text
+    assert 'request_seconds_bucket{endpoint="get_tasks",le="+Inf"} 1' in text
+    assert 'request_seconds_count{endpoint="get_tasks"} 1' in text
+    assert "pool_in_use 2" in text
+
+
+# Timing the JSON must not change it: compact normally, indented in debug mode
+def test_timed_json_provider_keeps_response_format():
+    app = Flask(__name__)
+    app.json = TimedJSONProvider(app, DefaultJSONProvider(app))
+    with app.app_context():
+        assert app.json.response({"id": 1, "tags": ["a"]}).get_data(as_text=True) == '{"id":1,"tags":["a"]}\n'
+        app.debug = True
+        assert app.json.response({"id": 1}).get_data(as_text=True) == '{\n  "id": 1\n}\n'
@@ -0,0 +1,67 @@
+from app.models.task import Task, TaskDB
+from app.utils.migrations import MIGRATIONS, migrate, column_type, index_exists, copy_table_online
+
+
+# Migrations and copy_table_online() change the schema, which MySQL cannot roll
+#   back, so these tests use the db_scratch_client database. The fixture set it
+#   up with every migration.
+def test_migrations_are_applied_once(db_scratch_client):
+    conn, cursor = db_scratch_client
+
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version;")
+    assert [row['version'] for row in cursor.fetchall()] == [version for version, _, _ in MIGRATIONS]
+    assert column_type(cursor, "tasks", "id") == "bigint"
+    assert index_exists(cursor, "tasks", "ix_tasks_completed_creation_datetime")
+
+    # Running the migrations again has nothing left to do
+    assert migrate(conn) == []
+
+
+# A database made by the first version of init_db: a tasks table with no
+#   FULLTEXT index, no tasks_version table and no schema_migrations table
+def test_migrate_from_baseline_schema(db_scratch_client):
+    conn, cursor = db_scratch_client
+    cursor.execute("DROP TABLE IF EXISTS tasks, tasks_version, schema_migrations;")
+    cursor.execute(
+        """
+        CREATE TABLE tasks
+        (
+            id SMALLINT UNSIGNED AUTO_INCREMENT NOT NULL,
+            description VARCHAR(50),
+            creation_datetime timestamp,
+            completed TINYINT(1),
+            CONSTRAINT pk_todo PRIMARY KEY (id)
+        );
+        """
+    )
+    cursor.execute("INSERT INTO tasks (description) VALUES ('Buy milk'), ('Walk the dog');")
+    conn.commit()
+
+    assert [version for version, _ in migrate(conn)] == [version for version, _, _ in MIGRATIONS]
+    assert column_type(cursor, "tasks", "id") == "bigint"
+    assert index_exists(cursor, "tasks", "ft_tasks_description")
+
+    # The tasks were committed before the index was built, so MATCH finds them
+    cursor.execute("SELECT description FROM tasks WHERE MATCH(description) AGAINST ('milk*' IN BOOLEAN MODE);")
+    assert [row['description'] for row in cursor.fetchall()] == ["Buy milk"]
+
+    # Leave an empty tasks table for the next test
+    cursor.execute("DELETE FROM tasks;")
+    conn.commit()
+
+
+def test_copy_table_online_keeps_rows_and_ids(db_scratch_client):
+    conn, cursor = db_scratch_client
+    taskdb = TaskDB(conn, cursor)
+    task_ids = taskdb.insert_tasks([Task(f"Copy {number}") for number in range(25)])
+    taskdb.delete_tasks(task_ids[-5:])
+
+    copy_table_online(conn, cursor, "tasks", "ENGINE=InnoDB", chunk_size=7)
+
+    cursor.execute("SELECT id, description FROM tasks ORDER BY id;")
+    rows = cursor.fetchall()
+    assert [row['id'] for row in rows] == task_ids[:20]
+    assert rows[0]['description'] == "Copy 0"
+
+    # New ids continue after the deleted ones, like before the copy
+    assert taskdb.insert_task(Task("After the copy"))['task_id'] > task_ids[-1]
@@ -0,0 +1,75 @@
+import pytest
+
+import app.main_app as main_app
+from app.utils.rate_limit import (
+    MemoryBuckets, SQLiteBuckets, RateLimiter, ConcurrencyLimiter, parse_endpoint_limits
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets()
+    return SQLiteBuckets(str(tmp_path / "buckets.sqlite3"))
+
+
+def test_token_bucket_allows_bursts_then_refills(buckets):
+    limiter = RateLimiter(buckets, rate=2, burst=3)
+
+    assert [limiter.check("10.0.0.1", "get_tasks", now=100.0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.check("10.0.0.1", "get_tasks", now=100.0) == pytest.approx(0.5)
+    # Other clients and endpoints have buckets of their own
+    assert limiter.check("10.0.0.2", "get_tasks", now=100.0) == 0
+    assert limiter.check("10.0.0.1", "add_task", now=100.0) == 0
+
+    # Two tokens a second: one more request half a second later
+    assert limiter.check("10.0.0.1", "get_tasks", now=100.5) == 0
+    assert limiter.check("10.0.0.1", "get_tasks", now=100.5) > 0
+    assert limiter.stats()["limited"] == 2
+
+
+def test_sqlite_buckets_are_shared(tmp_path):
+    path = str(tmp_path / "buckets.sqlite3")
+    first, second = SQLiteBuckets(path), SQLiteBuckets(path)
+
+    assert first.take("client", rate=1, burst=1, now=50.0) == 0
+    assert second.take("client", rate=1, burst=1, now=50.0) == pytest.approx(1.0)
+
+
+def test_endpoint_limits_and_concurrency_limiter():
+    assert parse_endpoint_limits("task_api_blueprint.add_task=5/10, index=0.5") == {
+        "task_api_blueprint.add_task": (5.0, 10.0), "index": (0.5, 1.0)
+    }
+
+    limiter = ConcurrencyLimiter(1, timeout=0)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    limiter.release()
+    assert limiter.acquire()
+    assert limiter.stats() == {"max_concurrent": 1, "in_flight": 1, "admitted": 2, "rejected": 1}
+
+
+# Both checks answer before the request borrows a connection, so no database is needed
+def test_requests_are_refused_with_retry_after():
+    app = main_app.create_app({
+        "TESTING": True,
+        "RATE_LIMIT_ENDPOINTS": {"task_api_blueprint.get_tasks": (1, 1)},
+        "DB_MAX_CONCURRENCY": 1,
+        "DB_ADMISSION_TIMEOUT": 0,
+    })
+    client = app.test_client()
+
+    with app.app_context():
+        main_app.get_rate_limiter().check("127.0.0.1", "task_api_blueprint.get_tasks")
+        response = client.get("/api/v1/tasks/")
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+        concurrency_limiter = main_app.get_concurrency_limiter()
+        concurrency_limiter.acquire()
+        response = client.get("/api/v1/tasks/1/", environ_base={"REMOTE_ADDR": "10.0.0.3"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        concurrency_limiter.release()
+
+        assert client.get("/stats/admission").json["admission"]["rejected"] == 1
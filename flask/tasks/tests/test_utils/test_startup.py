@@ -0,0 +1,17 @@
+from app.utils.startup import parse_importtime
+
+
+def test_parse_importtime():
+    report = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     mysql.connector.errors",
+        "import time:       348 |        468 |   utils.db",
+        "import time:      1800 |       2268 | main_app",
+    ])
+
+    imports = parse_importtime(report)
+    assert [(item.module, item.depth) for item in imports] == [
+        ("mysql.connector.errors", 3), ("utils.db", 2), ("main_app", 1)
+    ]
+    assert imports[-1].self_us == 1800
+    assert imports[-1].cumulative_us == 2268
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import pytest
+
+from app.utils.transfer import READERS, WRITERS, file_format_for, load_data_value
+
+ROWS = [
+    (1, "Get Milk", datetime(2022, 4, 21, 11, 10, 53), 0),
+    (2, "Tab\tand \"quotes\", commas\nand lines", datetime(2022, 4, 21, 11, 10, 57), 1),
+    (3, "Get Bread", datetime(2022, 4, 21, 11, 11, 4), 0),
+]
+
+
+@pytest.mark.parametrize("file_format", ["ndjson", "csv", "parquet"])
+def test_files_round_trip_in_batches(tmp_path, file_format):
+    if file_format == "parquet":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"tasks.{file_format}")
+
+    assert WRITERS[file_format](path, [ROWS[:2], ROWS[2:]]) == 3
+    batches = list(READERS[file_format](path, 2, datetime.now()))
+    assert [len(rows) for rows in batches] == [2, 1]
+    assert [row for rows in batches for row in rows] == ROWS
+
+
+def test_file_format_and_load_data_escaping():
+    assert file_format_for("backup/tasks.JSONL") == "ndjson"
+    assert file_format_for("tasks.txt", "csv") == "csv"
+    with pytest.raises(ValueError):
+        file_format_for("tasks.txt")
+
+    assert load_data_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+    assert load_data_value(None) == "\\N"
@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+
+from app.models.task import Task
+from app.utils.write_behind import (
+    WriteBehindQueue, QueueClosedError, QueueFullError, WriteFailedError, WriteTimeoutError
+)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.saved = {}
+        self.batches = 0
+        self.next_id = 1
+        self.fail = False
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def write_batch(self, tasks, task_ids):
+        self.unblocked.wait()
+        if self.fail:
+            raise RuntimeError("database is down")
+        self.saved.update(zip(task_ids, (task.description for task in tasks)))
+        self.batches += 1
+
+    def reserve_ids(self, count):
+        ids = range(self.next_id, self.next_id + count)
+        self.next_id += count
+        return ids
+
+
+def test_write_behind_saves_tasks_in_batches():
+    database = FakeDatabase()
+    database.unblocked.clear()
+    write_behind = WriteBehindQueue(database.write_batch, database.reserve_ids, id_block_size=2)
+
+    task_ids = [write_behind.submit(Task(f"Task {number}")) for number in range(5)]
+    assert task_ids == [1, 2, 3, 4, 5]
+
+    database.unblocked.set()
+    write_behind.close()
+    assert database.saved == {task_id: f"Task {task_id - 1}" for task_id in task_ids}
+    assert database.batches < 5
+
+
+def test_write_behind_backpressure_and_durable_failure():
+    database = FakeDatabase()
+    database.unblocked.clear()
+    write_behind = WriteBehindQueue(database.write_batch, database.reserve_ids, max_size=2,
+                                    batch_size=1, flush_interval=0, retries=0)
+
+    # The worker holds one task while the queue fills up with two more
+    write_behind.submit(Task("first"))
+    while write_behind.stats()["queued"]:
+        pass
+    write_behind.submit(Task("second"))
+    write_behind.submit(Task("third"))
+    with pytest.raises(QueueFullError):
+        write_behind.submit(Task("rejected"))
+
+    database.fail = True
+    database.unblocked.set()
+    while write_behind.stats()["queued"]:
+        pass
+    with pytest.raises(WriteFailedError):
+        write_behind.submit(Task("durable"), wait=True)
+
+    write_behind.close()
+    assert write_behind.stats()["rejected"] == 1
+
+
+def test_write_behind_durable_timeout_and_failed_reservation():
+    database = FakeDatabase()
+    database.unblocked.clear()
+    write_behind = WriteBehindQueue(database.write_batch, database.reserve_ids, flush_interval=0)
+
+    # The task stays queued and is saved once the database catches up
+    with pytest.raises(WriteTimeoutError):
+        write_behind.submit(Task("slow"), wait=True, timeout=0.01)
+    database.unblocked.set()
+    write_behind.close()
+    assert list(database.saved.values()) == ["slow"]
+
+    def no_ids(count):
+        raise RuntimeError("no connection available")
+
+    write_behind = WriteBehindQueue(database.write_batch, no_ids)
+    with pytest.raises(WriteFailedError):
+        write_behind.submit(Task("no id"))
+    write_behind.close()
+
+
+# Every task submit() accepted is saved, even when close() is called while
+#   other threads are still submitting; the rest are refused with QueueClosedError
+def test_write_behind_close_while_submitting():
+    database = FakeDatabase()
+    write_behind = WriteBehindQueue(database.write_batch, database.reserve_ids, flush_interval=0)
+    accepted = []
+
+    def submit_many():
+        for number in range(200):
+            try:
+                accepted.append(write_behind.submit(Task(f"Task {number}")))
+            except QueueClosedError:
+                return
+
+    threads = [threading.Thread(target=submit_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    write_behind.close()
+    for thread in threads:
+        thread.join()
+
+    assert set(accepted) <= set(database.saved)
+    with pytest.raises(QueueClosedError):
+        write_behind.submit(Task("too late"))
+    assert write_behind.stats()["flushed"] == len(database.saved)
+
+
+# A write-behind POST does not borrow a connection or an admission slot, and
+#   errors from the queue are answered with a 503 instead of a 500
+def test_write_behind_post_without_request_connection(monkeypatch):
+    import app.main_app as main_app
+
+    def no_ids(app, count):
+        raise RuntimeError("no connection available")
+
+    monkeypatch.setattr(main_app, "reserve_task_ids", no_ids)
+    app = main_app.create_app({"TESTING": True, "WRITE_BEHIND": True, "DB_MAX_CONCURRENCY": 1,
+                               "DB_ADMISSION_TIMEOUT": 0})
+    with app.app_context():
+        main_app.get_concurrency_limiter().acquire()
+        response = app.test_client().post("/api/v1/tasks/", json={"description": "queued"})
+        main_app.close_write_behind()
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert "db_pool" not in app.extensions
+
+    # A POST while the queue is shutting down is asked to try again too
+    monkeypatch.undo()
+    app = main_app.create_app({"TESTING": True, "WRITE_BEHIND": True})
+    with app.app_context():
+        main_app.get_write_behind().close()
+        response = app.test_client().post("/api/v1/tasks/", json={"description": "closing"})
+        main_app.close_write_behind()
+
+    assert response.status_code == 503